@@ -0,0 +1,344 @@
+"""HTTP API for tailoring from scripts and other tools.
+
+Usage:
+    python api.py [--host 127.0.0.1] [--port 8080]
+
+Endpoints take and return JSON:
+    POST /skills   {"job_ad"}                            -> {"skills": [...]}
+    POST /cv       {"job_ad", "stream"?}                 -> the tailored CV
+    POST /letters  {"job_ad", "variants"?, "stream"?}    -> {"letters": [...]}
+    POST /tailor   {"job_ad", "variants"?}               -> streamed skills, CV and letters
+    POST /render   {"kind": "cv"|"letter", "data", "format": "docx"|"pdf"} -> the document
+    POST /bundle   {"cv", "letters"}                     -> ZIP of every document in both formats
+    GET  /health, GET /metrics (Prometheus)
+
+Streamed responses are newline-delimited JSON (application/x-ndjson), one
+event per line, written as soon as it is generated; a failure mid-stream
+ends with an ``{"event": "error"}`` line. One worker serves many requests
+at once on a single event loop with the same processors and OpenAI client
+as the app. Requests with an ``X-Client-Id`` header are scheduled fairly
+against other clients, like browser sessions in the app. With
+``API_TOKEN`` set, every request except /health must send
+``Authorization: Bearer <token>``.
+"""
+import os
+import sys
+import hmac
+import json
+import time
+import asyncio
+import argparse
+from typing import AsyncIterator, Dict, Optional
+from aiohttp import web
+from dotenv import load_dotenv
+
+from src import resources
+from src.cv_processor import CVProcessor
+from src.letter_generator import LetterGenerator
+from src.document_maker import DocumentMaker
+from src.utils.secure_openai import SecureOpenAIClient
+from src.utils.metrics import metrics
+from src.utils.rate_limiter import request_session
+from src.utils.bundle import BUNDLE_NAME, document_files, iter_bundle
+from src.utils.job_ad import compact_job_ad
+
+CONTENT_TYPES = {
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'pdf': 'application/pdf',
+}
+
+
+def _error(response_class, message: str) -> web.HTTPException:
+    return response_class(text=json.dumps({'error': message}), content_type='application/json')
+
+
+def _ndjson(event: Dict) -> bytes:
+    return json.dumps(event).encode('utf-8') + b'\n'
+
+
+def render_data(kind: str, data) -> Dict:
+    """Copy only the fields the renderers use from client data for a 'cv' or 'letter'.
+
+    Raises ValueError for anything else, so no client-supplied field ever
+    reaches a renderer unchecked. The CV's 'analysis', as returned by /cv,
+    is accepted and left out.
+    """
+    allowed = {'cv': {'content', 'sections', 'analysis'}, 'letter': {'content', 'version', 'focus'}}[kind]
+    if not isinstance(data, dict) or not isinstance(data.get('content'), str):
+        raise ValueError(f"A {kind} must be an object with a 'content' string")
+    unknown = sorted(set(data) - allowed)
+    if unknown:
+        raise ValueError(f"Unsupported {kind} fields: {', '.join(unknown)}")
+
+    clean = {'content': data['content']}
+    if kind == 'cv' and 'sections' in data:
+        sections = data['sections']
+        if not isinstance(sections, list) or not all(
+            isinstance(section, dict) and set(section) == {'title', 'content'}
+            and isinstance(section['title'], str) and isinstance(section['content'], str)
+            for section in sections
+        ):
+            raise ValueError("'sections' must be a list of objects with only 'title' and 'content' strings")
+        clean['sections'] = [{'title': section['title'], 'content': section['content']} for section in sections]
+    if kind == 'letter':
+        if 'version' in data:
+            if not isinstance(data['version'], int) or isinstance(data['version'], bool):
+                raise ValueError("A letter's 'version' must be an integer")
+            clean['version'] = data['version']
+        if 'focus' in data:
+            if not isinstance(data['focus'], str):
+                raise ValueError("A letter's 'focus' must be a string")
+            clean['focus'] = data['focus']
+    return clean
+
+
+def cv_json(cv_result: Dict) -> Dict:
+    """The tailored CV without its pre-rendered files, which are not JSON."""
+    return {key: value for key, value in cv_result.items() if key != 'formats'}
+
+
+async def merge(*sources: AsyncIterator[Dict]) -> AsyncIterator[Dict]:
+    """Interleave events from several async generators as they arrive.
+
+    The first error from any source is raised and the others are cancelled.
+    """
+    queue = asyncio.Queue()
+    done = object()
+
+    async def pump(source: AsyncIterator[Dict]):
+        try:
+            async for event in source:
+                await queue.put(event)
+        except Exception as e:
+            await queue.put(e)
+        finally:
+            await queue.put(done)
+
+    tasks = [asyncio.ensure_future(pump(source)) for source in sources]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            event = await queue.get()
+            if event is done:
+                remaining -= 1
+                continue
+            if isinstance(event, Exception):
+                raise event
+            yield event
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def stream_events(request: web.Request, events: AsyncIterator[Dict]) -> web.StreamResponse:
+    """Write ``events`` to the client as NDJSON while they are generated."""
+    response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+    await response.prepare(request)
+    try:
+        async for event in events:
+            await response.write(_ndjson(event))
+    except ConnectionResetError:
+        # The client went away; closing the events stops their API calls
+        metrics.increment('api_disconnects_total', endpoint=request.path)
+        return response
+    except Exception as e:
+        print(f"Error streaming {request.path}: {str(e)}")
+        await response.write(_ndjson({'event': 'error', 'error': str(e)}))
+    finally:
+        await events.aclose()
+    await response.write_eof()
+    return response
+
+
+def create_app(
+    ai_client: Optional[SecureOpenAIClient] = None,
+    doc_maker: Optional[DocumentMaker] = None,
+    api_token: Optional[str] = None
+) -> web.Application:
+    """Build the API application.
+
+    By default it serves the process-wide processors from ``src.resources``.
+    Pass ``ai_client`` (e.g. one on a ``MockOpenAI`` transport) to build
+    processors around that client instead.
+    """
+    if ai_client is None:
+        cv_processor = resources.get_cv_processor()
+        letter_generator = resources.get_letter_generator()
+    else:
+        cv_processor = CVProcessor(ai_client=ai_client)
+        letter_generator = LetterGenerator(ai_client=ai_client)
+    doc_maker = doc_maker or resources.get_document_maker()
+    api_token = os.getenv('API_TOKEN', '') if api_token is None else api_token
+    max_variants = int(os.getenv('MAX_COVER_LETTERS', '3'))
+    expected_auth = f"Bearer {api_token}".encode('utf-8')
+
+    @web.middleware
+    async def middleware(request: web.Request, handler):
+        start = time.perf_counter()
+        status = 500
+        try:
+            if api_token and request.path != '/health':
+                supplied = request.headers.get('Authorization', '').encode('utf-8')
+                if not hmac.compare_digest(supplied, expected_auth):
+                    raise _error(web.HTTPUnauthorized, "Missing or invalid API token")
+            with request_session(request.headers.get('X-Client-Id')):
+                response = await handler(request)
+            status = response.status
+            return response
+        except web.HTTPException as e:
+            status = e.status
+            raise
+        except Exception as e:
+            print(f"Error handling {request.path}: {str(e)}")
+            return web.json_response({'error': str(e)}, status=500)
+        finally:
+            metrics.observe('api_request_seconds', time.perf_counter() - start,
+                            endpoint=request.path, status=str(status))
+
+    async def read_body(request: web.Request) -> Dict:
+        try:
+            body = await request.json()
+        except ValueError:
+            raise _error(web.HTTPBadRequest, "Request body must be JSON")
+        if not isinstance(body, dict):
+            raise _error(web.HTTPBadRequest, "Request body must be a JSON object")
+        return body
+
+    async def read_job(request: web.Request):
+        """The body, its job ad and the number of letter variants."""
+        body = await read_body(request)
+        job_ad = body.get('job_ad')
+        if not isinstance(job_ad, str) or not job_ad.strip():
+            raise _error(web.HTTPBadRequest, "'job_ad' must be a non-empty string")
+        variants = body.get('variants', max_variants)
+        if not isinstance(variants, int) or isinstance(variants, bool) or not 1 <= variants <= max_variants:
+            raise _error(web.HTTPBadRequest, f"'variants' must be an integer from 1 to {max_variants}")
+        return body, job_ad, variants
+
+    async def skill_events(job_ad: str) -> AsyncIterator[Dict]:
+        yield {'event': 'skills', 'value': await cv_processor.extract_skills(job_ad)}
+
+    async def cv_events(job_ad: str) -> AsyncIterator[Dict]:
+        async for kind, field, value in cv_processor.tailor_cv_fields(job_ad):
+            if kind == 'result':
+                yield {'event': 'cv', 'value': cv_json(value)}
+            else:
+                yield {'event': kind, 'field': field, 'value': value}
+
+    async def letter_events(job_ad: str, variants: int) -> AsyncIterator[Dict]:
+        async for kind, version, value in letter_generator.generate_letters_stream(job_ad, variants):
+            if kind == 'delta':
+                yield {'event': 'delta', 'version': version, 'text': value}
+            elif kind == 'dropped':
+                yield {'event': 'dropped', 'version': version}
+            else:
+                yield {'event': 'letters', 'value': value}
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response({'status': 'ok'})
+
+    async def metrics_endpoint(request: web.Request) -> web.Response:
+        return web.Response(text=metrics.to_prometheus(), content_type='text/plain')
+
+    async def skills(request: web.Request) -> web.Response:
+        _, job_ad, _ = await read_job(request)
+        return web.json_response({'skills': await cv_processor.extract_skills(job_ad)})
+
+    async def cv(request: web.Request) -> web.StreamResponse:
+        body, job_ad, _ = await read_job(request)
+        if body.get('stream'):
+            return await stream_events(request, cv_events(job_ad))
+        return web.json_response(cv_json(await cv_processor.tailor_cv(job_ad)))
+
+    async def letters(request: web.Request) -> web.StreamResponse:
+        body, job_ad, variants = await read_job(request)
+        if body.get('stream'):
+            return await stream_events(request, letter_events(job_ad, variants))
+        return web.json_response({'letters': await letter_generator.generate_letters(job_ad, variants)})
+
+    async def tailor(request: web.Request) -> web.StreamResponse:
+        """Skills, CV and letters generated concurrently, streamed as one response."""
+        _, job_ad, variants = await read_job(request)
+        start = time.perf_counter()
+
+        async def events() -> AsyncIterator[Dict]:
+            if cv_processor.compact_job_ads:
+                report = compact_job_ad(job_ad, cv_processor.job_ad_max_tokens, record=False)
+                yield {'event': 'job_ad', **{key: value for key, value in report.items() if key != 'text'}}
+            async for event in merge(skill_events(job_ad), cv_events(job_ad), letter_events(job_ad, variants)):
+                yield event
+            yield {'event': 'done', 'elapsed': round(time.perf_counter() - start, 3)}
+
+        return await stream_events(request, events())
+
+    async def render(request: web.Request) -> web.Response:
+        body = await read_body(request)
+        kind, data, fmt = body.get('kind'), body.get('data'), body.get('format', 'pdf')
+        if kind not in ('cv', 'letter') or fmt not in CONTENT_TYPES:
+            raise _error(web.HTTPBadRequest, "'kind' must be 'cv' or 'letter' and 'format' 'docx' or 'pdf'")
+        try:
+            data = render_data(kind, data)
+        except ValueError as e:
+            raise _error(web.HTTPBadRequest, str(e))
+        # Rendering is CPU-bound; keep it off the event loop
+        document = await asyncio.to_thread(doc_maker.render, kind, data, fmt)
+        return web.Response(
+            body=document,
+            content_type=CONTENT_TYPES[fmt],
+            headers={'Content-Disposition': f'attachment; filename="{kind}.{fmt}"'}
+        )
+
+    async def bundle(request: web.Request) -> web.StreamResponse:
+        """Render the CV and letters and stream them as one ZIP."""
+        body = await read_body(request)
+        cv_data, letters = body.get('cv'), body.get('letters')
+        if not isinstance(letters, list):
+            raise _error(web.HTTPBadRequest, "'letters' must be a list")
+        try:
+            cv_data = render_data('cv', cv_data)
+            letters = [render_data('letter', letter) for letter in letters]
+        except ValueError as e:
+            raise _error(web.HTTPBadRequest, str(e))
+        rendered = await asyncio.to_thread(doc_maker.create_documents, cv_data, letters)
+        response = web.StreamResponse(headers={
+            'Content-Type': 'application/zip',
+            'Content-Disposition': f'attachment; filename="{BUNDLE_NAME}"',
+        })
+        await response.prepare(request)
+        for chunk in iter_bundle(document_files(rendered)):
+            await response.write(chunk)
+        await response.write_eof()
+        return response
+
+    app = web.Application(middlewares=[middleware])
+    app.router.add_get('/health', health)
+    app.router.add_get('/metrics', metrics_endpoint)
+    app.router.add_post('/skills', skills)
+    app.router.add_post('/cv', cv)
+    app.router.add_post('/letters', letters)
+    app.router.add_post('/tailor', tailor)
+    app.router.add_post('/render', render)
+    app.router.add_post('/bundle', bundle)
+
+    async def close_client(app: web.Application):
+        await cv_processor.ai_client.aclose()
+
+    app.on_cleanup.append(close_client)
+    return app
+
+
+def main(argv=None) -> int:
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Serve CV tailoring over HTTP.")
+    parser.add_argument('--host', default=os.getenv('API_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('API_PORT', '8080')))
+    args = parser.parse_args(argv)
+
+    print(f"CV Tailor API on http://{args.host}:{args.port}")
+    web.run_app(create_app(), host=args.host, port=args.port, print=None)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,21 @@
+import io
+import time
+import html
+import uuid
+import hashlib
 import streamlit as st
 import os
 import asyncio
 from dotenv import load_dotenv
-from src.cv_processor import CVProcessor
-from src.letter_generator import LetterGenerator
-from src.document_maker import DocumentMaker
+from src import resources
+from src.utils.metrics import metrics
+from src.utils.background import DONE, FAILED
+from src.utils.bundle import BUNDLE_NAME, document_files, write_bundle
+from src.utils.job_ad import compact_job_ad
+from src.cv_processor import TAILORED_CV_SCHEMA
+
+# Start of this script run, for the rerun overhead metric
+rerun_start = time.perf_counter()
 
 # Load environment variables
 load_dotenv()
@@ -87,11 +98,252 @@ if 'job_ad' not in st.session_state:
     st.session_state.job_ad = None
 if 'skills' not in st.session_state:
     st.session_state.skills = None
+if 'documents' not in st.session_state:
+    st.session_state.documents = None
+if 'bundle' not in st.session_state:
+    st.session_state.bundle = None
+if 'duplicate' not in st.session_state:
+    st.session_state.duplicate = None
+if 'jobs' not in st.session_state:
+    # Background job IDs of this session, mapped to their kind
+    st.session_state.jobs = {}
+if 'job_notices' not in st.session_state:
+    st.session_state.job_notices = []
+if 'session_key' not in st.session_state:
+    # Identifies this browser session to the shared scheduler and job queue
+    st.session_state.session_key = uuid.uuid4().hex
+
+# Shared processors, built once per process rather than on every rerun
+cv_processor = resources.get_cv_processor()
+letter_generator = resources.get_letter_generator()
+doc_maker = resources.get_document_maker()
+job_index = resources.get_job_index()
+job_runner = resources.get_job_runner()
+
+# Long-running tasks run as background jobs so the page stays responsive
+JOB_LABELS = {
+    'generate': "Generating documents",
+    'adapt': "Adapting cover letters",
+    'regenerate_cv': "Regenerating CV",
+    'regenerate_letters': "Regenerating cover letters",
+}
+
+def update_documents():
+    """Re-render the documents after an edit; unchanged ones are reused."""
+    st.session_state.documents = doc_maker.create_documents(
+        st.session_state.generated_cv,
+        st.session_state.cover_letters,
+        previous=st.session_state.documents
+    )
+    return st.session_state.documents
+
+def index_job(job_ad: str):
+    """Record the current results so reposts of this job ad can reuse them."""
+    if job_index is None:
+        return
+    # The placeholder 'formats' documents are bytes and not needed for reuse
+    cv = {key: value for key, value in st.session_state.generated_cv.items() if key != 'formats'}
+    job_index.add(job_ad, {
+        'skills': st.session_state.skills,
+        'generated_cv': cv,
+        'cover_letters': st.session_state.cover_letters
+    })
+
+def start_job(kind: str, make_coroutine, key: str = None):
+    """Run ``make_coroutine(progress)`` in the background and rerun to show its progress.
+    
+    A job with the same key that is still running is reused; one of the same
+    kind with another key is cancelled, so repeated clicks never pile up.
+    """
+    for job_id, job_kind in list(st.session_state.jobs.items()):
+        job = job_runner.get(job_id)
+        if job_kind == kind and job is not None and job.active and (key is None or job.key != key):
+            job.cancel()
+    job = job_runner.submit(kind, make_coroutine, key=key, session=st.session_state.session_key)
+    st.session_state.jobs[job.id] = kind
+    st.rerun()
+
+def apply_job_result(kind: str, result: dict):
+    """Store the results of a finished job in the session."""
+    for name in ('job_ad', 'skills', 'generated_cv', 'cover_letters', 'documents'):
+        if name in result:
+            st.session_state[name] = result[name]
+    if 'cover_letters' in result:
+        # Drop edited text so the editor shows the new letters
+        for i in range(1, len(result['cover_letters']) + 1):
+            st.session_state.pop(f"letter_{i}", None)
+    if kind in ('generate', 'adapt'):
+        index_job(st.session_state.job_ad)
+
+def load_previous_results(job_ad: str, results: dict):
+    """Take over the results of a near-duplicate job ad as they are."""
+    cv = dict(results['generated_cv'])
+    apply_job_result('reuse', {
+        'job_ad': job_ad,
+        'skills': results['skills'],
+        'generated_cv': cv,
+        'cover_letters': results['cover_letters'],
+        'documents': doc_maker.create_documents(cv, results['cover_letters'])
+    })
+    metrics.increment('job_duplicates_total', action='reuse')
+
+async def adapt_previous_results(job_ad: str, results: dict, progress):
+    """Adapt the cover letters of a near-duplicate job ad to this one (background job)."""
+    progress.stage('letters', 0.0, "Adapting the cover letters...")
+    skills, letters = await asyncio.gather(
+        cv_processor.extract_skills(job_ad),
+        letter_generator.adapt_letters(job_ad, results['cover_letters'])
+    )
+    progress.stage('letters', 1.0, "Rendering documents...")
+    cv = dict(results['generated_cv'])
+    documents = await asyncio.to_thread(doc_maker.create_documents, cv, letters)
+    metrics.increment('job_duplicates_total', action='adapt')
+    return {'job_ad': job_ad, 'skills': skills, 'generated_cv': cv, 'cover_letters': letters, 'documents': documents}
 
-# Initialize processors
-cv_processor = CVProcessor()
-letter_generator = LetterGenerator()
-doc_maker = DocumentMaker()
+def show_skills(placeholder, skills):
+    """Render skills as tags into a placeholder"""
+    skills_html = "".join([f"<span class='skill-tag'>{skill}</span>" for skill in skills])
+    placeholder.markdown(f"<div style='line-height: 3;'>{skills_html}</div>", unsafe_allow_html=True)
+
+def show_job_progress(job_id: str, kind: str, job):
+    """Progress bar, streamed drafts and a cancel button for a running job"""
+    snapshot = job.progress.snapshot()
+    position = job_runner.position(job_id)
+    if position is not None:
+        # Under load jobs wait their turn rather than failing
+        st.progress(0.0, text=f"{JOB_LABELS.get(kind, kind)}: waiting, position {position} in the queue")
+    else:
+        st.progress(job.progress.fraction, text=snapshot['message'] or JOB_LABELS.get(kind, kind))
+    
+    partial = snapshot['partial']
+    if partial.get('skills'):
+        show_skills(st.empty(), partial['skills'])
+    if partial.get('keywords') or partial.get('sections'):
+        with st.expander("Tailored CV (draft)", expanded=False):
+            if partial.get('keywords'):
+                st.markdown("**Keywords:** " + ", ".join(partial['keywords']))
+            st.markdown("\n\n".join(f"**{s['title']}**\n\n{s['content']}" for s in partial.get('sections', [])))
+    letters = partial.get('letters')
+    if letters:
+        for column, version in zip(st.columns(len(letters)), sorted(letters)):
+            with column:
+                st.markdown(f"**Cover Letter {version} (draft)**")
+                st.markdown(letters[version])
+    
+    if st.button("Cancel", key=f"cancel_{job_id}"):
+        job.cancel()
+
+def show_jobs():
+    """Notices of finished jobs, and the progress of running ones (polled every second)"""
+    for level, text in st.session_state.job_notices:
+        getattr(st, level)(text)
+    st.session_state.job_notices = []
+    
+    active = any(
+        job is not None and job.active
+        for job in (job_runner.get(job_id) for job_id in st.session_state.jobs)
+    )
+    
+    @st.fragment(run_every=1.0 if active else None)
+    def job_panel():
+        finished = False
+        for job_id, kind in list(st.session_state.jobs.items()):
+            job = job_runner.get(job_id)
+            if job is not None and job.active:
+                show_job_progress(job_id, kind, job)
+                continue
+            
+            del st.session_state.jobs[job_id]
+            finished = True
+            label = JOB_LABELS.get(kind, kind)
+            if job is None:
+                continue
+            if job.status == DONE:
+                apply_job_result(kind, job.result)
+                st.session_state.job_notices.append(('success', f"{label}: done."))
+            elif job.status == FAILED:
+                st.session_state.job_notices.append(('error', f"{label} failed: {job.error}"))
+            else:
+                st.session_state.job_notices.append(('info', f"{label}: cancelled."))
+        
+        if finished:
+            # Show the results in the rest of the page
+            st.rerun()
+    
+    job_panel()
+
+def get_bundle(documents: dict) -> bytes:
+    """ZIP of all documents, built once per set of rendered files"""
+    keys = tuple(documents['keys'])
+    cached = st.session_state.bundle
+    if cached is None or cached[0] != keys:
+        bundle = io.BytesIO()
+        write_bundle(bundle, document_files(documents))
+        cached = (keys, bundle.getvalue())
+        st.session_state.bundle = cached
+    return cached[1]
+
+def show_downloads(documents: dict):
+    """Download buttons for the rendered CV and cover letters"""
+    # Create download buttons for documents with better organization
+    st.markdown("<div class='section-header'>Generated Documents</div>", unsafe_allow_html=True)
+    
+    # One archive with every document; the separate files are only sent
+    # to the page when asked for
+    st.download_button(
+        "Download All Documents (ZIP)",
+        get_bundle(documents),
+        BUNDLE_NAME,
+        "application/zip",
+        width='stretch'
+    )
+    if not st.checkbox("Download files separately"):
+        return
+    
+    # CV downloads with icons and better styling
+    st.markdown("#### Your Tailored CV")
+    cv_docx, cv_pdf = documents['cv']
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            "Download CV (DOCX)",
+            cv_docx,
+            "tailored_cv.docx",
+            "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+            width='stretch'
+        )
+    with col2:
+        st.download_button(
+            "Download CV (PDF)",
+            cv_pdf,
+            "tailored_cv.pdf",
+            "application/pdf",
+            width='stretch'
+        )
+    
+    # Cover letter downloads with better organization
+    st.markdown("#### Your Cover Letters")
+    st.markdown("Each version has a different approach while maintaining your personal style.")
+    
+    for i, (docx, pdf) in enumerate(documents['letters'], 1):
+        st.markdown(f"**Version {i}**")
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button(
+                f"Download Letter {i} (DOCX)",
+                docx,
+                f"cover_letter_{i}.docx",
+                "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                width='stretch'
+            )
+        with col2:
+            st.download_button(
+                f"Download Letter {i} (PDF)",
+                pdf,
+                f"cover_letter_{i}.pdf",
+                "application/pdf",
+                width='stretch'
+            )
 
 def view_and_edit_documents():
     if not st.session_state.generated_cv or not st.session_state.cover_letters:
@@ -126,8 +378,10 @@ def view_and_edit_documents():
         if st.button("Update CV"):
             with st.spinner("Updating CV..."):
                 # Update CV with edited content
+                titles = [section['title'] for section in st.session_state.generated_cv.get('sections', [])]
                 st.session_state.generated_cv['content'] = edited_cv
-                cv_docx, cv_pdf = doc_maker.create_cv_documents(st.session_state.generated_cv)
+                st.session_state.generated_cv['sections'] = cv_processor.text_to_sections(edited_cv, titles or None)
+                cv_docx, cv_pdf = update_documents()['cv']
                 st.success("CV updated successfully!")
                 
                 # Show download buttons for updated CV
@@ -147,12 +401,44 @@ def view_and_edit_documents():
                         "application/pdf"
                     )
     
+    # Rewrite a single section instead of the whole CV
+    sections = st.session_state.generated_cv.get('sections') or []
+    if sections:
+        with st.expander("Regenerate one section"):
+            section_index = st.selectbox(
+                "Section",
+                range(len(sections)),
+                format_func=lambda i: sections[i]['title'] or f"Section {i + 1}"
+            )
+            section_instructions = st.text_input(
+                "Instructions (optional)",
+                key="section_instructions",
+                placeholder="e.g. emphasise the pipeline migration, shorten to three bullets"
+            )
+            if st.button("Regenerate Section"):
+                # Imported here: openai is loaded lazily with the first API call
+                from openai import OpenAIError
+                with st.spinner("Rewriting the section..."):
+                    try:
+                        st.session_state.generated_cv = job_runner.run_now(cv_processor.regenerate_section(
+                            st.session_state.job_ad,
+                            st.session_state.generated_cv,
+                            section_index,
+                            section_instructions
+                        ), session=st.session_state.session_key)
+                        update_documents()
+                    except (ValueError, RuntimeError, OpenAIError) as e:
+                        st.error(f"Error regenerating the section: {str(e)}")
+                    else:
+                        st.rerun()
+    
     # Cover Letters Review with better organization
     st.markdown("### Cover Letters")
     st.markdown("Each version takes a different approach while maintaining your personal style. Edit any version below.")
     
     for i, letter in enumerate(st.session_state.cover_letters, 1):
-        with st.expander(f"Cover Letter {i}", expanded=True):
+        title = f"Cover Letter {i}" + (f" ({letter['focus']})" if letter.get('focus') else "")
+        with st.expander(title, expanded=True):
             st.markdown(f"""
                 **Version {i}** - Edit this cover letter to perfect its content.
                 Any changes will be reflected in both DOCX and PDF versions.
@@ -164,13 +450,35 @@ def view_and_edit_documents():
                 key=f"letter_{i}",
                 help=f"Make any necessary adjustments to cover letter {i} here."
             )
+            letter_instructions = st.text_input(
+                "Instructions for a new version (optional)",
+                key=f"letter_instructions_{i}",
+                placeholder="e.g. more concise, mention remote work"
+            )
+            if st.button(f"Regenerate Cover Letter {i}"):
+                from openai import OpenAIError
+                with st.spinner(f"Creating a new version of cover letter {i}..."):
+                    try:
+                        st.session_state.cover_letters[i - 1] = job_runner.run_now(letter_generator.regenerate_letter(
+                            st.session_state.job_ad,
+                            letter,
+                            len(st.session_state.cover_letters),
+                            letter_instructions
+                        ), session=st.session_state.session_key)
+                        update_documents()
+                        # Drop the edited text so the editor shows the new version
+                        st.session_state.pop(f"letter_{i}", None)
+                    except (RuntimeError, OpenAIError) as e:
+                        st.error(f"Error regenerating cover letter {i}: {str(e)}")
+                    else:
+                        st.rerun()
         
         if edited_letter != letter['content']:
             if st.button(f"Update Cover Letter {i}"):
                 with st.spinner(f"Updating Cover Letter {i}..."):
                     # Update letter with edited content
                     letter['content'] = edited_letter
-                    docx, pdf = doc_maker.create_letter_documents([letter])[0]
+                    docx, pdf = update_documents()['letters'][i - 1]
                     st.success(f"Cover Letter {i} updated successfully!")
                     
                     # Show download buttons for updated letter
@@ -199,31 +507,33 @@ def view_and_edit_documents():
     col1, col2 = st.columns(2)
     with col1:
         if st.button("Regenerate CV", help="Generate a new version of your CV using the same job posting"):
-            with st.spinner("Creating a new version of your CV..."):
-                st.session_state.generated_cv = asyncio.run(
-                    cv_processor.tailor_cv(st.session_state.job_ad)
-                )
-                st.markdown("""
-                    <div class='success-message'>
-                        <h4>CV Regenerated!</h4>
-                        <p>A new version of your CV has been created. Check the content above.</p>
-                    </div>
-                """, unsafe_allow_html=True)
-                st.experimental_rerun()
+            job_ad = st.session_state.job_ad
+            letters = st.session_state.cover_letters
+            previous = st.session_state.documents
+            
+            async def regenerate_cv(progress):
+                progress.stage('cv', 0.0, "Creating a new version of your CV...")
+                cv = await cv_processor.tailor_cv(job_ad, use_cache=False)
+                progress.stage('cv', 1.0, "Rendering the CV...")
+                documents = await asyncio.to_thread(doc_maker.create_documents, cv, letters, previous)
+                return {'generated_cv': cv, 'documents': documents}
+            
+            start_job('regenerate_cv', regenerate_cv)
     
     with col2:
         if st.button("Regenerate Cover Letters", help="Generate new versions of all cover letters"):
-            with st.spinner("✨ Creating new versions of your cover letters..."):
-                st.session_state.cover_letters = asyncio.run(
-                    letter_generator.generate_letters(st.session_state.job_ad, 3)
-                )
-                st.markdown("""
-                    <div class='success-message'>
-                        <h4>✨ Cover Letters Regenerated!</h4>
-                        <p>New versions of your cover letters have been created. Check the content above.</p>
-                    </div>
-                """, unsafe_allow_html=True)
-                st.experimental_rerun()
+            job_ad = st.session_state.job_ad
+            cv = st.session_state.generated_cv
+            previous = st.session_state.documents
+            
+            async def regenerate_letters(progress):
+                progress.stage('letters', 0.0, "✨ Creating new versions of your cover letters...")
+                letters = await letter_generator.generate_letters(job_ad, 3, use_cache=False)
+                progress.stage('letters', 1.0, "Rendering the cover letters...")
+                documents = await asyncio.to_thread(doc_maker.create_documents, cv, letters, previous)
+                return {'cover_letters': letters, 'documents': documents}
+            
+            start_job('regenerate_letters', regenerate_letters)
 
 def main():
     # Title and logo
@@ -243,6 +553,9 @@ def main():
             </div>
         """, unsafe_allow_html=True)
     
+    # Progress of background jobs, visible from both tabs
+    show_jobs()
+    
     # Create tabs with icons
     tab1, tab2 = st.tabs(["Generate Documents", "Review & Edit"])
     
@@ -266,110 +579,186 @@ def main():
             placeholder="Paste the job advertisement here... Include the full description, requirements, and any other relevant information."
         )
 
-    async def generate_documents(job_ad: str):
-        """Asynchronously generate all documents"""
-        # Extract skills and generate CV and cover letters in parallel
-        skills_task = cv_processor.extract_skills(job_ad)
-        cv_task = cv_processor.tailor_cv(job_ad)
-        letters_task = letter_generator.generate_letters(job_ad, 3)
+    async def generate_documents(job_ad: str, progress):
+        """Generate all documents as a background job, publishing drafts as they stream in"""
+        for stage in ('skills', 'cv', 'letters', 'documents'):
+            progress.stage(stage, 0.0)
+        progress.stage('cv', 0.0, "Analyzing job advertisement and generating documents...")
+        # Skills from the local matcher are shown before any API call
+        # returns; the model may add more in 'hybrid' mode
+        progress.set('skills', cv_processor.extract_skills_local(job_ad))
         
-        # Wait for all tasks to complete
-        skills, cv_content, letters = await asyncio.gather(
-            skills_task, cv_task, letters_task
-        )
+        async def extract_skills():
+            with metrics.span('extract_skills'):
+                skills = await cv_processor.extract_skills(job_ad)
+            progress.set('skills', skills)
+            progress.stage('skills', 1.0)
+            return skills
+        
+        async def stream_cv():
+            sections = []
+            fields_done = 0
+            render_task = None
+            with metrics.span('tailor_cv'):
+                async for kind, field, value in cv_processor.tailor_cv_fields(job_ad):
+                    if kind == 'field':
+                        fields_done += 1
+                        progress.stage('cv', 0.9 * fields_done / len(TAILORED_CV_SCHEMA['properties']))
+                    if kind == 'field' and field == 'job_keywords':
+                        progress.set('keywords', value)
+                    elif kind == 'item' and field == 'sections':
+                        sections.append(value)
+                        progress.set('sections', list(sections))
+                    elif kind == 'field' and field == 'sections':
+                        # Start rendering as soon as the CV body is complete; the
+                        # result lands in the render cache for the final documents
+                        draft = {'content': cv_processor.sections_to_text(value), 'sections': value}
+                        render_task = asyncio.ensure_future(
+                            asyncio.to_thread(doc_maker.create_cv_documents, draft)
+                        )
+                    elif kind == 'result':
+                        cv_content = value
+            if render_task is not None:
+                # A failed draft render is retried with the final documents
+                await asyncio.gather(render_task, return_exceptions=True)
+            progress.stage('cv', 1.0)
+            return cv_content
+        
+        async def stream_letters():
+            texts = {}
+            letters = []
+            with metrics.span('generate_letters'):
+                async for kind, version, value in letter_generator.generate_letters_stream(job_ad, 3):
+                    if kind == 'delta':
+                        texts[version] = texts.get(version, "") + value
+                    elif kind == 'dropped':
+                        texts.pop(version, None)
+                    else:
+                        letters = value
+                        continue
+                    progress.set('letters', dict(texts))
+                    # Rough estimate: a letter is about 2,000 characters
+                    progress.stage('letters', min(0.95, sum(map(len, texts.values())) / 6000))
+            progress.stage('letters', 1.0)
+            return letters
+        
+        # Extract skills while the CV and cover letters stream in parallel
+        with metrics.span('generate_documents'):
+            skills, cv_content, letters = await asyncio.gather(
+                extract_skills(), stream_cv(), stream_letters()
+            )
         
-        return skills, cv_content, letters
+        progress.stage('documents', 0.0, "Rendering documents...")
+        documents = await asyncio.to_thread(doc_maker.create_documents, cv_content, letters)
+        progress.stage('documents', 1.0)
+        return {
+            'job_ad': job_ad,
+            'skills': skills,
+            'generated_cv': cv_content,
+            'cover_letters': letters,
+            'documents': documents
+        }
 
-    if st.button("Generate Documents") and job_ad:
-        with st.spinner("Analyzing job advertisement and generating documents..."):
+    generate = st.button("Generate Documents") and job_ad
+    
+    # Reposts of a job ad seen before can reuse the earlier results
+    if generate and job_index is not None:
+        matches = job_index.find(job_ad)
+        if matches:
+            similarity, entry = matches[0]
+            st.session_state.duplicate = {'job_ad': job_ad, 'similarity': similarity, 'entry': entry}
+            generate = False
+    
+    duplicate = st.session_state.duplicate
+    if duplicate and not generate:
+        st.markdown(f"""
+            <div class='warning-message'>
+                <h4>This looks like a job ad you have already processed</h4>
+                <p>It is {duplicate['similarity']:.0%} similar to <b>{html.escape(duplicate['entry']['title'])}</b>.
+                You can reuse those documents, adapt the cover letters to this posting, or start over.</p>
+            </div>
+        """, unsafe_allow_html=True)
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            reuse = st.button("Reuse Previous Documents")
+        with col2:
+            adapt = st.button("Adapt Cover Letters")
+        with col3:
+            generate = st.button("Generate From Scratch")
+        
+        if reuse:
             try:
-                # Store job ad in session state
-                st.session_state.job_ad = job_ad
-                
-                # Process the job ad and generate documents asynchronously
-                skills, cv_content, letters = asyncio.run(generate_documents(job_ad))
-                
-                st.session_state.skills = skills
-                st.session_state.generated_cv = cv_content
-                st.session_state.cover_letters = letters
-                
-                # Create documents
-                cv_docx, cv_pdf = doc_maker.create_cv_documents(st.session_state.generated_cv)
-                letter_docs = doc_maker.create_letter_documents(st.session_state.cover_letters)
-                
-                # Display results
-                st.success("Documents generated successfully!")
-                
-                # Display extracted skills with tags
-                st.markdown("<div class='section-header'>Key Skills Identified</div>", unsafe_allow_html=True)
-                skills_html = "".join([f"<span class='skill-tag'>{skill}</span>" for skill in st.session_state.skills])
-                st.markdown(f"<div style='line-height: 3;'>{skills_html}</div>", unsafe_allow_html=True)
-                
-                # Create download buttons for documents with better organization
-                st.markdown("<div class='section-header'>Generated Documents</div>", unsafe_allow_html=True)
-                
-                # CV downloads with icons and better styling
-                st.markdown("#### Your Tailored CV")
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.download_button(
-                        "Download CV (DOCX)",
-                        cv_docx,
-                        "tailored_cv.docx",
-                        "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                        width='stretch'
-                    )
-                with col2:
-                    st.download_button(
-                        "Download CV (PDF)",
-                        cv_pdf,
-                        "tailored_cv.pdf",
-                        "application/pdf",
-                        width='stretch'
-                    )
-                
-                # Cover letter downloads with better organization
-                st.markdown("#### Your Cover Letters")
-                st.markdown("Each version has a different approach while maintaining your personal style.")
-                
-                for i, (docx, pdf) in enumerate(letter_docs, 1):
-                    st.markdown(f"**Version {i}**")
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.download_button(
-                            f"Download Letter {i} (DOCX)",
-                            docx,
-                            f"cover_letter_{i}.docx",
-                            "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                            width='stretch'
-                        )
-                    with col2:
-                        st.download_button(
-                            f"Download Letter {i} (PDF)",
-                            pdf,
-                            f"cover_letter_{i}.pdf",
-                            "application/pdf",
-                            width='stretch'
-                        )
-                
-                # Success message with better styling and clear next steps
-                st.markdown("""
-                    <div class='success-message'>
-                        <h4>Documents Generated Successfully!</h4>
-                        <p>Your documents have been tailored to the job description. You can:</p>
-                        <ul>
-                            <li>Download the documents in your preferred format</li>
-                            <li>Switch to the 'Review & Edit' tab to make any adjustments</li>
-                            <li>Regenerate individual documents if needed</li>
-                        </ul>
-                    </div>
-                """, unsafe_allow_html=True)
-            
+                load_previous_results(duplicate['job_ad'], duplicate['entry']['results'])
+                st.session_state.duplicate = None
             except Exception as e:
                 st.error(f"An error occurred: {str(e)}")
+        if adapt:
+            st.session_state.duplicate = None
+            # Adapt the earlier results to the new posting
+            new_job_ad, previous_results = duplicate['job_ad'], duplicate['entry']['results']
+            start_job('adapt', lambda progress: adapt_previous_results(new_job_ad, previous_results, progress))
+        if generate:
+            job_ad = duplicate['job_ad']
+            st.session_state.duplicate = None
+    
+    if generate:
+        # Store job ad in session state
+        st.session_state.job_ad = job_ad
+        # Clicking again while the same ad is generating attaches to that job
+        start_job(
+            'generate',
+            lambda progress: generate_documents(job_ad, progress),
+            key=hashlib.sha256(job_ad.encode('utf-8')).hexdigest()
+        )
+    
+    # Latest results, kept across reruns
+    with tab1:
+        if st.session_state.generated_cv and st.session_state.documents:
+            st.markdown("<div class='section-header'>Key Skills Identified</div>", unsafe_allow_html=True)
+            show_skills(st.empty(), st.session_state.skills or [])
+            
+            # What job ad compaction saved on each request (cached, so cheap on reruns)
+            if cv_processor.compact_job_ads and st.session_state.job_ad:
+                report = compact_job_ad(st.session_state.job_ad, cv_processor.job_ad_max_tokens, record=False)
+                if report['saved_tokens'] > 0:
+                    st.caption(
+                        f"The job ad was sent as {report['tokens']} tokens instead of "
+                        f"{report['original_tokens']}: {report['removed_lines']} boilerplate and "
+                        f"{report['duplicate_lines']} repeated lines removed"
+                        + (", cut to the token budget" if report['truncated'] else "") + "."
+                    )
+            
+            show_downloads(st.session_state.documents)
+            
+            # Success message with better styling and clear next steps
+            st.markdown("""
+                <div class='success-message'>
+                    <h4>Documents Generated Successfully!</h4>
+                    <p>Your documents have been tailored to the job description. You can:</p>
+                    <ul>
+                        <li>Download the documents in your preferred format</li>
+                        <li>Switch to the 'Review & Edit' tab to make any adjustments</li>
+                        <li>Regenerate individual documents if needed</li>
+                    </ul>
+                </div>
+            """, unsafe_allow_html=True)
     
     with tab2:
         view_and_edit_documents()
+    
+    if os.getenv('DEBUG_MODE', 'false').lower() == 'true':
+        with st.sidebar.expander("Token usage"):
+            st.json(resources.get_ai_client().usage_summary())
+        with st.sidebar.expander("Metrics"):
+            st.json(metrics.snapshot())
+            st.download_button(
+                "Download metrics (Prometheus)",
+                metrics.to_prometheus(),
+                "metrics.prom",
+                "text/plain"
+            )
+    
+    metrics.observe('streamlit_rerun_seconds', time.perf_counter() - rerun_start)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,285 @@
+"""Headless batch mode: tailor the CV and cover letters for many job ads.
+
+Usage:
+    python batch.py path/to/job_ads/            # one .txt/.md file per job ad
+    python batch.py path/to/job_ads.jsonl       # {"id": ..., "job_ad": ...} per line
+
+Artifacts for each job ad are written to OUTPUT_DIR/batch/<job_id>/, with
+the documents in one ZIP per job when --bundle is given. A manifest in
+the same folder records finished jobs, so an interrupted run resumes
+without paying again for them. Near-duplicates of job ads seen
+before (reposts on other boards) reuse the earlier CV and only have their
+cover letters adapted, unless --duplicates says otherwise.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+from src import resources
+from src.utils.rate_limiter import PRIORITY_BATCH, request_priority
+from src.utils.metrics import metrics
+from src.utils.bundle import BUNDLE_NAME, document_files, write_bundle
+from src.utils.job_ad import compact_job_ad
+
+JOB_AD_EXTENSIONS = ('.txt', '.md')
+
+
+def load_job_ads(source: str) -> List[Dict]:
+    """Read job ads from a directory of text files or a JSONL file."""
+    jobs = []
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            stem, ext = os.path.splitext(name)
+            if ext.lower() not in JOB_AD_EXTENSIONS:
+                continue
+            with open(os.path.join(source, name), 'r') as f:
+                jobs.append({'id': stem, 'job_ad': f.read()})
+    else:
+        with open(source, 'r') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                job_ad = record.get('job_ad') or record.get('text')
+                if not job_ad:
+                    raise ValueError(f"Line {line_number} of {source} has no 'job_ad' or 'text' field")
+                jobs.append({'id': str(record.get('id', line_number)), 'job_ad': job_ad})
+
+    return [job for job in jobs if job['job_ad'].strip()]
+
+
+def safe_job_id(job_id: str) -> str:
+    """Make a job ID usable as a directory name."""
+    cleaned = "".join(c if c.isalnum() or c in '-_.' else '_' for c in job_id).strip('.')
+    return cleaned or hashlib.sha256(job_id.encode('utf-8')).hexdigest()[:12]
+
+
+class BatchRunner:
+    def __init__(
+        self,
+        output_dir: str,
+        concurrency: int,
+        num_variants: int,
+        duplicates: str = 'adapt',
+        bundle: bool = False
+    ):
+        self.output_dir = output_dir
+        self.concurrency = concurrency
+        self.num_variants = num_variants
+        self.duplicates = duplicates
+        self.bundle = bundle
+
+        self.cv_processor = resources.get_cv_processor()
+        self.letter_generator = resources.get_letter_generator()
+        self.doc_maker = resources.get_document_maker()
+        self.job_index = resources.get_job_index() if duplicates != 'ignore' else None
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.manifest_path = os.path.join(self.output_dir, 'manifest.json')
+        self.manifest = self._load_manifest()
+        self._manifest_lock = asyncio.Lock()
+
+    def _load_manifest(self) -> Dict:
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, 'r') as f:
+            return json.load(f)
+
+    async def _record(self, job_id: str, entry: Dict):
+        """Update the manifest atomically so a crash never leaves it half-written."""
+        async with self._manifest_lock:
+            self.manifest[job_id] = entry
+            tmp_path = f"{self.manifest_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.manifest, f, indent=2)
+            os.replace(tmp_path, self.manifest_path)
+
+    def is_done(self, job: Dict) -> bool:
+        entry = self.manifest.get(job['id'])
+        return bool(entry) and entry['status'] == 'done' and entry['input_hash'] == job['input_hash']
+
+    def _write_artifacts(self, job_dir: str, skills: List[str], cv_content: Dict, letters: List[Dict]):
+        """Render documents and write everything for one job to disk."""
+        os.makedirs(job_dir, exist_ok=True)
+
+        with open(os.path.join(job_dir, 'skills.json'), 'w') as f:
+            json.dump(skills, f, indent=2)
+        with open(os.path.join(job_dir, 'analysis.json'), 'w') as f:
+            json.dump(cv_content['analysis'], f, indent=2)
+
+        for letter in letters:
+            with open(os.path.join(job_dir, f"cover_letter_{letter['version']}.txt"), 'w') as f:
+                f.write(letter['content'])
+
+        documents = self.doc_maker.create_documents(cv_content, letters)
+        files = document_files(documents, [letter['version'] for letter in letters])
+        if self.bundle:
+            # Written entry by entry; renamed into place once complete
+            bundle_path = os.path.join(job_dir, BUNDLE_NAME)
+            write_bundle(f"{bundle_path}.tmp", files)
+            os.replace(f"{bundle_path}.tmp", bundle_path)
+            return
+
+        for name, data in files:
+            with open(os.path.join(job_dir, name), 'wb') as f:
+                f.write(data)
+
+    async def _generate(self, job_ad: str) -> Tuple[List[str], Dict, List[Dict], Optional[str]]:
+        """Generate skills, CV and letters, reusing a near-duplicate's results when indexed.
+        
+        An exact repost (similarity 1.0) reuses the results as they are,
+        whatever the duplicates mode. Returns the results and the ID of the
+        reused index entry, if any.
+        """
+        matches = self.job_index.find(job_ad) if self.job_index is not None else []
+        if matches:
+            similarity, entry = matches[0]
+            results = entry['results']
+            action = 'reuse' if similarity >= 1.0 else self.duplicates
+            metrics.increment('job_duplicates_total', action=action)
+            if action == 'reuse':
+                return results['skills'], results['generated_cv'], results['cover_letters'], entry['id']
+            skills, letters = await asyncio.gather(
+                self.cv_processor.extract_skills(job_ad),
+                self.letter_generator.adapt_letters(job_ad, results['cover_letters'])
+            )
+            return skills, results['generated_cv'], letters, entry['id']
+        
+        skills, cv_content, letters = await asyncio.gather(
+            self.cv_processor.extract_skills(job_ad),
+            self.cv_processor.tailor_cv(job_ad),
+            self.letter_generator.generate_letters(job_ad, self.num_variants)
+        )
+        return skills, cv_content, letters, None
+    
+    def _index(self, job_ad: str, skills: List[str], cv_content: Dict, letters: List[Dict]):
+        """Add newly generated results to the near-duplicate index."""
+        cv = {key: value for key, value in cv_content.items() if key != 'formats'}
+        self.job_index.add(job_ad, {'skills': skills, 'generated_cv': cv, 'cover_letters': letters})
+    
+    def _tokens_saved(self, job_ad: str) -> int:
+        """Tokens per request that job ad compaction removed from this ad."""
+        if not self.cv_processor.compact_job_ads:
+            return 0
+        return compact_job_ad(job_ad, self.cv_processor.job_ad_max_tokens, record=False)['saved_tokens']
+    
+    async def run_job(self, job: Dict, semaphore: asyncio.Semaphore) -> str:
+        async with semaphore:
+            start = time.perf_counter()
+            job_dir = os.path.join(self.output_dir, safe_job_id(job['id']))
+            try:
+                skills, cv_content, letters, reused_from = await self._generate(job['job_ad'])
+                # Rendering is CPU-bound; keep it off the event loop
+                await asyncio.to_thread(self._write_artifacts, job_dir, skills, cv_content, letters)
+                # Indexed only once on disk, so a failed job is never found as its own duplicate
+                if self.job_index is not None and reused_from is None:
+                    self._index(job['job_ad'], skills, cv_content, letters)
+            except Exception as e:
+                metrics.increment('batch_jobs_total', status='failed')
+                print(f"[{job['id']}] failed: {str(e)}")
+                await self._record(job['id'], {
+                    'status': 'failed',
+                    'input_hash': job['input_hash'],
+                    'error': str(e),
+                    'elapsed': round(time.perf_counter() - start, 3),
+                })
+                return 'failed'
+
+            elapsed = time.perf_counter() - start
+            metrics.increment('batch_jobs_total', status='done')
+            metrics.observe('batch_job_seconds', elapsed)
+            await self._record(job['id'], {
+                'status': 'done',
+                'input_hash': job['input_hash'],
+                'output_dir': job_dir,
+                'completed_at': datetime.now(timezone.utc).isoformat(),
+                'elapsed': round(elapsed, 3),
+                'reused_from': reused_from,
+                'job_ad_tokens_saved': self._tokens_saved(job['job_ad']),
+            })
+            note = f" (near-duplicate, {self.duplicates} {reused_from})" if reused_from else ""
+            print(f"[{job['id']}] done in {elapsed:.1f}s{note}")
+            return 'done'
+
+    async def run(self, jobs: List[Dict]) -> Dict:
+        for job in jobs:
+            job['input_hash'] = hashlib.sha256(job['job_ad'].encode('utf-8')).hexdigest()
+
+        pending = [job for job in jobs if not self.is_done(job)]
+        skipped = len(jobs) - len(pending)
+        if skipped:
+            print(f"Skipping {skipped} job(s) already completed in a previous run")
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        start = time.perf_counter()
+        # Batch calls yield to interactive ones sharing the same client
+        with request_priority(PRIORITY_BATCH):
+            statuses = await asyncio.gather(*(self.run_job(job, semaphore) for job in pending))
+        elapsed = time.perf_counter() - start
+
+        # Timings and counters for this run, next to the manifest
+        with open(os.path.join(self.output_dir, 'metrics.json'), 'w') as f:
+            json.dump(metrics.snapshot(), f, indent=2)
+        
+        done = statuses.count('done')
+        return {
+            'total': len(jobs),
+            'done': done,
+            'failed': statuses.count('failed'),
+            'skipped': skipped,
+            'elapsed': round(elapsed, 3),
+            'jobs_per_minute': round(done / elapsed * 60, 2) if elapsed > 0 else 0.0,
+            'token_usage': resources.get_ai_client().usage_summary(),
+        }
+
+
+def main(argv=None) -> int:
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Tailor the CV and cover letters for a batch of job ads.")
+    parser.add_argument('source', help="Directory of .txt/.md job ads or a JSONL file")
+    parser.add_argument('--output-dir', default=os.path.join(os.getenv('OUTPUT_DIR', 'output'), 'batch'),
+                        help="Where to write per-job artifacts and the manifest")
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv('BATCH_CONCURRENCY', '2')),
+                        help="Maximum number of job ads processed at once")
+    parser.add_argument('--variants', type=int, default=int(os.getenv('MAX_COVER_LETTERS', '3')),
+                        help="Number of cover letter variants per job ad")
+    parser.add_argument('--duplicates', choices=('adapt', 'reuse', 'ignore'), default='adapt',
+                        help="Near-duplicates of earlier job ads: adapt the earlier letters (default), "
+                             "reuse the earlier documents as-is, or generate from scratch")
+    parser.add_argument('--bundle', action='store_true',
+                        help=f"Write each job's DOCX and PDF files into one {BUNDLE_NAME} instead of separately")
+    args = parser.parse_args(argv)
+
+    jobs = load_job_ads(args.source)
+    if not jobs:
+        print(f"No job ads found in {args.source}")
+        return 1
+
+    runner = BatchRunner(args.output_dir, max(1, args.concurrency), args.variants, args.duplicates, args.bundle)
+    report = asyncio.run(runner.run(jobs))
+
+    print(
+        f"Processed {report['done']} of {report['total']} job ad(s) in {report['elapsed']:.1f}s "
+        f"({report['jobs_per_minute']} jobs/min); "
+        f"{report['failed']} failed, {report['skipped']} skipped"
+    )
+    usage = report['token_usage']
+    print(
+        f"Input tokens: {usage['prompt_tokens']} "
+        f"({usage['cached_tokens']} cached, {usage['cached_ratio']:.0%}); "
+        f"output tokens: {usage['completion_tokens']}"
+    )
+    return 0 if report['failed'] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+"""End-to-end throughput and latency benchmark against a mock OpenAI API.
+
+Usage:
+    python benchmarks/e2e.py [--concurrency 1,2,4,8] [--jobs 16]
+                             [--latency lognormal:1.0:0.4] [--output results.json]
+
+Each job runs what batch.py does for one job ad: skills, tailored CV and
+cover letters concurrently, then renders all documents. API calls are
+answered in-process by src.utils.mock_openai, so no key or credits are
+needed. For each concurrency level the script reports per-job latency
+percentiles, jobs/sec and peak RSS as JSON.
+
+The CV, guide, style examples and style YAML come from the usual
+environment variables; any that don't exist are replaced with small
+fixtures (the CV falls back to temp.tex).
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FIXTURE_STYLE = """
+cv_style:
+  margins: {left: 0.8, right: 0.8, top: 0.7, bottom: 0.7}
+  font: {main: helvetica, size: 10}
+  spacing: {line_spacing: 0.5}
+cover_letter_style:
+  margins: {left: 1.0, right: 1.0, top: 1.0, bottom: 1.0}
+  font: {main: helvetica, size: 11}
+  spacing: {line_spacing: 0.6}
+"""
+
+FIXTURE_GUIDE = """Keep every fact from the original CV. Reorder and rephrase to match the job ad.
+Return JSON with content, job_keywords, gaps_and_risks, notes_for_user and qa_checks."""
+
+FIXTURE_EXAMPLES = """Dear Hiring Team,
+
+I was excited to see your opening. In my last role I built data pipelines...
+
+Kind regards"""
+
+JOB_AD = """{title} ({number})
+
+We are hiring a {title} to build and run our data platform.
+
+Requirements:
+- {years}+ years of experience with Python and SQL
+- Hands-on with PySpark and Databricks on Azure
+- Experience with Docker and CI/CD pipelines
+- Strong communication skills and a team player
+"""
+
+JOB_TITLES = ('Data Engineer', 'Analytics Engineer', 'ML Engineer', 'Data Platform Engineer')
+
+
+def prepare_environment(fixture_dir: str):
+    """Point missing user_data paths at fixtures and make runs reproducible."""
+    fixtures = {
+        'USER_CV_PATH': ('user_data/cv/user_cv.tex', None),
+        'CV_GUIDE_PATH': ('user_data/templates/cv_tailoring_guide.md', FIXTURE_GUIDE),
+        'LETTER_EXAMPLES_PATH': ('user_data/cover_letters/style_examples.md', FIXTURE_EXAMPLES),
+        'USER_STYLE_PATH': ('user_data/style/user_style.yaml', FIXTURE_STYLE),
+    }
+    for name, (default, content) in fixtures.items():
+        if os.path.exists(os.getenv(name, default)):
+            continue
+        if content is None:
+            os.environ[name] = os.path.join(ROOT, 'temp.tex')
+            continue
+        path = os.path.join(fixture_dir, os.path.basename(default))
+        with open(path, 'w') as f:
+            f.write(content)
+        os.environ[name] = path
+
+    os.environ.setdefault('OPENAI_API_KEY', 'mock')
+    os.environ['OUTPUT_DIR'] = os.path.join(fixture_dir, 'outputs')
+    # Measure the pipeline, not the caches or client-side rate limits
+    os.environ['CACHE_ENABLED'] = 'false'
+    os.environ['RENDER_CACHE_MAX_MB'] = '0'
+    os.environ['RATE_LIMIT_RPM'] = '0'
+    os.environ['RATE_LIMIT_TPM'] = '0'
+    os.environ['SAVE_INTERMEDIATE'] = 'false'
+
+
+def job_ads(count: int, offset: int) -> List[str]:
+    """Distinct synthetic job ads, so no two jobs share a prompt."""
+    return [
+        JOB_AD.format(title=JOB_TITLES[n % len(JOB_TITLES)], number=n, years=2 + n % 5)
+        for n in range(offset, offset + count)
+    ]
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process, or None where unsupported."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_job(cv_processor, letter_generator, doc_maker, job_ad: str, variants: int):
+    skills, cv_content, letters = await asyncio.gather(
+        cv_processor.extract_skills(job_ad),
+        cv_processor.tailor_cv(job_ad),
+        letter_generator.generate_letters(job_ad, variants)
+    )
+
+    def render():
+        doc_maker.create_cv_documents(cv_content)
+        doc_maker.create_letter_documents(letters)
+
+    await asyncio.to_thread(render)
+
+
+async def run_level(processors, ads: List[str], concurrency: int, variants: int) -> Dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def timed(job_ad: str):
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await run_job(*processors, job_ad, variants)
+            except Exception as e:
+                failures += 1
+                print(f"Job failed: {str(e)}", file=sys.stderr)
+                return
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(timed(job_ad) for job_ad in ads))
+    elapsed = time.perf_counter() - start
+
+    return {
+        'concurrency': concurrency,
+        'jobs': len(ads),
+        'failed': failures,
+        'elapsed_s': round(elapsed, 3),
+        'jobs_per_sec': round(len(latencies) / elapsed, 3) if elapsed > 0 else 0.0,
+        'latency_s': {
+            'p50': round(percentile(latencies, 0.50), 3),
+            'p95': round(percentile(latencies, 0.95), 3),
+            'p99': round(percentile(latencies, 0.99), 3),
+            'max': round(max(latencies), 3),
+        } if latencies else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', default='1,2,4,8', help="Comma-separated concurrent job counts")
+    parser.add_argument('--jobs', type=int, default=16, help="Jobs per concurrency level")
+    parser.add_argument('--variants', type=int, default=3, help="Cover letter variants per job")
+    parser.add_argument('--latency', default='lognormal:1.0:0.4',
+                        help="Mock API latency: fixed:S, uniform:LOW:HIGH or lognormal:MEDIAN:SIGMA")
+    parser.add_argument('--token-latency', type=float, default=0.0, help="Mock seconds per generated output token")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of mock calls answered with a 429")
+    parser.add_argument('--max-requests', type=int, default=32, help="MAX_CONCURRENT_REQUESTS for the client")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Also write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    with tempfile.TemporaryDirectory(prefix='cv_tailor_bench_') as fixture_dir:
+        prepare_environment(fixture_dir)
+        os.environ['MAX_CONCURRENT_REQUESTS'] = str(args.max_requests)
+        os.environ['RETRY_BASE_DELAY'] = '0.05'
+
+        from src.utils.mock_openai import MockOpenAI
+        from src.utils.secure_openai import SecureOpenAIClient
+        from src.cv_processor import CVProcessor
+        from src.letter_generator import LetterGenerator
+        from src.document_maker import DocumentMaker
+
+        mock = MockOpenAI(latency=args.latency, token_latency=args.token_latency,
+                          error_rate=args.error_rate, seed=args.seed)
+        client = SecureOpenAIClient(transport=mock.transport())
+        processors = (
+            CVProcessor(ai_client=client),
+            LetterGenerator(ai_client=client),
+            DocumentMaker(),
+        )
+
+        async def run_all() -> List[Dict]:
+            results = []
+            offset = 0
+            for concurrency in (int(c) for c in args.concurrency.split(',')):
+                ads = job_ads(args.jobs, offset)
+                offset += args.jobs
+                results.append(await run_level(processors, ads, concurrency, args.variants))
+                print(json.dumps(results[-1]), file=sys.stderr)
+            await client.aclose()
+            return results
+
+        levels = asyncio.run(run_all())
+
+    report = {
+        'config': {
+            'latency': args.latency,
+            'token_latency': args.token_latency,
+            'error_rate': args.error_rate,
+            'jobs_per_level': args.jobs,
+            'variants': args.variants,
+            'max_requests': args.max_requests,
+            'skill_extraction': os.getenv('SKILL_EXTRACTION', 'hybrid'),
+            'mock_requests': mock.requests,
+        },
+        'levels': levels,
+        'token_usage': client.usage_summary(),
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Compare cover letter generation modes: fan-out vs. a single request.
+
+Usage:
+    python benchmarks/letters.py [--jobs 10] [--variants 3]
+                                 [--latency lognormal:0.8:0.3] [--token-latency 0.01]
+
+Runs LetterGenerator.generate_letters for the same job ads in each
+LETTER_GENERATION_MODE ('fanout', 'n', 'json') against the mock OpenAI API
+and reports per-job latency and token usage as JSON. Fan-out sends the
+style examples and job ad once per variant; 'n' and 'json' send them once
+per job.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from e2e import job_ads, percentile, prepare_environment
+
+MODES = ('fanout', 'n', 'json')
+
+
+async def run_mode(mode: str, ads, variants: int, mock_options: dict) -> dict:
+    from src.utils.mock_openai import MockOpenAI
+    from src.utils.secure_openai import SecureOpenAIClient
+    from src.letter_generator import LetterGenerator
+
+    mock = MockOpenAI(**mock_options)
+    client = SecureOpenAIClient(transport=mock.transport())
+    generator = LetterGenerator(ai_client=client)
+    generator.generation_mode = mode
+
+    latencies = []
+    letters = 0
+    for job_ad in ads:
+        start = time.perf_counter()
+        letters += len(await generator.generate_letters(job_ad, variants))
+        latencies.append(time.perf_counter() - start)
+    await client.aclose()
+
+    usage = client.usage_summary()
+    jobs = len(ads)
+    return {
+        'mode': mode,
+        'jobs': jobs,
+        'letters_per_job': round(letters / jobs, 2),
+        'requests_per_job': round(usage['requests'] / jobs, 2),
+        'latency_s': {
+            'p50': round(percentile(latencies, 0.50), 3),
+            'p95': round(percentile(latencies, 0.95), 3),
+        },
+        'prompt_tokens_per_job': round(usage['prompt_tokens'] / jobs),
+        'uncached_prompt_tokens_per_job': round(usage['uncached_tokens'] / jobs),
+        'completion_tokens_per_job': round(usage['completion_tokens'] / jobs),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=10)
+    parser.add_argument('--variants', type=int, default=3)
+    parser.add_argument('--latency', default='lognormal:0.8:0.3', help="Mock time to first token")
+    parser.add_argument('--token-latency', type=float, default=0.01, help="Mock seconds per output token")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    with tempfile.TemporaryDirectory(prefix='cv_tailor_bench_') as fixture_dir:
+        prepare_environment(fixture_dir)
+        ads = job_ads(args.jobs, 0)
+        mock_options = dict(latency=args.latency, token_latency=args.token_latency, seed=args.seed)
+        results = [
+            asyncio.run(run_mode(mode, ads, args.variants, mock_options))
+            for mode in MODES
+        ]
+
+    print(json.dumps({
+        'config': {
+            'latency': args.latency,
+            'token_latency': args.token_latency,
+            'variants': args.variants,
+        },
+        'modes': results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
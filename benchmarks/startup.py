@@ -0,0 +1,92 @@
+"""Measure cold-start and per-rerun overhead of the app's processors.
+
+Usage:
+    python benchmarks/startup.py [--reruns 20]
+
+Cold start is the time for a fresh interpreter to import the processor
+modules. Per-rerun overhead is what each Streamlit rerun of app.py pays to
+obtain a CVProcessor, LetterGenerator and DocumentMaker: constructing new
+ones every time versus fetching the shared instances from src.resources.
+Paths come from the same environment variables as the app.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from statistics import median
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+
+def measure_import(module: str, runs: int = 5) -> float:
+    """Median wall time to import a module in a fresh interpreter."""
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', IMPORT_SNIPPET.format(module=module)],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return median(timings)
+
+
+def measure_reruns(reruns: int) -> dict:
+    """Median per-rerun cost of building vs. reusing the processors."""
+    from src.cv_processor import CVProcessor
+    from src.letter_generator import LetterGenerator
+    from src.document_maker import DocumentMaker
+
+    rebuild = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        CVProcessor(), LetterGenerator(), DocumentMaker()
+        rebuild.append(time.perf_counter() - start)
+
+    results = {'rebuild_per_rerun': median(rebuild)}
+
+    try:
+        from src import resources
+    except ImportError:
+        return results
+
+    shared = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        resources.get_cv_processor(), resources.get_letter_generator(), resources.get_document_maker()
+        shared.append(time.perf_counter() - start)
+    results['shared_first_rerun'] = shared[0]
+    results['shared_per_rerun'] = median(shared[1:]) if len(shared) > 1 else shared[0]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reruns', type=int, default=20)
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    results = {
+        'import_processors': measure_import('src.cv_processor, src.letter_generator, src.document_maker'),
+    }
+    if os.path.exists(os.path.join(ROOT, 'src', 'resources.py')):
+        results['import_resources'] = measure_import('src.resources')
+    results.update(measure_reruns(args.reruns))
+
+    print(json.dumps({name: round(value * 1000, 2) for name, value in results.items()}, indent=2))
+    print("(milliseconds)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""Parse a moderncv LaTeX CV into an indexed section model.
+
+The model is a plain dict:
+
+    {
+        'sections': [
+            {'title': 'Professional Experience', 'items': [
+                {'type': 'cventry', 'date': ..., 'title': ..., 'organization': ...,
+                 'description': ..., 'text': ...},
+                ...
+            ]},
+            ...
+        ],
+        'skills': ['Python', ...],
+        'publications': [{'type': 'cventry', ...}, ...],
+    }
+
+Every item carries ``text``, a plain-text rendering with LaTeX markup and
+layout commands removed, which is what gets sent to the model.
+"""
+import os
+import re
+import math
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+# Layout-only commands whose arguments are dropped entirely
+DROPPED_COMMANDS = (
+    'includegraphics', 'vspace', 'hspace', 'setstretch', 'setlength',
+    'photo', 'color', 'small', 'footnotesize', 'selectlanguage',
+)
+
+# Formatting commands whose (last) argument is kept as text
+UNWRAPPED_COMMANDS = ('textbf', 'textit', 'emph', 'slshape', 'bfseries', 'underline', 'mbox')
+
+STOPWORDS = frozenset("""
+a about above after all also an and any are as at be been being both but by can could do does
+for from has have having how if in into is it its may more most must not of on or our out over
+own per such than that the their them then there these they this those through to under up
+very was we were what when where which while who will with within would you your
+""".split())
+
+SKILL_SECTION_TITLES = ('skill',)
+PUBLICATION_SECTION_TITLES = ('publication',)
+MAX_SKILL_WORDS = 4
+
+
+def strip_comments(source: str) -> str:
+    """Remove LaTeX comments (unescaped % to end of line)."""
+    return re.sub(r'(?<!\\)%.*', '', source)
+
+
+def _read_group(source: str, start: int, open_char: str = '{', close_char: str = '}') -> Tuple[Optional[str], int]:
+    """Read a balanced group starting at ``start`` (after whitespace).
+
+    Returns the group's inner text and the index after it, or (None, start)
+    when no group starts there.
+    """
+    i = start
+    while i < len(source) and source[i].isspace():
+        i += 1
+    if i >= len(source) or source[i] != open_char:
+        return None, start
+
+    depth = 0
+    j = i
+    while j < len(source):
+        c = source[j]
+        if c == '\\':
+            # Skip escaped characters such as \{ and \}
+            j += 2
+            continue
+        if c == open_char:
+            depth += 1
+        elif c == close_char:
+            depth -= 1
+            if depth == 0:
+                return source[i + 1:j], j + 1
+        j += 1
+    return source[i + 1:], len(source)
+
+
+def _read_arguments(source: str, start: int, count: int) -> Tuple[List[str], int]:
+    """Read an optional [...] argument followed by up to ``count`` {...} arguments."""
+    _, position = _read_group(source, start, '[', ']')
+    args = []
+    for _ in range(count):
+        arg, position = _read_group(source, position)
+        if arg is None:
+            break
+        args.append(arg)
+    return args, position
+
+
+def latex_to_text(source: str) -> str:
+    """Convert a LaTeX fragment to readable plain text."""
+    text = strip_comments(source)
+
+    # \href{url}{label} -> label
+    text = re.sub(r'\\href\s*\{[^{}]*\}\s*\{((?:[^{}]|\{[^{}]*\})*)\}', r'\1', text)
+    for command in DROPPED_COMMANDS:
+        text = re.sub(r'\\%s\*?(\[[^\]]*\])*(\{(?:[^{}]|\{[^{}]*\})*\})*' % command, ' ', text)
+    for command in UNWRAPPED_COMMANDS:
+        text = re.sub(r'\\%s\s*\{((?:[^{}]|\{[^{}]*\})*)\}' % command, r'\1', text)
+
+    text = re.sub(r'\\item\s*', '\n- ', text)
+    text = re.sub(r'\\(begin|end)\{[^}]*\}(\{[^}]*\})?', '\n', text)
+    # Line breaks, including spaced ones like \\[.1cm]
+    text = re.sub(r'\\\\(\[[^\]]*\])?', '\n', text)
+    text = text.replace('\\newline', '\n').replace('\\makenewline', '\n')
+    text = re.sub(r'\\LaTeX\b', 'LaTeX', text)
+    text = re.sub(r'\\([&%$#_])', r'\1', text)
+    text = text.replace('--', '-').replace('~', ' ')
+    # Any remaining command name, e.g. \ExternalLink, \tb
+    text = re.sub(r'\\[a-zA-Z@]+\*?', ' ', text)
+    text = text.replace('{', '').replace('}', '')
+    text = re.sub(r'\$[^$]*\$', ' ', text)
+
+    # Parentheses left empty by removed link icons
+    text = re.sub(r'\(\s*\)', '', text)
+    text = re.sub(r'\s+\)', ')', text)
+
+    lines = [re.sub(r'[ \t]+', ' ', line).strip() for line in text.splitlines()]
+    return '\n'.join(line for line in lines if line and line != '-')
+
+
+def _parse_items(section_source: str) -> List[Dict]:
+    """Extract \\cventry and \\cvitem items from one section body."""
+    items = []
+    for match in re.finditer(r'\\(cventry|cvitem)\b', section_source):
+        kind = match.group(1)
+        count = 6 if kind == 'cventry' else 2
+        args, _ = _read_arguments(section_source, match.end(), count)
+        args = [latex_to_text(arg) for arg in args] + [''] * (count - len(args))
+
+        if kind == 'cventry':
+            date, title, subtitle, organization, extra, description = args
+            organization = ', '.join(part for part in (subtitle, organization, extra) if part)
+            item = {
+                'type': 'cventry',
+                'date': date.replace('\n', ' '),
+                'title': title.replace('\n', ' '),
+                'organization': organization.replace('\n', ' '),
+                'description': description,
+            }
+            item['header'] = ' | '.join(part for part in (item['date'], item['title'], item['organization']) if part)
+            item['text'] = f"{item['header']}\n{description}".strip()
+        else:
+            label, description = args
+            item = {'type': 'cvitem', 'label': label, 'description': description}
+            item['text'] = f"{label}: {description}".strip(': \n') if label else description
+        if item['text']:
+            items.append(item)
+    return items
+
+
+def parse_cv(source: str) -> Dict:
+    """Parse moderncv source into the section model."""
+    source = strip_comments(source)
+    if r'\begin{document}' in source:
+        source = source.split(r'\begin{document}', 1)[1]
+    source = source.split(r'\end{document}', 1)[0]
+
+    sections = []
+    matches = list(re.finditer(r'\\section\s*\{([^}]*)\}', source))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(source)
+        title = latex_to_text(match.group(1)).replace('\n', ' ')
+        sections.append({'title': title, 'items': _parse_items(source[match.end():end])})
+
+    skills = []
+    publications = []
+    for section in sections:
+        lowered = section['title'].lower()
+        if any(key in lowered for key in SKILL_SECTION_TITLES):
+            for item in section['items']:
+                for line in item['description'].splitlines():
+                    if line.startswith('- '):
+                        skills.extend(_split_skill_line(line[2:]))
+        if any(key in lowered for key in PUBLICATION_SECTION_TITLES):
+            publications.extend(section['items'])
+
+    # Drop repeated skills, keeping the first spelling
+    seen = set()
+    unique_skills = []
+    for skill in skills:
+        if skill.lower() not in seen:
+            seen.add(skill.lower())
+            unique_skills.append(skill)
+
+    return {'sections': sections, 'skills': unique_skills, 'publications': publications}
+
+
+def _split_skill_line(line: str) -> List[str]:
+    """Split 'Gen AI: OpenAI SDK, Azure (LangChain, MLflow)' into individual skills."""
+    if ':' in line:
+        line = line.split(':', 1)[1]
+    # Split on commas outside parentheses, then unpack parenthesised lists
+    parts = re.split(r',\s*(?![^()]*\))', line)
+    skills = []
+    for part in parts:
+        inner = re.search(r'\(([^)]*)\)', part)
+        outer = re.sub(r'\([^)]*\)', '', part).strip()
+        if outer:
+            skills.append(outer)
+        if inner:
+            skills.extend(s.strip() for s in inner.group(1).split(',') if s.strip())
+    # Longer fragments are descriptions ("Building end-to-end ..."), not skills
+    return [skill for skill in skills if len(skill.split()) <= MAX_SKILL_WORDS]
+
+
+@lru_cache(maxsize=8)
+def _load_cv_model(path: str, mtime: float) -> Dict:
+    with open(path, 'r') as f:
+        return parse_cv(f.read())
+
+
+def load_cv_model(path: str) -> Dict:
+    """Parse a CV file once and reuse the model until the file changes."""
+    return _load_cv_model(path, os.path.getmtime(path))
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase content words used for relevance scoring."""
+    words = re.findall(r'[a-z][a-z0-9+#.\-]*[a-z0-9+#]|[a-z]', text.lower())
+    return [w for w in words if len(w) > 1 and w not in STOPWORDS]
+
+
+def rank_items(model: Dict, job_ad: str) -> List[Tuple[float, int, int]]:
+    """Score every item against the job ad.
+
+    Scores are a BM25-style sum of inverse document frequencies of the job
+    ad terms an item contains, so rare shared terms (e.g. 'pyspark') weigh
+    more than common ones. Returns (score, section index, item index) tuples,
+    best first.
+    """
+    job_terms = set(tokenize(job_ad))
+    documents = []
+    for s, section in enumerate(model['sections']):
+        for i, item in enumerate(section['items']):
+            documents.append(((s, i), Counter(tokenize(f"{section['title']} {item['text']}"))))
+
+    if not documents:
+        return []
+
+    document_frequency = Counter()
+    for _, terms in documents:
+        document_frequency.update(set(terms))
+
+    n = len(documents)
+    ranked = []
+    for (s, i), terms in documents:
+        length = sum(terms.values()) or 1
+        score = 0.0
+        for term in job_terms & set(terms):
+            idf = math.log(1 + (n - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+            tf = terms[term]
+            score += idf * tf * 2.2 / (tf + 1.2 * (0.25 + 0.75 * length / 60))
+        ranked.append((score, s, i))
+
+    ranked.sort(key=lambda entry: (-entry[0], entry[1], entry[2]))
+    return ranked
+
+
+def render_model(model: Dict, selected: Optional[set] = None, headers: Optional[set] = None) -> str:
+    """Render the model (or a selection of (section, item) indices) as plain text.
+
+    Items in ``headers`` but not ``selected`` are rendered by their header
+    line only.
+    """
+    headers = headers or set()
+    blocks = []
+    for s, section in enumerate(model['sections']):
+        items = [
+            item['text'] if selected is None or (s, i) in selected else item['header']
+            for i, item in enumerate(section['items'])
+            if selected is None or (s, i) in selected or (s, i) in headers
+        ]
+        if items:
+            blocks.append(f"## {section['title']}\n" + '\n\n'.join(items))
+    return '\n\n'.join(blocks)
+
+
+def select_relevant(model: Dict, job_ad: str, max_chars: int = 6000) -> str:
+    """Render only the parts of the CV that matter for a job ad.
+
+    The first item of every section (the intro, the most recent role, the
+    skills block) is always kept, and every other role or degree at least
+    by its header line, so no employment or education is hidden from the
+    model. The rest are added best-score first, then in their original
+    order, until ``max_chars`` is reached. Items keep their original order
+    in the output.
+    """
+    selected = set()
+    headers = set()
+    used = 0
+    for s, section in enumerate(model['sections']):
+        for i, item in enumerate(section['items']):
+            if i == 0:
+                selected.add((s, i))
+                used += len(item['text'])
+            elif item.get('header'):
+                headers.add((s, i))
+                used += len(item['header'])
+
+    def add(s: int, i: int):
+        nonlocal used
+        item = model['sections'][s]['items'][i]
+        size = len(item['text']) - (len(item['header']) if (s, i) in headers else 0)
+        if (s, i) not in selected and used + size <= max_chars:
+            selected.add((s, i))
+            used += size
+
+    for score, s, i in rank_items(model, job_ad):
+        if score > 0:
+            add(s, i)
+    # Leftover budget goes to the remaining items in CV order
+    for s, section in enumerate(model['sections']):
+        for i in range(len(section['items'])):
+            add(s, i)
+
+    return render_model(model, selected, headers)
@@ -1,13 +1,60 @@
 import os
+import re
 import json
-from typing import List, Dict
+from typing import Any, List, Dict, Optional, AsyncIterator, Tuple
 from io import BytesIO
 from src.utils.secure_openai import SecureOpenAIClient
+from src.cv_parser import load_cv_model, render_model, select_relevant
+from src.skill_extractor import SkillExtractor, load_taxonomy
+from src.utils.metrics import metrics
+from src.utils.job_ad import compact_job_ad
+from src.utils.structured_output import JsonFieldStream, invalid_fields, sub_schema, validate
+
+# Schema of the tailored CV response. Fields are generated in this order, so
+# keywords, gaps and the CV sections arrive before the notes and QA checks.
+TAILORED_CV_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "job_keywords": {"type": "array", "items": {"type": "string"}},
+        "gaps_and_risks": {"type": "array", "items": {"type": "string"}},
+        "sections": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "title": {"type": "string"},
+                    "content": {"type": "string"}
+                },
+                "required": ["title", "content"],
+                "additionalProperties": False
+            }
+        },
+        "notes_for_user": {"type": "array", "items": {"type": "string"}},
+        "qa_checks": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": ["job_keywords", "gaps_and_risks", "sections", "notes_for_user", "qa_checks"],
+    "additionalProperties": False
+}
+
+# Schema of a single regenerated CV section
+CV_SECTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "section": TAILORED_CV_SCHEMA["properties"]["sections"]["items"]
+    },
+    "required": ["section"],
+    "additionalProperties": False
+}
+
+SKILLS_SYSTEM_PROMPT = """
+Analyze the job advertisement provided by the user and extract a list of required skills,
+both technical and soft skills. Return them as a comma-separated list.
+"""
 
 class CVProcessor:
-    def __init__(self):
-        # Initialize secure OpenAI client
-        self.ai_client = SecureOpenAIClient()
+    def __init__(self, ai_client: Optional[SecureOpenAIClient] = None):
+        # Initialize secure OpenAI client (shared when one is passed in)
+        self.ai_client = ai_client or SecureOpenAIClient()
         
         # Load CV template and tailoring guide
         template_path = os.getenv('USER_CV_PATH', 'user_data/cv/user_cv.tex')
@@ -18,6 +65,37 @@ class CVProcessor:
         
         with open(guide_path, 'r') as f:
             self.tailoring_guide = f.read()
+        
+        # Structured CV model, parsed once. CV_PROMPT_MODE controls what is sent:
+        # 'relevant' - only the entries that match the job ad (per call)
+        # 'clean'    - the whole CV as plain text (part of the cached prefix)
+        # 'raw'      - the LaTeX source as-is
+        self.cv_model = load_cv_model(template_path)
+        self.cv_prompt_mode = os.getenv('CV_PROMPT_MODE', 'relevant').lower()
+        self.cv_prompt_max_chars = int(os.getenv('CV_PROMPT_MAX_CHARS', '6000'))
+        
+        # Ask for schema-constrained output; disable for endpoints without
+        # json_schema support (plain JSON mode is used instead)
+        self.cv_json_schema = os.getenv('CV_JSON_SCHEMA', 'true').lower() == 'true'
+        
+        # Local skill matching. SKILL_EXTRACTION selects the strategy:
+        # 'local'  - dictionary matching only, no API call
+        # 'hybrid' - local first; the LLM is asked only when local recall is low
+        # 'llm'    - always ask the model
+        self.skill_extraction = os.getenv('SKILL_EXTRACTION', 'hybrid').lower()
+        self.skill_recall_threshold = float(os.getenv('SKILL_RECALL_THRESHOLD', '0.6'))
+        self.skill_extractor = SkillExtractor(
+            cv_skills=self.cv_model['skills'],
+            taxonomy=load_taxonomy(os.getenv('SKILLS_TAXONOMY_PATH', 'user_data/templates/skills_taxonomy.yaml'))
+        )
+        
+        # Job ads are stripped of boilerplate and cut to JOB_AD_MAX_TOKENS
+        # (0 = no limit) before they are sent
+        self.compact_job_ads = os.getenv('JOB_AD_COMPACTION', 'true').lower() == 'true'
+        self.job_ad_max_tokens = int(os.getenv('JOB_AD_MAX_TOKENS', '2000'))
+        
+        # Stable prompt prefix shared by every tailoring call
+        self.tailor_system_prompt = self._build_tailor_system_prompt()
             
         # Output settings
         self.output_dir = os.getenv('OUTPUT_DIR', 'output')
@@ -27,42 +105,148 @@ class CVProcessor:
         self.save_intermediate = os.getenv('SAVE_INTERMEDIATE', 'false').lower() == 'true'
         self.debug_mode = os.getenv('DEBUG_MODE', 'false').lower() == 'true'
     
-    async def extract_skills(self, job_ad: str) -> List[str]:
-        """Extract relevant skills from the job advertisement."""
-        prompt = f"""
-        Analyze the following job advertisement and extract a list of required skills,
-        both technical and soft skills. Return them as a comma-separated list:
+    def prepare_job_ad(self, job_ad: str) -> str:
+        """The job ad as sent to the model: compacted unless JOB_AD_COMPACTION=false."""
+        if not self.compact_job_ads:
+            return job_ad
+        return compact_job_ad(job_ad, self.job_ad_max_tokens)['text']
+    
+    def extract_skills_local(self, job_ad: str) -> List[str]:
+        """Extract skills with the local dictionary matcher (no API call)."""
+        return self.skill_extractor.extract(job_ad)
+    
+    def needs_llm_skills(self, job_ad: str) -> bool:
+        """Whether extract_skills will call the model for this job ad."""
+        if self.skill_extraction == 'local':
+            return False
+        if self.skill_extraction == 'llm':
+            return True
+        return self.skill_extractor.estimate_recall(job_ad) < self.skill_recall_threshold
+    
+    async def extract_skills(self, job_ad: str, use_cache: bool = True) -> List[str]:
+        """Extract relevant skills from the job advertisement.
         
-        {job_ad}
+        In 'hybrid' mode the model's skills are merged after the local ones,
+        with synonyms folded onto the same spelling.
         """
+        local_skills = [] if self.skill_extraction == 'llm' else self.extract_skills_local(job_ad)
+        if not self.needs_llm_skills(job_ad):
+            metrics.increment('skill_extraction_total', source='local')
+            return local_skills
+        metrics.increment('skill_extraction_total', source='llm')
         
-        response = await self.ai_client.generate_completion(prompt)
-        skills = response.strip().split(',')
-        return [skill.strip() for skill in skills]
+        response = await self.ai_client.generate_completion(
+            self.prepare_job_ad(job_ad), use_cache=use_cache, system=SKILLS_SYSTEM_PROMPT
+        )
+        skills = [skill.strip() for skill in response.strip().split(',')]
+        return self.skill_extractor.merge(local_skills, skills)
     
-    async def tailor_cv(self, job_ad: str) -> Dict:
-        """Generate a tailored CV based on the job advertisement."""
-        prompt = f"""
-        Given the following CV template and tailoring guide, customize the CV for this job posting.
-        Parse and understand the CV content, focusing on the actual information rather than the formatting.
-        Follow the tailoring guide precisely and return the output in the specified JSON format.
+    def _build_tailor_system_prompt(self) -> str:
+        """Build the stable part of the tailoring prompt (instructions, CV, guide).
         
+        It is identical for every job ad, so the API can serve it from its
+        prompt cache. In 'relevant' mode the CV depends on the job ad and is
+        sent with it instead.
+        """
+        if self.cv_prompt_mode == 'relevant':
+            cv_block = ""
+        else:
+            cv_text = self.cv_template if self.cv_prompt_mode == 'raw' else render_model(self.cv_model)
+            cv_block = f"""
         Original CV:
-        {self.cv_template}
+        {cv_text}
+        """
         
+        return f"""
+        Given the following CV template and tailoring guide, customize the CV for the job posting provided by the user.
+        Parse and understand the CV content, focusing on the actual information rather than the formatting.
+        Follow the tailoring guide precisely and return the output in the specified JSON format.
+        Return a JSON object with the fields job_keywords, gaps_and_risks, sections (the tailored CV,
+        one {{"title", "content"}} entry per CV section, in order), notes_for_user and qa_checks.
+        {cv_block}
         Tailoring Guide:
         {self.tailoring_guide}
+        """
+    
+    def _build_tailor_prompt(self, job_ad: str) -> str:
+        """Build the per-call part of the tailoring prompt."""
+        job_ad = self.prepare_job_ad(job_ad)
+        cv_block = ""
+        if self.cv_prompt_mode == 'relevant':
+            relevant_cv = select_relevant(self.cv_model, job_ad, self.cv_prompt_max_chars)
+            cv_block = f"""
+        Original CV (entries most relevant to this job):
+        {relevant_cv}
+        """
         
+        return f"""{cv_block}
         Job Advertisement:
         {job_ad}
         """
+    
+    @property
+    def response_format(self) -> Dict:
+        """The response_format sent with tailoring requests."""
+        if not self.cv_json_schema:
+            return {"type": "json_object"}
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": "tailored_cv", "strict": True, "schema": TAILORED_CV_SCHEMA}
+        }
+    
+    @staticmethod
+    def sections_to_text(sections: List[Dict]) -> str:
+        """Plain-text CV from sections; titles stand alone so they render as headings."""
+        return "\n\n".join(
+            f"{section['title']}\n\n{section['content'].strip()}" for section in sections
+        )
+    
+    @staticmethod
+    def text_to_sections(text: str, titles: Optional[List[str]] = None) -> List[Dict]:
+        """Split an edited plain-text CV back into sections (inverse of sections_to_text).
+        
+        A standalone line is a heading if it is one of ``titles`` (the
+        sections before editing); without them, short lines are guessed.
+        """
+        sections = []
+        for block in re.split(r'\n\s*\n', text.strip()):
+            lines = [line for line in block.splitlines() if line.strip()]
+            if not lines:
+                continue
+            line = lines[0].strip()
+            if titles is not None:
+                is_title = len(lines) == 1 and line in titles
+            else:
+                is_title = len(lines) == 1 and len(line) < 60 and not line.endswith('.')
+            if is_title:
+                sections.append({'title': line, 'content': ''})
+                continue
+            if not sections:
+                sections.append({'title': '', 'content': ''})
+            content = sections[-1]['content']
+            sections[-1]['content'] = f"{content}\n\n{block.strip()}" if content else block.strip()
+        return sections
+    
+    def parse_cv_response(self, cv_data: str) -> Dict:
+        """Parse the model's JSON response into the tailored CV structure.
         
-        cv_data = await self.ai_client.generate_completion(prompt)
-        # Parse the JSON response
-        cv_json = json.loads(cv_data)
+        Raises ValueError when the response is not valid JSON or does not
+        match TAILORED_CV_SCHEMA; ``tailor_cv`` repairs such responses instead.
+        """
+        with metrics.span('parse_cv_json'):
+            cv_json = json.loads(cv_data)
         
-        # Generate documents using the structured data
+        errors = validate(TAILORED_CV_SCHEMA, cv_json)
+        if errors:
+            raise ValueError(f"Tailored CV does not match the schema: {'; '.join(errors[:5])}")
+        return self.build_cv_result(cv_json)
+    
+    def build_cv_result(self, cv_json: Dict) -> Dict:
+        """Build the tailored CV structure from validated response fields."""
         return {
+            # Plain-text CV consumed by the editor and DocumentMaker
+            'content': self.sections_to_text(cv_json['sections']),
+            'sections': cv_json['sections'],
             'analysis': {
                 'keywords': cv_json['job_keywords'],
                 'gaps': cv_json['gaps_and_risks'],
@@ -74,7 +258,178 @@ class CVProcessor:
                 'pdf': self._generate_pdf(cv_json)     # Human-readable version
             }
         }
+    
+    async def _repair_fields(self, job_ad: str, fields: Dict, bad_fields: List[str]) -> Dict:
+        """Ask the model again for only the fields that are missing or invalid.
         
+        The request shares the cached system prefix and the original prompt,
+        and the output is limited to the broken fields, so it costs a fraction
+        of regenerating the whole CV.
+        """
+        metrics.increment('cv_repair_total')
+        print(f"Tailored CV response incomplete or invalid; repairing fields: {', '.join(bad_fields)}")
+        
+        schema = sub_schema(TAILORED_CV_SCHEMA, bad_fields)
+        prompt = f"""{self._build_tailor_prompt(job_ad)}
+        A previous answer was missing or had invalid values for these fields: {', '.join(bad_fields)}.
+        Return a JSON object with only these fields.
+        """
+        response_format = (
+            {"type": "json_schema", "json_schema": {"name": "tailored_cv_repair", "strict": True, "schema": schema}}
+            if self.cv_json_schema else {"type": "json_object"}
+        )
+        response = await self.ai_client.generate_completion(
+            prompt, system=self.tailor_system_prompt, response_format=response_format
+        )
+        
+        repaired = dict(fields)
+        try:
+            repaired.update(json.loads(response))
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Repair of the tailored CV returned invalid JSON: {str(e)}")
+        
+        errors = validate(TAILORED_CV_SCHEMA, repaired)
+        if errors:
+            raise ValueError(f"Tailored CV is still invalid after repair: {'; '.join(errors[:5])}")
+        return repaired
+    
+    async def finalize_cv_response(self, job_ad: str, cv_data: str, fields: Optional[Dict] = None) -> Dict:
+        """Turn a (possibly truncated or malformed) response into the CV structure.
+        
+        Fields that were complete and valid are kept; only the others are
+        requested again.
+        """
+        if fields is None:
+            stream = JsonFieldStream()
+            with metrics.span('parse_cv_json'):
+                try:
+                    stream.feed(cv_data)
+                except json.JSONDecodeError:
+                    pass
+            fields = stream.fields
+        
+        fields = {key: value for key, value in fields.items() if key in TAILORED_CV_SCHEMA['properties']}
+        bad_fields = invalid_fields(TAILORED_CV_SCHEMA, fields)
+        if bad_fields:
+            fields = await self._repair_fields(job_ad, fields, bad_fields)
+        return self.build_cv_result(fields)
+    
+    async def tailor_cv(self, job_ad: str, use_cache: bool = True) -> Dict:
+        """Generate a tailored CV based on the job advertisement.
+
+        Pass ``use_cache=False`` to request a new version instead of the
+        cached one.
+        """
+        prompt = self._build_tailor_prompt(job_ad)
+        cv_data = await self.ai_client.generate_completion(
+            prompt, use_cache=use_cache, system=self.tailor_system_prompt,
+            response_format=self.response_format
+        )
+        return await self.finalize_cv_response(job_ad, cv_data)
+    
+    async def tailor_cv_fields(self, job_ad: str, use_cache: bool = True) -> AsyncIterator[Tuple[str, Optional[str], Any]]:
+        """Stream the tailored CV as parsed fields.
+        
+        Yields ``('item', field, value)`` for each element of a list field
+        (e.g. every CV section) and ``('field', field, value)`` for each
+        complete top-level field, as soon as it has been generated. The last
+        event is ``('result', None, result)`` with the same structure as
+        ``tailor_cv``, repaired if the stream was incomplete or invalid.
+        """
+        prompt = self._build_tailor_prompt(job_ad)
+        stream = JsonFieldStream()
+        parse_error = None
+        async for delta in self.ai_client.stream_completion(
+            prompt, use_cache=use_cache, system=self.tailor_system_prompt,
+            response_format=self.response_format
+        ):
+            if parse_error is not None:
+                continue
+            try:
+                events = stream.feed(delta)
+            except json.JSONDecodeError as e:
+                # Keep the fields parsed so far; the rest is repaired below
+                parse_error = e
+                continue
+            for event in events:
+                yield event
+        
+        yield 'result', None, await self.finalize_cv_response(job_ad, stream.buffer, stream.fields)
+    
+    async def tailor_cv_stream(self, job_ad: str, use_cache: bool = True) -> AsyncIterator[str]:
+        """Stream the raw tailored CV response as it is generated.
+
+        Join the deltas and pass the text to ``parse_cv_response`` for the
+        same result as ``tailor_cv``.
+        """
+        prompt = self._build_tailor_prompt(job_ad)
+        async for delta in self.ai_client.stream_completion(
+            prompt, use_cache=use_cache, system=self.tailor_system_prompt,
+            response_format=self.response_format
+        ):
+            yield delta
+        
+    async def regenerate_section(
+        self,
+        job_ad: str,
+        cv_result: Dict,
+        index: int,
+        instructions: str = ""
+    ) -> Dict:
+        """Rewrite one section of a tailored CV and return the updated CV.
+        
+        Only that section is requested: the job analysis and the other
+        sections are kept as they are, and the prompt starts with the same
+        prefix as the original tailoring call so it is served from the
+        prompt cache. ``instructions`` are optional user guidance for the
+        rewrite.
+        """
+        sections = list(cv_result['sections'])
+        section = sections[index]
+        keywords = cv_result.get('analysis', {}).get('keywords', [])
+        other_titles = [other['title'] for i, other in enumerate(sections) if i != index]
+        instructions_block = f"Instructions: {instructions}" if instructions else ""
+        
+        prompt = f"""{self._build_tailor_prompt(job_ad)}
+        Job keywords: {', '.join(keywords)}
+        
+        Rewrite only the "{section['title']}" section of the tailored CV. Keep its title and every fact,
+        and do not repeat what belongs in the other sections ({', '.join(other_titles)}).
+        {instructions_block}
+        
+        Current section:
+        {section['content']}
+        
+        Return a JSON object {{"section": {{"title": ..., "content": ...}}}}.
+        """
+        response_format = (
+            {"type": "json_schema", "json_schema": {"name": "cv_section", "strict": True, "schema": CV_SECTION_SCHEMA}}
+            if self.cv_json_schema else {"type": "json_object"}
+        )
+        
+        metrics.increment('regenerate_total', kind='cv_section')
+        response = await self.ai_client.generate_completion(
+            prompt, use_cache=False, system=self.tailor_system_prompt, response_format=response_format
+        )
+        
+        try:
+            section_json = json.loads(response)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Regenerated CV section is not valid JSON: {str(e)}")
+        errors = validate(CV_SECTION_SCHEMA, section_json)
+        if errors:
+            raise ValueError(f"Regenerated CV section does not match the schema: {'; '.join(errors[:5])}")
+        
+        sections[index] = section_json['section']
+        # 'formats' was rendered from the old section text, so it is dropped
+        # rather than passed on stale
+        result = {key: value for key, value in cv_result.items() if key != 'formats'}
+        return {
+            **result,
+            'content': self.sections_to_text(sections),
+            'sections': sections
+        }
+    
     def _generate_docx(self, content: str) -> bytes:
         """Generate a DOCX version of the CV optimized for ATS compatibility."""
         from docx import Document
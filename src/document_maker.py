@@ -1,10 +1,53 @@
+import io
 import os
-from docx import Document
-from docx.shared import Pt, Inches
+import copy
+import json
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import yaml
-from fpdf import FPDF
-from typing import Dict, List, Tuple
-import subprocess
+from typing import Dict, List, Optional, Tuple
+from src.latex_renderer import LatexRenderer, build_cv_body
+from src.utils.completion_cache import MemoryCache
+from src.utils.metrics import metrics
+
+# Fields of the CV / letter data that affect the rendered output
+RENDERED_FIELDS = {
+    'cv': ('content', 'sections'),
+    'letter': ('content',),
+}
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+# Styled blank DOCX documents by style section, built once per process
+_docx_templates = {}
+_docx_templates_lock = threading.Lock()
+
+
+def _warm_worker() -> int:
+    """Start a worker process and import the rendering libraries into it."""
+    import docx  # noqa: F401
+    import fpdf  # noqa: F401
+    return os.getpid()
+
+
+def get_render_pool(workers: int) -> ProcessPoolExecutor:
+    """Return the process-wide render pool, creating and warming it once."""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            # spawn avoids forking a process that holds Streamlit's threads
+            _render_pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            # Start every worker up front so python-docx and fpdf are imported
+            # before the first render instead of during it
+            for _ in range(workers):
+                _render_pool.submit(_warm_worker)
+        return _render_pool
 
 class DocumentMaker:
     def __init__(self):
@@ -22,115 +65,294 @@ class DocumentMaker:
             os.makedirs(self.output_dir)
             
         self.max_file_size = int(os.getenv('MAX_FILE_SIZE', '5')) * 1024 * 1024  # Convert MB to bytes
+        
+        # Rendered documents keyed by content, style and format, bounded by size
+        render_cache_mb = float(os.getenv('RENDER_CACHE_MAX_MB', '64'))
+        self.render_cache = None
+        if render_cache_mb > 0:
+            self.render_cache = MemoryCache(
+                max_entries=1024,
+                max_bytes=int(render_cache_mb * 1024 * 1024)
+            )
+        
+        # Optional process pool for rendering documents in parallel
+        self.render_pool = None
+        if os.getenv('RENDER_PARALLEL', 'false').lower() == 'true':
+            workers = int(os.getenv('RENDER_PROCESSES', '0')) or os.cpu_count() or 1
+            self.render_pool = get_render_pool(workers)
+        
+        # LaTeX rendering of the CV against the user's moderncv template
+        self.latex_renderer = None
+        if self.cv_format == 'latex':
+            self.latex_renderer = self._create_latex_renderer()
     
-    def create_cv_documents(self, cv_data: Dict) -> Tuple[bytes, bytes]:
-        """Create both DOCX and PDF versions of the CV."""
-        # Create DOCX version
-        docx_data = self._create_cv_docx(cv_data)
+    def _create_latex_renderer(self):
+        """Create the LaTeX renderer, or None if LaTeX is unavailable."""
+        engine = os.getenv('PDF_ENGINE', 'pdflatex')
+        if not LatexRenderer.is_available(engine):
+            print(f"{engine} not found; falling back to FPDF for the CV")
+            return None
+        
+        try:
+            return LatexRenderer(
+                os.getenv('USER_CV_PATH', 'user_data/cv/user_cv.tex'),
+                engine=engine,
+                timeout=float(os.getenv('LATEX_TIMEOUT', '30')),
+                max_file_size=self.max_file_size,
+                workers=int(os.getenv('LATEX_WORKERS', '2')),
+                cache_dir=os.path.join(self.output_dir, '.cache', 'latex')
+            )
+        except (OSError, ValueError) as e:
+            print(f"Error setting up LaTeX rendering: {str(e)}")
+            return None
+    
+    def _render_key(self, kind: str, data: Dict, fmt: str) -> str:
+        """Hash the rendered fields, the matching style section and the format."""
+        style_section = 'cv_style' if kind == 'cv' else 'cover_letter_style'
+        payload = json.dumps({
+            'kind': kind,
+            'format': fmt,
+            'latex': kind == 'cv' and fmt == 'pdf' and self.latex_renderer is not None,
+            'data': {field: data.get(field) for field in RENDERED_FIELDS[kind]},
+            'style': self.style_guide.get(style_section),
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def _local_renderer(self, kind: str, fmt: str):
+        """Return the in-process render method for a document kind and format."""
+        return {
+            ('cv', 'docx'): self._create_cv_docx,
+            ('cv', 'pdf'): self._create_cv_pdf,
+            ('letter', 'docx'): self._create_letter_docx,
+            ('letter', 'pdf'): self._create_letter_pdf,
+        }[(kind, fmt)]
+    
+    def _render_all(self, requests: List[Tuple[str, Dict, str]]) -> List[bytes]:
+        """Render (kind, data, format) requests, returning bytes in request order.
+        
+        Cached documents are served from the render cache. With a render pool,
+        the remaining documents are rendered in worker processes; the LaTeX
+        CV stays in-process because it has its own compile pool.
+        """
+        results: List[bytes] = [None] * len(requests)
+        keys = [None] * len(requests)
+        futures = {}
+        local = []
         
-        # Create PDF version using LaTeX
-        pdf_data = self._create_cv_pdf(cv_data)
+        for i, (kind, data, fmt) in enumerate(requests):
+            if self.render_cache is not None:
+                keys[i] = self._render_key(kind, data, fmt)
+                cached = self.render_cache.get(keys[i])
+                if cached is not None:
+                    metrics.increment('render_cache_hits_total', kind=kind, format=fmt)
+                    results[i] = cached
+                    continue
+            
+            uses_latex = kind == 'cv' and fmt == 'pdf' and self.latex_renderer is not None
+            if self.render_pool is not None and not uses_latex:
+                style_section = 'cv_style' if kind == 'cv' else 'cover_letter_style'
+                fields = {field: data.get(field) for field in RENDERED_FIELDS[kind]}
+                futures[i] = self.render_pool.submit(
+                    render_document, kind, fmt, self.style_guide[style_section], fields
+                )
+            else:
+                local.append(i)
+        
+        # Render in-process work while the pool is busy
+        for i in local:
+            kind, data, fmt = requests[i]
+            with metrics.span('render', kind=kind, format=fmt):
+                results[i] = self._local_renderer(kind, fmt)(data)
+        
+        with metrics.span('render_pool_wait'):
+            for i, future in futures.items():
+                results[i] = future.result()
         
+        if self.render_cache is not None:
+            for i in local + list(futures):
+                self.render_cache.set(keys[i], results[i])
+        
+        return results
+    
+    def render(self, kind: str, data: Dict, fmt: str) -> bytes:
+        """Render one document ('cv' or 'letter') in one format ('docx' or 'pdf')."""
+        if (kind, fmt) not in {('cv', 'docx'), ('cv', 'pdf'), ('letter', 'docx'), ('letter', 'pdf')}:
+            raise ValueError(f"Cannot render {kind!r} as {fmt!r}")
+        return self._render_all([(kind, data, fmt)])[0]
+
+    def create_cv_documents(self, cv_data: Dict) -> Tuple[bytes, bytes]:
+        """Create both DOCX and PDF versions of the CV."""
+        with metrics.span('create_cv_documents'):
+            docx_data, pdf_data = self._render_all([
+                ('cv', cv_data, 'docx'),
+                ('cv', cv_data, 'pdf'),
+            ])
         return docx_data, pdf_data
     
     def create_letter_documents(self, letters: List[Dict]) -> List[Tuple[bytes, bytes]]:
         """Create DOCX and PDF versions of each cover letter."""
-        documents = []
+        with metrics.span('create_letter_documents'):
+            rendered = self._render_all([
+                ('letter', letter, fmt)
+                for letter in letters
+                for fmt in ('docx', 'pdf')
+            ])
+        return [
+            (rendered[2 * i], rendered[2 * i + 1])
+            for i in range(len(letters))
+        ]
+    
+    def create_documents(self, cv_data: Dict, letters: List[Dict], previous: Optional[Dict] = None) -> Dict:
+        """Create the CV and every cover letter, re-rendering only what changed.
         
-        for letter in letters:
-            docx_data = self._create_letter_docx(letter)
-            pdf_data = self._create_letter_pdf(letter)
-            documents.append((docx_data, pdf_data))
+        Returns ``{'cv': (docx, pdf), 'letters': [(docx, pdf), ...]}`` plus
+        the render keys of each file. Pass the result back as ``previous``
+        after editing or regenerating one document: files whose content,
+        style and format are unchanged are reused as they are, whether or
+        not they are still in the render cache.
+        """
+        requests = [('cv', cv_data, 'docx'), ('cv', cv_data, 'pdf')] + [
+            ('letter', letter, fmt)
+            for letter in letters
+            for fmt in ('docx', 'pdf')
+        ]
+        keys = [self._render_key(*request) for request in requests]
+        reusable = dict(zip(previous['keys'], previous['files'])) if previous else {}
         
-        return documents
+        with metrics.span('create_documents'):
+            files = [reusable.get(key) for key in keys]
+            changed = [i for i, data in enumerate(files) if data is None]
+            for i, data in zip(changed, self._render_all([requests[i] for i in changed])):
+                files[i] = data
+        metrics.increment('render_reused_total', len(files) - len(changed))
+        
+        return {
+            'keys': keys,
+            'files': files,
+            'cv': (files[0], files[1]),
+            'letters': [(files[2 + 2 * i], files[3 + 2 * i]) for i in range(len(letters))],
+        }
     
     def _create_cv_docx(self, cv_data: Dict) -> bytes:
         """Create a DOCX version of the CV."""
-        doc = Document()
-        style = self.style_guide['cv_style']
-        
-        # Apply styles from style guide
-        for section in doc.sections:
-            section.left_margin = Inches(style['margins']['left'])
-            section.right_margin = Inches(style['margins']['right'])
-            section.top_margin = Inches(style['margins']['top'])
-            section.bottom_margin = Inches(style['margins']['bottom'])
-        
-        # Add content (implementation would depend on cv_data structure)
-        # This is a placeholder for the actual implementation
-        doc.add_heading('CV Title', 0)
-        
-        # Save to bytes
-        import io
-        doc_bytes = io.BytesIO()
-        doc.save(doc_bytes)
-        doc_bytes.seek(0)
-        return doc_bytes.read()
+        return render_cv_docx(self.style_guide['cv_style'], cv_data)
     
     def _create_cv_pdf(self, cv_data: Dict) -> bytes:
-        """Create a PDF version of the CV using FPDF."""
-        pdf = FPDF()
-        style = self.style_guide['cv_style']
-        
-        pdf.add_page()
-        pdf.set_margins(
-            style['margins']['left'] * 25.4,
-            style['margins']['top'] * 25.4,
-            style['margins']['right'] * 25.4
-        )
-        
-        # Add content
-        pdf.set_font(style['font']['main'], size=style['font']['size'])
-        pdf.multi_cell(0, style['spacing']['line_spacing'] * 10, cv_data['content'])
+        """Create a PDF version of the CV, using LaTeX when configured."""
+        if self.latex_renderer is not None:
+            try:
+                return self.latex_renderer.render(build_cv_body(cv_data))
+            except (RuntimeError, ValueError, OSError) as e:
+                print(f"Error rendering CV with LaTeX, falling back to FPDF: {str(e)}")
         
-        # Save to bytes
-        import io
-        pdf_bytes = io.BytesIO()
-        pdf.output(pdf_bytes)
-        pdf_bytes.seek(0)
-        return pdf_bytes.read()
+        return self._create_cv_fpdf(cv_data)
+    
+    def _create_cv_fpdf(self, cv_data: Dict) -> bytes:
+        """Create a PDF version of the CV using FPDF."""
+        return render_text_pdf(self.style_guide['cv_style'], cv_data['content'])
     
     def _create_letter_docx(self, letter: Dict) -> bytes:
         """Create a DOCX version of a cover letter."""
-        doc = Document()
-        style = self.style_guide['cover_letter_style']
-        
-        # Apply styles from style guide
-        for section in doc.sections:
-            section.left_margin = Inches(style['margins']['left'])
-            section.right_margin = Inches(style['margins']['right'])
-            section.top_margin = Inches(style['margins']['top'])
-            section.bottom_margin = Inches(style['margins']['bottom'])
-        
-        # Add content
-        doc.add_paragraph(letter['content'])
-        
-        # Save to bytes
-        import io
-        doc_bytes = io.BytesIO()
-        doc.save(doc_bytes)
-        doc_bytes.seek(0)
-        return doc_bytes.read()
+        return render_letter_docx(self.style_guide['cover_letter_style'], letter)
     
     def _create_letter_pdf(self, letter: Dict) -> bytes:
         """Create a PDF version of a cover letter."""
-        pdf = FPDF()
-        style = self.style_guide['cover_letter_style']
-        
-        pdf.add_page()
-        pdf.set_margins(
-            style['margins']['left'] * 25.4,
-            style['margins']['top'] * 25.4,
-            style['margins']['right'] * 25.4
-        )
-        
-        # Add content
-        pdf.set_font(style['font']['main'], size=style['font']['size'])
-        pdf.multi_cell(0, style['spacing']['line_spacing'] * 10, letter['content'])
-        
-        # Save to bytes
-        import io
-        pdf_bytes = io.BytesIO()
-        pdf.output(pdf_bytes)
-        pdf_bytes.seek(0)
-        return pdf_bytes.read()
\ No newline at end of file
+        return render_text_pdf(self.style_guide['cover_letter_style'], letter['content'])
+
+
+def _apply_docx_margins(doc, style: Dict):
+    """Apply the margins from a style section to every DOCX section."""
+    from docx.shared import Inches
+    
+    for section in doc.sections:
+        section.left_margin = Inches(style['margins']['left'])
+        section.right_margin = Inches(style['margins']['right'])
+        section.top_margin = Inches(style['margins']['top'])
+        section.bottom_margin = Inches(style['margins']['bottom'])
+
+
+def _docx_template(style: Dict):
+    """A blank DOCX with the style's margins, cloned from a per-process template.
+    
+    ``Document()`` parses python-docx's default package on every call;
+    deep-copying a prepared document skips that and the margin setup and
+    takes about half the time. The template itself is never written to.
+    """
+    from docx import Document
+    
+    key = json.dumps(style, sort_keys=True, default=str)
+    with _docx_templates_lock:
+        template = _docx_templates.get(key)
+        if template is None:
+            template = Document()
+            _apply_docx_margins(template, style)
+            _docx_templates[key] = template
+        return copy.deepcopy(template)
+
+
+def _docx_bytes(doc) -> bytes:
+    doc_bytes = io.BytesIO()
+    doc.save(doc_bytes)
+    doc_bytes.seek(0)
+    return doc_bytes.read()
+
+
+def render_cv_docx(style: Dict, cv_data: Dict) -> bytes:
+    """Render the CV as DOCX with the given style section."""
+    # Styled blank document with the margins from the style guide
+    doc = _docx_template(style)
+    
+    # One heading per tailored section, one paragraph per line
+    sections = cv_data.get('sections')
+    if not sections:
+        doc.add_heading('CV Title', 0)
+    for section in sections or []:
+        doc.add_heading(section['title'], level=1)
+        for line in section['content'].splitlines():
+            if line.strip():
+                doc.add_paragraph(line.strip())
+    
+    return _docx_bytes(doc)
+
+
+def render_letter_docx(style: Dict, letter: Dict) -> bytes:
+    """Render a cover letter as DOCX with the given style section."""
+    # Styled blank document with the margins from the style guide
+    doc = _docx_template(style)
+    
+    # Add content
+    doc.add_paragraph(letter['content'])
+    
+    return _docx_bytes(doc)
+
+
+def render_text_pdf(style: Dict, text: str) -> bytes:
+    """Render plain text as a PDF with FPDF and the given style section."""
+    from fpdf import FPDF
+    
+    pdf = FPDF()
+    
+    pdf.add_page()
+    pdf.set_margins(
+        style['margins']['left'] * 25.4,
+        style['margins']['top'] * 25.4,
+        style['margins']['right'] * 25.4
+    )
+    
+    # Add content
+    pdf.set_font(style['font']['main'], size=style['font']['size'])
+    pdf.multi_cell(0, style['spacing']['line_spacing'] * 10, text)
+    
+    # Save to bytes
+    pdf_bytes = io.BytesIO()
+    pdf.output(pdf_bytes)
+    pdf_bytes.seek(0)
+    return pdf_bytes.read()
+
+
+def render_document(kind: str, fmt: str, style: Dict, data: Dict) -> bytes:
+    """Render one document; the entry point for render pool workers."""
+    if fmt == 'docx':
+        render = render_cv_docx if kind == 'cv' else render_letter_docx
+        return render(style, data)
+    return render_text_pdf(style, data['content'])
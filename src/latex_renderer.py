@@ -0,0 +1,216 @@
+import os
+import re
+import shutil
+import hashlib
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import List, Optional
+
+BEGIN_DOCUMENT = r'\begin{document}'
+
+LATEX_SPECIAL_CHARS = {
+    '\\': r'\textbackslash{}',
+    '&': r'\&',
+    '%': r'\%',
+    '$': r'\$',
+    '#': r'\#',
+    '_': r'\_',
+    '{': r'\{',
+    '}': r'\}',
+    '~': r'\textasciitilde{}',
+    '^': r'\textasciicircum{}',
+}
+
+
+def escape_latex(text: str) -> str:
+    """Escape characters that have a special meaning in LaTeX."""
+    return ''.join(LATEX_SPECIAL_CHARS.get(c, c) for c in text)
+
+
+class LatexRenderer:
+    """Compile CV bodies against the user's moderncv preamble.
+
+    The preamble of the template (moderncv, fonts, custom commands) is dumped
+    into a format file once with ``mylatexformat``, so each compile only has
+    to process the document body. Compiles run in temporary directories on a
+    bounded worker pool.
+    """
+
+    def __init__(
+        self,
+        template_path: str,
+        engine: str = 'pdflatex',
+        timeout: float = 30,
+        max_file_size: int = 5 * 1024 * 1024,
+        workers: int = 2,
+        cache_dir: Optional[str] = None
+    ):
+        with open(template_path, 'r') as f:
+            template = f.read()
+
+        if BEGIN_DOCUMENT not in template:
+            raise ValueError(f"{template_path} has no {BEGIN_DOCUMENT}")
+
+        self.preamble, self.template_body = template.split(BEGIN_DOCUMENT, 1)
+        # Relative paths in the template (photo, logos) resolve against its folder
+        self.template_dir = os.path.dirname(os.path.abspath(template_path))
+
+        self.engine = engine
+        self.timeout = timeout
+        self.max_file_size = max_file_size
+        self.cache_dir = os.path.abspath(cache_dir or os.path.join(tempfile.gettempdir(), 'cv_tailor_latex'))
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        digest = hashlib.sha256(f"{engine}\n{self.preamble}".encode('utf-8')).hexdigest()[:16]
+        self.format_name = f"cvpreamble_{digest}"
+        self._format_ready: Optional[bool] = None
+        self._format_lock = threading.Lock()
+
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='latex')
+
+    @staticmethod
+    def is_available(engine: str = 'pdflatex') -> bool:
+        """Check whether the LaTeX engine is installed."""
+        return shutil.which(engine) is not None
+
+    def _env(self) -> dict:
+        env = os.environ.copy()
+        # A trailing separator keeps the default search paths
+        env['TEXINPUTS'] = f"{self.template_dir}{os.pathsep}"
+        env['TEXFORMATS'] = f"{self.cache_dir}{os.pathsep}"
+        return env
+
+    def _ensure_format(self) -> bool:
+        """Dump the preamble into a format file once per preamble and engine."""
+        with self._format_lock:
+            if self._format_ready is not None:
+                return self._format_ready
+
+            format_path = os.path.join(self.cache_dir, f"{self.format_name}.fmt")
+            if os.path.exists(format_path):
+                self._format_ready = True
+                return True
+
+            preamble_path = os.path.join(self.cache_dir, f"{self.format_name}.tex")
+            with open(preamble_path, 'w') as f:
+                f.write(self.preamble)
+                f.write(f"{BEGIN_DOCUMENT}\n\\end{{document}}\n")
+
+            try:
+                result = subprocess.run(
+                    [
+                        self.engine, '-ini', '-interaction=nonstopmode',
+                        f'-jobname={self.format_name}', f'&{self.engine}',
+                        'mylatexformat.ltx', preamble_path
+                    ],
+                    cwd=self.cache_dir,
+                    env=self._env(),
+                    capture_output=True,
+                    timeout=self.timeout
+                )
+                self._format_ready = result.returncode == 0 and os.path.exists(format_path)
+            except (OSError, subprocess.TimeoutExpired) as e:
+                print(f"Error dumping LaTeX preamble format: {str(e)}")
+                self._format_ready = False
+
+            if not self._format_ready:
+                print("Could not build the precompiled preamble; compiling the full document instead")
+            return self._format_ready
+
+    def _document(self, body: str) -> str:
+        # With the format loaded, mylatexformat skips everything up to
+        # \begin{document}, so the preamble costs nothing but keeps the
+        # file compilable without the format
+        return f"{self.preamble}{BEGIN_DOCUMENT}\n{body}\n\\end{{document}}\n"
+
+    def _compile(self, body: str) -> bytes:
+        use_format = self._ensure_format()
+
+        with tempfile.TemporaryDirectory(prefix='cv_tailor_') as work_dir:
+            tex_path = os.path.join(work_dir, 'cv.tex')
+            with open(tex_path, 'w') as f:
+                f.write(self._document(body))
+
+            command = [self.engine, '-interaction=nonstopmode', '-halt-on-error', 'cv.tex']
+            if use_format:
+                command.insert(1, f'-fmt={self.format_name}')
+
+            # A second pass resolves references such as "Page x of y"
+            for _ in range(2):
+                try:
+                    result = subprocess.run(
+                        command,
+                        cwd=work_dir,
+                        env=self._env(),
+                        capture_output=True,
+                        timeout=self.timeout
+                    )
+                except subprocess.TimeoutExpired:
+                    raise RuntimeError(f"LaTeX compilation timed out after {self.timeout}s")
+
+                if result.returncode != 0:
+                    log = result.stdout.decode('utf-8', errors='replace')
+                    errors = [line for line in log.splitlines() if line.startswith('!')]
+                    raise RuntimeError(f"LaTeX compilation failed: {'; '.join(errors[:3]) or 'see log'}")
+
+                with open(os.path.join(work_dir, 'cv.log'), 'r', errors='replace') as f:
+                    if not re.search(r'Rerun to get|Label\(s\) may have changed', f.read()):
+                        break
+
+            pdf_path = os.path.join(work_dir, 'cv.pdf')
+            size = os.path.getsize(pdf_path)
+            if size > self.max_file_size:
+                raise ValueError(
+                    f"Generated PDF is {size / 1024 / 1024:.1f} MB, above the {self.max_file_size / 1024 / 1024:.0f} MB limit"
+                )
+
+            with open(pdf_path, 'rb') as f:
+                return f.read()
+
+    def submit(self, body: str) -> Future:
+        """Queue a compile on the worker pool."""
+        return self._executor.submit(self._compile, body)
+
+    def render(self, body: str) -> bytes:
+        """Compile a document body to PDF bytes."""
+        return self.submit(body).result()
+
+    def render_many(self, bodies: List[str]) -> List[bytes]:
+        """Compile several bodies concurrently, keeping their order."""
+        futures = [self.submit(body) for body in bodies]
+        return [future.result() for future in futures]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def build_cv_body(cv_data: dict) -> str:
+    """Turn tailored CV data into a moderncv document body.
+
+    Structured ``sections`` become ``\\section`` headings with one
+    ``\\cvitem`` per paragraph. Otherwise the plain-text ``content`` is
+    escaped: short standalone lines become sections and other paragraphs
+    become ``\\cvitem`` entries.
+    """
+    parts = [r'\maketitle']
+    if cv_data.get('sections'):
+        for section in cv_data['sections']:
+            parts.append(f"\\section{{{escape_latex(section['title'])}}}")
+            for block in re.split(r'\n\s*\n', section['content'].strip()):
+                lines = [line.strip() for line in block.splitlines() if line.strip()]
+                if lines:
+                    text = r' \newline '.join(escape_latex(line) for line in lines)
+                    parts.append(f"\\cvitem{{}}{{{text}}}")
+        return '\n\n'.join(parts)
+    for block in re.split(r'\n\s*\n', cv_data.get('content', '').strip()):
+        lines = [line.strip() for line in block.splitlines() if line.strip()]
+        if not lines:
+            continue
+        if len(lines) == 1 and len(lines[0]) < 60 and not lines[0].endswith('.'):
+            parts.append(f"\\section{{{escape_latex(lines[0])}}}")
+        else:
+            text = r' \newline '.join(escape_latex(line) for line in lines)
+            parts.append(f"\\cvitem{{}}{{{text}}}")
+    return '\n\n'.join(parts)
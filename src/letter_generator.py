@@ -1,19 +1,41 @@
 import os
-from typing import List, Dict
+import json
+import asyncio
+from typing import Any, List, Dict, Optional, AsyncIterator, Tuple
 from src.utils.secure_openai import SecureOpenAIClient
+from src.utils.metrics import metrics
+from src.utils.job_ad import compact_job_ad
 
 class LetterGenerator:
-    def __init__(self):
-        # Initialize secure OpenAI client
-        self.ai_client = SecureOpenAIClient()
+    def __init__(self, ai_client: Optional[SecureOpenAIClient] = None):
+        # Initialize secure OpenAI client (shared when one is passed in)
+        self.ai_client = ai_client or SecureOpenAIClient()
         
         # Load style examples and settings
         examples_path = os.getenv('LETTER_EXAMPLES_PATH', 'user_data/cover_letters/style_examples.md')
         with open(examples_path, 'r') as f:
             self.style_examples = f.read()
+        
+        # Stable prompt prefix shared by every letter variant
+        self.system_prompt = self._build_system_prompt()
             
         self.tone = os.getenv('COVER_LETTER_TONE', 'professional')
         self.max_letters = int(os.getenv('MAX_COVER_LETTERS', '3'))
+
+        # Per-letter timeout in seconds; 0 disables it
+        letter_timeout = float(os.getenv('LETTER_TIMEOUT', '0'))
+        self.letter_timeout = letter_timeout if letter_timeout > 0 else None
+        
+        # Job ads are stripped of boilerplate and cut to JOB_AD_MAX_TOKENS
+        # (0 = no limit) before they are sent
+        self.compact_job_ads = os.getenv('JOB_AD_COMPACTION', 'true').lower() == 'true'
+        self.job_ad_max_tokens = int(os.getenv('JOB_AD_MAX_TOKENS', '2000'))
+        
+        # How variants are requested:
+        # 'fanout' - one request per variant (default)
+        # 'n'      - one request with n choices; the prompt is sent once
+        # 'json'   - one request returning a JSON array of letters with focus tags
+        self.generation_mode = os.getenv('LETTER_GENERATION_MODE', 'fanout').lower()
         
         # Output settings
         self.output_dir = os.getenv('OUTPUT_DIR', 'output')
@@ -23,19 +45,38 @@ class LetterGenerator:
         self.save_intermediate = os.getenv('SAVE_INTERMEDIATE', 'false').lower() == 'true'
         self.debug_mode = os.getenv('DEBUG_MODE', 'false').lower() == 'true'
     
-    async def generate_letters(self, job_ad: str, num_variants: int = 3) -> List[Dict]:
-        """Generate multiple versions of cover letters."""
+    def _build_system_prompt(self) -> str:
+        """Build the stable part of the letter prompt (instructions and style examples).
+        
+        It is shared by every variant and job ad, so the API can serve it from
+        its prompt cache.
+        """
+        return f"""
+        Create a cover letter for the job posting provided by the user.
+        Use the style examples provided to maintain a natural, human-like tone.
+        Each letter should be unique but maintain similar quality and professionalism.
+        
+        Style Examples:
+        {self.style_examples}
+        """
+    
+    def prepare_job_ad(self, job_ad: str) -> str:
+        """The job ad as sent to the model: compacted unless JOB_AD_COMPACTION=false."""
+        if not self.compact_job_ads:
+            return job_ad
+        return compact_job_ad(job_ad, self.job_ad_max_tokens)['text']
+    
+    def _build_prompts(self, job_ad: str, num_variants: int) -> List[str]:
+        """Build the per-variant part of each letter prompt.
+        
+        The job ad comes before the variant line so all variants share the
+        longest possible prefix.
+        """
+        job_ad = self.prepare_job_ad(job_ad)
         prompts = []
         
         for i in range(num_variants):
             prompt = f"""
-            Create a cover letter for the following job posting.
-            Use the style examples provided to maintain a natural, human-like tone.
-            Each letter should be unique but maintain similar quality and professionalism.
-            
-            Style Examples:
-            {self.style_examples}
-            
             Job Advertisement:
             {job_ad}
             
@@ -43,8 +84,118 @@ class LetterGenerator:
             """
             prompts.append(prompt)
         
+        return prompts
+    
+    def _build_single_prompt(self, job_ad: str) -> str:
+        """Prompt for 'n' mode: every choice answers the same prompt."""
+        job_ad = self.prepare_job_ad(job_ad)
+        return f"""
+        Job Advertisement:
+        {job_ad}
+        
+        Write one cover letter. Choose your own angle (e.g. technical depth, impact, motivation),
+        as several independent drafts are written from this prompt and should differ.
+        """
+    
+    def _build_json_prompt(self, job_ad: str, num_variants: int) -> str:
+        """Prompt for 'json' mode: all variants in one structured response."""
+        job_ad = self.prepare_job_ad(job_ad)
+        return f"""
+        Job Advertisement:
+        {job_ad}
+        
+        Write {num_variants} cover letters, each with a different approach/focus.
+        Return a JSON object of the form
+        {{"letters": [{{"focus": "<short focus tag>", "content": "<full letter>"}}, ...]}}
+        with exactly {num_variants} letters.
+        """
+    
+    def parse_letters_json(self, response: str, num_variants: int) -> List[Dict]:
+        """Parse a 'json' mode response into letter dicts with a 'focus' tag."""
+        letters = json.loads(response)['letters'][:num_variants]
+        # Number the letters after dropping empty ones, so versions have no gaps
+        letters = [letter for letter in letters if letter.get('content')]
+        return [
+            {
+                'content': letter['content'],
+                'version': i + 1,
+                'focus': letter.get('focus', '')
+            }
+            for i, letter in enumerate(letters)
+        ]
+    
+    async def _generate_letters_single_request(
+        self,
+        job_ad: str,
+        num_variants: int,
+        use_cache: bool
+    ) -> List[Dict]:
+        """Get all variants from one request ('n' or 'json' mode)."""
+        if self.generation_mode == 'n':
+            request = self.ai_client.generate_choices(
+                self._build_single_prompt(job_ad),
+                num_variants,
+                use_cache=use_cache,
+                system=self.system_prompt
+            )
+        else:
+            # One completion holds every letter
+            request = self.ai_client.generate_completion(
+                self._build_json_prompt(job_ad, num_variants),
+                max_tokens=self.ai_client.max_tokens * num_variants,
+                use_cache=use_cache,
+                system=self.system_prompt,
+                response_format={"type": "json_object"}
+            )
+        
+        try:
+            response = await asyncio.wait_for(request, self.letter_timeout)
+        except asyncio.TimeoutError:
+            raise RuntimeError(f"No cover letter variants were generated within {self.letter_timeout}s")
+        
+        if self.generation_mode == 'n':
+            return [
+                {'content': content, 'version': i + 1}
+                for i, content in enumerate(content for content in response if content)
+            ]
+        return self.parse_letters_json(response, num_variants)
+    
+    async def generate_letters(
+        self,
+        job_ad: str,
+        num_variants: int = 3,
+        first_k: Optional[int] = None,
+        use_cache: bool = True
+    ) -> List[Dict]:
+        """Generate multiple versions of cover letters.
+
+        With ``first_k``, return as soon as that many variants are ready.
+        Variants that time out or are cancelled are left out, so the result
+        may hold fewer than ``num_variants`` letters. Pass ``use_cache=False``
+        to request new variants instead of the cached ones.
+        
+        In 'n' and 'json' modes all variants come from a single request, so
+        ``first_k`` does not apply.
+        """
+        if self.generation_mode in ('n', 'json'):
+            try:
+                letters = await self._generate_letters_single_request(job_ad, num_variants, use_cache)
+            except (json.JSONDecodeError, KeyError, TypeError) as e:
+                print(f"Error parsing cover letters, falling back to one request per variant: {str(e)}")
+                letters = []
+            if letters:
+                return letters
+        
+        prompts = self._build_prompts(job_ad, num_variants)
+        
         # Generate all letters in parallel for better performance
-        responses = await self.ai_client.generate_multiple_completions(prompts)
+        responses = await self.ai_client.generate_multiple_completions(
+            prompts,
+            first_k=first_k,
+            timeout=self.letter_timeout,
+            use_cache=use_cache,
+            system=self.system_prompt
+        )
         
         letters = [
             {
@@ -52,6 +203,166 @@ class LetterGenerator:
                 'version': i + 1
             }
             for i, content in enumerate(responses)
+            if content is not None
         ]
         
-        return letters
\ No newline at end of file
+        if not letters:
+            raise RuntimeError("No cover letter variants were generated in time")
+        
+        return letters
+    
+    async def regenerate_letter(
+        self,
+        job_ad: str,
+        letter: Dict,
+        num_variants: int = 3,
+        instructions: str = ""
+    ) -> Dict:
+        """Generate a new version of one cover letter variant.
+        
+        The other variants are left alone. Without ``instructions`` the
+        variant's original prompt is sent again for a fresh draft; with them,
+        the current draft is revised accordingly. Either way the prompt
+        starts with the prompt of the original request in the current
+        LETTER_GENERATION_MODE, so that prefix is served from the prompt
+        cache.
+        """
+        version = letter.get('version', 1)
+        if self.generation_mode == 'n':
+            prompt = self._build_single_prompt(job_ad)
+        elif self.generation_mode == 'json':
+            prompt = self._build_json_prompt(job_ad, max(num_variants, version)) + f"""
+            Instead of the JSON object, write only letter {version} as plain text.
+            """
+        else:
+            prompt = self._build_prompts(job_ad, max(num_variants, version))[version - 1]
+        if letter.get('focus'):
+            prompt += f"\n            Focus: {letter['focus']}\n"
+        if instructions:
+            prompt += f"""
+            Revise the current draft below. Instructions: {instructions}
+            
+            Current draft:
+            {letter['content']}
+            """
+        
+        metrics.increment('regenerate_total', kind='letter')
+        try:
+            content = await asyncio.wait_for(
+                self.ai_client.generate_completion(prompt, use_cache=False, system=self.system_prompt),
+                self.letter_timeout
+            )
+        except asyncio.TimeoutError:
+            raise RuntimeError(f"Cover letter {version} was not regenerated within {self.letter_timeout}s")
+        
+        return {**letter, 'content': content}
+    
+    async def adapt_letters(self, job_ad: str, letters: List[Dict]) -> List[Dict]:
+        """Adapt letters written for a near-identical job ad (e.g. a repost) to ``job_ad``.
+        
+        Each letter is revised in place rather than written from scratch,
+        so details that differ (company, title, requirements) are updated
+        and the rest is kept.
+        """
+        instructions = (
+            "The letter was written for a near-identical posting of this position. "
+            "Update only what differs in the job advertisement above (company name, job title, "
+            "requirements) and keep everything else."
+        )
+        return list(await asyncio.gather(*(
+            self.regenerate_letter(job_ad, letter, len(letters), instructions)
+            for letter in letters
+        )))
+    
+    async def generate_letters_stream(
+        self,
+        job_ad: str,
+        num_variants: int = 3,
+        use_cache: bool = True
+    ) -> AsyncIterator[Tuple[str, Optional[int], Any]]:
+        """Stream all cover letter variants concurrently.
+
+        Yields ``('delta', version, text)`` as text arrives from any variant
+        and ``('dropped', version, None)`` for a variant that did not finish
+        within LETTER_TIMEOUT; its text so far should be discarded. The last
+        event is ``('result', None, letters)`` with the same structure as
+        ``generate_letters``, including 'focus' tags in 'json' mode. In 'n'
+        mode the variants stream from one request and are numbered from 1 as
+        their text arrives, so empty choices leave no gaps; in 'json' mode
+        each letter is yielded whole once the response is parsed.
+        """
+        if self.generation_mode == 'json':
+            letters = await self.generate_letters(job_ad, num_variants, use_cache=use_cache)
+            for letter in letters:
+                yield 'delta', letter['version'], letter['content']
+            yield 'result', None, letters
+            return
+        
+        texts: Dict[int, str] = {}
+        dropped = set()
+        if self.generation_mode == 'n':
+            versions: Dict[int, int] = {}
+            async for index, delta in self.ai_client.stream_choices(
+                self._build_single_prompt(job_ad),
+                num_variants,
+                use_cache=use_cache,
+                system=self.system_prompt
+            ):
+                if not delta:
+                    continue
+                version = versions.setdefault(index, len(versions) + 1)
+                texts[version] = texts.get(version, '') + delta
+                yield 'delta', version, delta
+        else:
+            prompts = self._build_prompts(job_ad, num_variants)
+            queue = asyncio.Queue()
+            done = object()
+            
+            async def stream(version: int, prompt: str):
+                async for delta in self.ai_client.stream_completion(
+                    prompt, use_cache=use_cache, system=self.system_prompt
+                ):
+                    await queue.put((version, delta))
+            
+            async def pump(version: int, prompt: str):
+                try:
+                    # One slow variant is dropped instead of holding up the others
+                    await asyncio.wait_for(stream(version, prompt), self.letter_timeout)
+                except asyncio.TimeoutError:
+                    print(f"Error generating cover letter {version}: not finished within {self.letter_timeout}s")
+                    dropped.add(version)
+                finally:
+                    await queue.put((version, done))
+            
+            tasks = [
+                asyncio.ensure_future(pump(i + 1, prompt))
+                for i, prompt in enumerate(prompts)
+            ]
+            
+            try:
+                remaining = len(tasks)
+                while remaining:
+                    version, delta = await queue.get()
+                    if delta is done:
+                        remaining -= 1
+                        if version in dropped:
+                            yield 'dropped', version, None
+                        continue
+                    texts[version] = texts.get(version, '') + delta
+                    yield 'delta', version, delta
+                
+                # Surface the first streaming error, if any
+                for task in tasks:
+                    task.result()
+            finally:
+                for task in tasks:
+                    task.cancel()
+        
+        letters = [
+            {'content': texts[version], 'version': version}
+            for version in sorted(texts)
+            if version not in dropped and texts[version]
+        ]
+        if not letters:
+            raise RuntimeError("No cover letter variants were generated in time")
+        yield 'result', None, letters
@@ -0,0 +1,67 @@
+"""Process-wide shared processors.
+
+Streamlit re-executes app.py on every interaction. Building the processors
+there re-reads the CV, tailoring guide, style examples and style YAML each
+time and opens a new HTTP connection pool per client. The getters below
+build each object once per process and share a single SecureOpenAIClient,
+so every processor uses the same connection pool and completion cache.
+They are shared by all browser sessions too: the client's scheduler and
+the job runner keep sessions from starving each other.
+"""
+import threading
+from typing import Optional
+from src.utils.secure_openai import SecureOpenAIClient
+from src.cv_processor import CVProcessor
+from src.letter_generator import LetterGenerator
+from src.document_maker import DocumentMaker
+from src.utils.job_index import JobIndex, create_job_index
+from src.utils.background import JobRunner
+
+_lock = threading.RLock()
+_instances = {}
+
+
+def _get_or_create(name: str, factory):
+    with _lock:
+        if name not in _instances:
+            _instances[name] = factory()
+        return _instances[name]
+
+
+def get_ai_client() -> SecureOpenAIClient:
+    """Return the shared OpenAI client."""
+    return _get_or_create('ai_client', SecureOpenAIClient)
+
+
+def get_cv_processor() -> CVProcessor:
+    """Return the shared CV processor."""
+    return _get_or_create('cv_processor', lambda: CVProcessor(ai_client=get_ai_client()))
+
+
+def get_letter_generator() -> LetterGenerator:
+    """Return the shared cover letter generator."""
+    return _get_or_create('letter_generator', lambda: LetterGenerator(ai_client=get_ai_client()))
+
+
+def get_document_maker() -> DocumentMaker:
+    """Return the shared document maker."""
+    return _get_or_create('document_maker', DocumentMaker)
+
+
+def get_job_index() -> Optional[JobIndex]:
+    """Return the shared index of processed job ads, or None when disabled."""
+    return _get_or_create('job_index', create_job_index)
+
+
+def get_job_runner() -> JobRunner:
+    """Return the shared background job runner."""
+    return _get_or_create('job_runner', JobRunner)
+
+
+def reset():
+    """Drop the shared instances, e.g. after editing files under user_data/."""
+    with _lock:
+        client = _instances.get('ai_client')
+        if client is not None:
+            client.cleanup()
+        _instances.clear()
@@ -0,0 +1,268 @@
+"""Local skill extraction from job ads.
+
+Skills are found with an Aho-Corasick automaton over a dictionary built
+from the skills section of the user's CV and a taxonomy file. The taxonomy
+maps canonical skill names to synonyms, e.g.::
+
+    Kubernetes: [k8s]
+    Machine Learning: [ML, machine-learning]
+
+Every synonym folds into its canonical name, so 'k8s' and 'Kubernetes' in a
+job ad both come out as 'Kubernetes'. Matching one ad takes well under a
+millisecond, against a full round trip for the LLM extraction.
+"""
+import os
+import re
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import yaml
+
+# Used when no taxonomy file is configured or found. Synonyms are only
+# other spellings of the same skill; related but distinct skills (Scrum and
+# Agile, GitHub and Git) are separate entries.
+DEFAULT_TAXONOMY = {
+    'Python': ['python3'],
+    'SQL': [],
+    'PySpark': ['spark python'],
+    'Apache Spark': ['spark'],
+    'Databricks': [],
+    'Pandas': [],
+    'NumPy': [],
+    'scikit-learn': ['sklearn', 'scikit learn'],
+    'PyTorch': ['torch'],
+    'TensorFlow': [],
+    'Machine Learning': ['ml', 'machine-learning'],
+    'Deep Learning': [],
+    'Natural Language Processing': ['nlp'],
+    'Large Language Models': ['llm', 'llms', 'large language model'],
+    'Generative AI': ['genai', 'gen ai'],
+    'Retrieval-Augmented Generation': ['rag'],
+    'MLOps': ['ml ops'],
+    'MLflow': [],
+    'LangChain': [],
+    'Data Engineering': [],
+    'Data Analysis': ['data analytics'],
+    'Analytics': [],
+    'Data Visualization': ['visualization', 'visualisation', 'data visualisation'],
+    'ETL': ['etl pipelines', 'elt', 'data pipelines'],
+    'Airflow': ['apache airflow'],
+    'dbt': [],
+    'Kafka': ['apache kafka'],
+    'Azure': ['microsoft azure'],
+    'AWS': ['amazon web services'],
+    'GCP': ['google cloud', 'google cloud platform'],
+    'Docker': [],
+    'Containers': ['containerization', 'containerisation'],
+    'Kubernetes': ['k8s'],
+    'Terraform': [],
+    'CI/CD': ['continuous integration', 'continuous delivery', 'continuous deployment'],
+    'Git': [],
+    'GitHub': [],
+    'GitLab': [],
+    'Linux': [],
+    'Unix': [],
+    'Bash': ['shell scripting'],
+    'REST APIs': ['rest api', 'restful'],
+    'Java': [],
+    'Scala': [],
+    'JavaScript': ['js'],
+    'TypeScript': [],
+    'C++': ['cpp'],
+    'MATLAB': [],
+    'Tableau': [],
+    'Power BI': ['powerbi'],
+    'Statistics': ['statistical analysis', 'statistical modelling', 'statistical modeling'],
+    'Agile': [],
+    'Scrum': [],
+    'Kanban': [],
+    'JIRA': [],
+    'Communication': ['communication skills', 'communicate'],
+    'Teamwork': ['team player', 'collaboration', 'collaborative'],
+    'Leadership': ['project leadership', 'team lead'],
+    'Stakeholder Management': [],
+    'Stakeholders': ['stakeholder'],
+    'Problem Solving': ['problem-solving', 'analytical thinking'],
+    'Mentoring': ['mentor', 'coaching'],
+    'English': [],
+    'German': [],
+}
+
+WORD_CHARS = re.compile(r'[a-z0-9+#]')
+
+
+def normalize(text: str) -> str:
+    """Lowercase and fold separators so spelling variants compare equal."""
+    text = text.lower()
+    text = re.sub('[‐-―]', '-', text)
+    text = re.sub(r'[-_]', ' ', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def load_taxonomy(path: Optional[str]) -> Dict[str, List[str]]:
+    """Read a {canonical: [synonyms]} taxonomy, falling back to the built-in one."""
+    if not path or not os.path.exists(path):
+        return DEFAULT_TAXONOMY
+
+    try:
+        with open(path, 'r') as f:
+            data = yaml.safe_load(f) or {}
+    except (OSError, yaml.YAMLError) as e:
+        print(f"Error loading skills taxonomy: {str(e)}")
+        return DEFAULT_TAXONOMY
+
+    return {
+        str(canonical): [str(synonym) for synonym in (synonyms or [])]
+        for canonical, synonyms in data.items()
+    }
+
+
+class SkillMatcher:
+    """Aho-Corasick automaton matching many skill patterns in one pass."""
+
+    def __init__(self, patterns: Dict[str, str]):
+        # patterns: normalized pattern -> canonical skill name
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[int, str]]] = [[]]
+
+        for pattern, canonical in patterns.items():
+            if pattern:
+                self._add(pattern, canonical)
+        self._build_failure_links()
+
+    def _add(self, pattern: str, canonical: str):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((len(pattern), canonical))
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                # Patterns that end here via a shorter suffix
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find(self, text: str) -> List[Tuple[int, int, str]]:
+        """Return non-overlapping whole-word matches as (start, end, canonical).
+
+        ``text`` must already be normalized. Where matches overlap, the
+        longest wins, so 'apache spark' is not also reported as 'spark'.
+        """
+        matches = []
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for length, canonical in self._output[state]:
+                start, end = i - length + 1, i + 1
+                if self._is_word_boundary(text, start, end):
+                    matches.append((start, end, canonical))
+
+        matches.sort(key=lambda m: (m[0], -(m[1] - m[0])))
+        selected = []
+        last_end = -1
+        for start, end, canonical in matches:
+            if start >= last_end:
+                selected.append((start, end, canonical))
+                last_end = end
+        return selected
+
+    @staticmethod
+    def _is_word_boundary(text: str, start: int, end: int) -> bool:
+        # Only enforce a boundary on sides where the pattern itself is a word
+        # character, so '.net' still matches inside 'asp.net'
+        if WORD_CHARS.match(text[start]) and start > 0 and WORD_CHARS.match(text[start - 1]):
+            return False
+        if WORD_CHARS.match(text[end - 1]) and end < len(text) and WORD_CHARS.match(text[end]):
+            return False
+        return True
+
+
+class SkillExtractor:
+    """Extract skills from a job ad without calling the model.
+
+    The dictionary combines the CV skills (kept in the CV's spelling) with
+    the taxonomy. ``estimate_recall`` tells how much of the ad's requirement
+    lines the dictionary covers, which decides whether the LLM is needed.
+    """
+
+    def __init__(self, cv_skills: Optional[List[str]] = None, taxonomy: Optional[Dict[str, List[str]]] = None):
+        taxonomy = DEFAULT_TAXONOMY if taxonomy is None else taxonomy
+
+        patterns = {}
+        for canonical, synonyms in taxonomy.items():
+            for variant in [canonical] + list(synonyms):
+                patterns.setdefault(normalize(variant), canonical)
+
+        # CV skills take precedence, so matches read like the user's own CV
+        canonical_names = {normalize(name): name for name in taxonomy}
+        for skill in cv_skills or []:
+            key = normalize(skill)
+            if key in canonical_names or key not in patterns:
+                patterns[key] = skill
+            for variant in taxonomy.get(canonical_names.get(key, ''), []):
+                patterns[normalize(variant)] = skill
+
+        # Simple plurals: 'data pipeline' also matches 'data pipelines'
+        for key, canonical in list(patterns.items()):
+            if len(key) > 3 and key[-1].isalpha() and not key.endswith('s'):
+                patterns.setdefault(f"{key}s", canonical)
+
+        self.patterns = patterns
+        self.matcher = SkillMatcher(patterns)
+
+    def canonicalize(self, skill: str) -> str:
+        """Fold a skill name onto its dictionary spelling, if it has one."""
+        return self.patterns.get(normalize(skill), skill.strip())
+
+    def extract(self, job_ad: str) -> List[str]:
+        """Skills mentioned in the job ad, in order of first mention."""
+        skills = []
+        seen = set()
+        for _, _, canonical in self.matcher.find(normalize(job_ad)):
+            if canonical not in seen:
+                seen.add(canonical)
+                skills.append(canonical)
+        return skills
+
+    def estimate_recall(self, job_ad: str) -> float:
+        """Share of the ad's requirement lines that contain a known skill.
+
+        Requirement lines are bullet points, or every non-trivial line when
+        the ad has none. A low share means the ad asks for things the
+        dictionary does not know about.
+        """
+        lines = [line.strip() for line in job_ad.splitlines() if line.strip()]
+        bullets = [line for line in lines if re.match(r'^([-*•▪●]|\d+[.)])\s*', line)]
+        candidates = bullets or [line for line in lines if len(line.split()) >= 4]
+        if not candidates:
+            return 0.0
+        covered = sum(1 for line in candidates if self.matcher.find(normalize(line)))
+        return covered / len(candidates)
+
+    def merge(self, local_skills: List[str], model_skills: List[str]) -> List[str]:
+        """Combine local and model skills, folding synonyms and dropping repeats."""
+        merged = []
+        seen = set()
+        for skill in list(local_skills) + [self.canonicalize(s) for s in model_skills]:
+            key = normalize(skill)
+            if skill and key not in seen:
+                seen.add(key)
+                merged.append(skill)
+        return merged
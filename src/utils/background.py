@@ -0,0 +1,280 @@
+"""Background execution of long-running jobs on a persistent event loop.
+
+Streamlit runs each interaction on the script thread, and ``asyncio.run``
+there blocks the page until generation finishes. Jobs submitted to the
+``JobRunner`` run on one event loop in a daemon thread instead; the page
+polls their progress and can cancel them, which cancels the task and so
+aborts its in-flight HTTP requests. The loop lives for the whole process,
+so the OpenAI client keeps one connection pool across jobs and sessions.
+
+At most ``MAX_ACTIVE_JOBS`` jobs run at once; the rest wait in an
+admission queue and report their position instead of failing, with
+sessions that have fewer running jobs admitted first.
+"""
+import os
+import time
+import uuid
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Coroutine, Dict, List, Optional
+from src.utils.metrics import metrics
+from src.utils.rate_limiter import request_session
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+ADMISSION_POLL_INTERVAL = 0.05
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """Return the process-wide background event loop, starting its thread once."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name='background-jobs', daemon=True)
+            thread.start()
+            _loop = loop
+        return _loop
+
+
+class JobProgress:
+    """Thread-safe progress of a job: per-stage completion and partial results.
+
+    The job updates it from the event loop; the page reads ``snapshot()``
+    from the script thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages: Dict[str, float] = {}
+        self.message = ''
+        self.partial: Dict[str, Any] = {}
+
+    def stage(self, name: str, fraction: float = 0.0, message: Optional[str] = None):
+        """Report ``name`` as ``fraction`` (0-1) complete."""
+        with self._lock:
+            self.stages[name] = max(0.0, min(1.0, fraction))
+            if message is not None:
+                self.message = message
+
+    def set(self, key: str, value: Any):
+        """Publish a partial result, e.g. a draft streamed so far."""
+        with self._lock:
+            self.partial[key] = value
+
+    @property
+    def fraction(self) -> float:
+        with self._lock:
+            return sum(self.stages.values()) / len(self.stages) if self.stages else 0.0
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'stages': dict(self.stages),
+                'message': self.message,
+                'partial': dict(self.partial),
+            }
+
+
+class Job:
+    """A coroutine running on the background loop."""
+
+    def __init__(self, name: str, key: Optional[str] = None, session: Optional[str] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.key = key
+        self.session = session
+        self.progress = JobProgress()
+        self.status = PENDING
+        self.result = None
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self._future: Optional[Future] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in (PENDING, RUNNING)
+
+    def cancel(self) -> bool:
+        """Cancel the job; its task is cancelled, aborting in-flight requests."""
+        if self._future is None or not self.active:
+            return False
+        return self._future.cancel()
+
+    def wait(self, timeout: Optional[float] = None) -> Any:
+        """Block until the job finishes and return its result (mainly for scripts)."""
+        return self._future.result(timeout)
+
+
+class JobRunner:
+    """Run jobs on the background loop and track them by ID.
+
+    Submitting a job whose ``key`` matches an active job returns that job
+    instead of starting a duplicate. API calls made by a job are attributed
+    to its ``session`` for the scheduler's fair sharing. Finished jobs are
+    dropped after ``retention`` seconds.
+    """
+
+    def __init__(
+        self,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+        retention: float = 3600,
+        max_active: Optional[int] = None
+    ):
+        self.loop = loop or get_background_loop()
+        self.retention = retention
+        # Jobs running at once (0 for no limit); the rest are queued
+        self.max_active = int(os.getenv('MAX_ACTIVE_JOBS', '4')) if max_active is None else max_active
+        self._jobs: Dict[str, Job] = {}
+        self._queue = deque()
+        self._session_active: Dict[Optional[str], int] = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        name: str,
+        make_coroutine: Callable[[JobProgress], Awaitable[Any]],
+        key: Optional[str] = None,
+        session: Optional[str] = None
+    ) -> Job:
+        """Queue ``make_coroutine(progress)`` to run in the background."""
+        with self._lock:
+            self._prune()
+            if key is not None:
+                for job in self._jobs.values():
+                    if job.key == key and job.active:
+                        return job
+            job = Job(name, key, session)
+            self._jobs[job.id] = job
+            self._queue.append(job)
+
+        async def run():
+            try:
+                await self._admit(job)
+            except asyncio.CancelledError:
+                job.status = CANCELLED
+                job.finished = time.time()
+                raise
+
+            job.status = RUNNING
+            start = time.perf_counter()
+            try:
+                with request_session(session):
+                    job.result = await make_coroutine(job.progress)
+                job.status = DONE
+            except asyncio.CancelledError:
+                job.status = CANCELLED
+                raise
+            except Exception as e:
+                print(f"Error in background job {name}: {str(e)}")
+                job.error = str(e)
+                job.status = FAILED
+            finally:
+                self._finish(job)
+                job.finished = time.time()
+                metrics.observe('background_job_seconds', time.perf_counter() - start,
+                                job=name, status=job.status)
+            return job.result
+
+        job._future = asyncio.run_coroutine_threadsafe(run(), self.loop)
+        job._future.add_done_callback(lambda future: self._on_done(job, future))
+        return job
+
+    def _next_queued(self) -> Optional[Job]:
+        """The queued job to admit next: least-busy session first, then oldest."""
+        best, best_key = None, None
+        for order, job in enumerate(self._queue):
+            key = (self._session_active.get(job.session, 0), order)
+            if best_key is None or key < best_key:
+                best, best_key = job, key
+        return best
+
+    async def _admit(self, job: Job):
+        """Wait in the admission queue until ``job`` may start."""
+        start = time.monotonic()
+        try:
+            while True:
+                with self._lock:
+                    has_slot = self.max_active <= 0 or sum(self._session_active.values()) < self.max_active
+                    if has_slot and self._next_queued() is job:
+                        self._queue.remove(job)
+                        self._session_active[job.session] = self._session_active.get(job.session, 0) + 1
+                        break
+                await asyncio.sleep(ADMISSION_POLL_INTERVAL)
+        except BaseException:
+            with self._lock:
+                if job in self._queue:
+                    self._queue.remove(job)
+            raise
+        metrics.observe('job_queue_seconds', time.monotonic() - start, job=job.name)
+
+    def _finish(self, job: Job):
+        with self._lock:
+            remaining = self._session_active.get(job.session, 0) - 1
+            if remaining > 0:
+                self._session_active[job.session] = remaining
+            else:
+                self._session_active.pop(job.session, None)
+
+    def position(self, job_id: str) -> Optional[int]:
+        """1-based place of a queued job in the admission order, or None if not queued."""
+        with self._lock:
+            queued = list(self._queue)
+            order = sorted(
+                range(len(queued)),
+                key=lambda i: (self._session_active.get(queued[i].session, 0), i)
+            )
+            for place, i in enumerate(order, 1):
+                if queued[i].id == job_id:
+                    return place
+        return None
+
+    def run_now(self, coroutine: Coroutine, session: Optional[str] = None, timeout: Optional[float] = None) -> Any:
+        """Run a short coroutine on the background loop and wait for its result.
+
+        Meant for single quick calls from the script thread: it skips the
+        admission queue but shares the loop's connection pool and the
+        session's fair share of API calls.
+        """
+        async def run():
+            with request_session(session):
+                return await coroutine
+
+        return asyncio.run_coroutine_threadsafe(run(), self.loop).result(timeout)
+
+    def _on_done(self, job: Job, future: Future):
+        # A job cancelled before it started never reaches run()
+        if future.cancelled() and job.active:
+            with self._lock:
+                if job in self._queue:
+                    self._queue.remove(job)
+            job.status = CANCELLED
+            job.finished = time.time()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.get(job_id)
+        return job.cancel() if job is not None else False
+
+    def jobs(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished is not None and job.finished < cutoff]:
+            del self._jobs[job_id]
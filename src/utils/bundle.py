@@ -0,0 +1,69 @@
+"""ZIP bundles of the rendered CV and cover letters.
+
+The archive is written entry by entry as the rendered files are handed
+over, never assembled as a second copy of all documents first:
+``write_bundle`` streams into any writable file (a file on disk in batch
+mode) and ``iter_bundle`` yields the archive in pieces as each entry is
+added, for streamed HTTP responses. DOCX and PDF files are compressed
+already, so entries are stored rather than deflated and bundling costs
+about as much as copying the bytes.
+"""
+import io
+import zipfile
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+BUNDLE_NAME = 'application_documents.zip'
+
+
+def document_files(documents: Dict, versions: Optional[List[int]] = None) -> Iterator[Tuple[str, bytes]]:
+    """(file name, bytes) of every document from ``DocumentMaker.create_documents``.
+
+    Letters are numbered by ``versions`` when given, otherwise from 1.
+    """
+    cv_docx, cv_pdf = documents['cv']
+    yield 'tailored_cv.docx', cv_docx
+    yield 'tailored_cv.pdf', cv_pdf
+    versions = versions or range(1, len(documents['letters']) + 1)
+    for version, (docx, pdf) in zip(versions, documents['letters']):
+        yield f'cover_letter_{version}.docx', docx
+        yield f'cover_letter_{version}.pdf', pdf
+
+
+def write_bundle(file, files: Iterable[Tuple[str, bytes]]) -> int:
+    """Write ``files`` as a ZIP to a path or writable file; returns the number of entries."""
+    count = 0
+    with zipfile.ZipFile(file, 'w', compression=zipfile.ZIP_STORED) as bundle:
+        for name, data in files:
+            bundle.writestr(name, data)
+            count += 1
+    return count
+
+
+class _ChunkSink(io.RawIOBase):
+    """Unseekable file that hands written bytes out via ``take``."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def iter_bundle(files: Iterable[Tuple[str, bytes]]) -> Iterator[bytes]:
+    """Yield a ZIP of ``files`` in pieces, each entry as soon as it is written."""
+    sink = _ChunkSink()
+    # An unseekable target makes zipfile stream entries with data descriptors
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as bundle:
+        for name, data in files:
+            bundle.writestr(name, data)
+            yield sink.take()
+    yield sink.take()
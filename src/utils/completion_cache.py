@@ -0,0 +1,236 @@
+import os
+import time
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Any
+
+
+def make_cache_key(**params) -> str:
+    """Hash request parameters into a stable cache key.
+
+    The key is a digest, so prompts are never stored in the clear as keys.
+    """
+    payload = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class MemoryCache:
+    """Thread-safe in-memory LRU cache with an optional TTL.
+
+    Besides ``max_entries``, the cache can be bounded by ``max_bytes``,
+    counting the length of ``str``/``bytes`` values.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: Optional[float] = None,
+                 max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _size(value: Any) -> int:
+        return len(value) if isinstance(value, (str, bytes)) else 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any):
+        size = self._size(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (expires_at, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                self._pop(next(iter(self._entries)))
+
+    def _pop(self, key: str):
+        _, value = self._entries.pop(key)
+        self._bytes -= self._size(value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class EncryptedDiskCache:
+    """On-disk cache whose entries are encrypted with Fernet.
+
+    Fernet tokens carry their creation time, so the TTL is enforced on
+    decryption. The directory is trimmed oldest-first once it grows past
+    ``max_bytes``.
+    """
+
+    def __init__(self, directory: str, encryption_key: str, ttl: Optional[float] = None,
+                 max_bytes: int = 50 * 1024 * 1024):
+        from cryptography.fernet import Fernet
+
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._fernet = Fernet(encryption_key)
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.bin")
+
+    def get(self, key: str) -> Optional[str]:
+        from cryptography.fernet import InvalidToken
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                token = f.read()
+        except FileNotFoundError:
+            return None
+
+        try:
+            ttl = int(self.ttl) if self.ttl else None
+            value = self._fernet.decrypt(token, ttl=ttl).decode('utf-8')
+        except InvalidToken:
+            # Expired or written with another key
+            self._remove(path)
+            return None
+
+        # Refresh mtime so eviction is least-recently-used
+        os.utime(path)
+        return value
+
+    def set(self, key: str, value: str):
+        token = self._fernet.encrypt(value.encode('utf-8'))
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(token)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def clear(self):
+        with self._lock:
+            for name in os.listdir(self.directory):
+                if name.endswith('.bin'):
+                    self._remove(os.path.join(self.directory, name))
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.directory):
+                if not name.endswith('.bin'):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class CompletionCache:
+    """Two-level completion cache: memory in front of an optional disk store."""
+
+    def __init__(self, memory: MemoryCache, disk: Optional[EncryptedDiskCache] = None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, key: str, value: str):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value)
+            except OSError as e:
+                print(f"Error writing completion cache: {str(e)}")
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+
+def create_completion_cache() -> Optional[CompletionCache]:
+    """Build the completion cache from environment settings.
+
+    Returns None when caching is disabled. The encrypted disk backend is only
+    used when ``SAVE_INTERMEDIATE=true``; otherwise nothing leaves memory.
+    """
+    if os.getenv('CACHE_ENABLED', 'true').lower() != 'true':
+        return None
+
+    ttl = float(os.getenv('CACHE_TTL', '3600')) or None
+    memory = MemoryCache(
+        max_entries=int(os.getenv('CACHE_MAX_ENTRIES', '256')),
+        ttl=ttl
+    )
+
+    backend = os.getenv('CACHE_BACKEND', 'memory').lower()
+    save_intermediate = os.getenv('SAVE_INTERMEDIATE', 'false').lower() == 'true'
+    if backend != 'disk' or not save_intermediate:
+        return CompletionCache(memory)
+
+    encryption_key = os.getenv('CACHE_ENCRYPTION_KEY')
+    if not encryption_key:
+        print("CACHE_ENCRYPTION_KEY is not set; using the in-memory completion cache only")
+        return CompletionCache(memory)
+
+    try:
+        disk = EncryptedDiskCache(
+            os.path.join(os.getenv('OUTPUT_DIR', 'output'), '.cache', 'completions'),
+            encryption_key,
+            ttl=ttl,
+            max_bytes=int(float(os.getenv('CACHE_MAX_DISK_MB', '50')) * 1024 * 1024)
+        )
+    except ImportError:
+        print("cryptography is not installed; using the in-memory completion cache only")
+        return CompletionCache(memory)
+    except ValueError as e:
+        print(f"Invalid CACHE_ENCRYPTION_KEY ({str(e)}); using the in-memory completion cache only")
+        return CompletionCache(memory)
+
+    return CompletionCache(memory, disk)
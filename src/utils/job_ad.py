@@ -0,0 +1,224 @@
+"""Job ad preprocessing: local token estimates and compaction before prompting.
+
+Pasted job ads carry page chrome ("Apply now", cookie banners), equal
+opportunity and privacy statements, generic perks under the benefits
+heading and paragraphs repeated by the job board. None of it helps
+tailoring, yet it is sent with every skills, CV and letter request. ``compact_job_ad`` drops those lines,
+repeated paragraphs and lines and excess whitespace, then cuts the ad to
+a token budget at a line boundary. The result depends only on the input
+and budget, so every request for the same ad shares the same prompt prefix.
+
+Tokens are counted with tiktoken when it is installed and estimated as
+one per four characters otherwise.
+"""
+import os
+import re
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from src.utils.metrics import metrics, TOKEN_BUCKETS
+
+# Whole lines that are page chrome rather than content
+CHROME_LINE = re.compile(
+    r"(apply( now| for this job)?|easy apply|save( job)?|saved|share( this job)?|report( this)? job|"
+    r"sign in|log ?in|register|show (more|less)|see more|read more|back to (search|results|jobs).*|"
+    r"accept( all)?( cookies)?|reject( all)?|decline|cookie settings|manage (cookies|preferences)|"
+    r"privacy policy|terms( of (use|service))?|follow us.*|similar jobs|jobs you may like|"
+    r"\d+ (applicants?|views?)|posted \d+ \w+ ago|promoted|actively recruiting)[.!:]?",
+    re.IGNORECASE
+)
+
+# Standard statements found anywhere in a line. Each is anchored to the
+# wording of the statement itself, so duties that mention the same topics
+# ("maintain the privacy policy", "handle accommodation requests") stay.
+STATEMENT = re.compile(
+    r"equal (employment )?opportunit(y|ies) employer|"
+    r"without regard to (race|age|religion|gender|sex|color|colour|national origin)|"
+    r"(all )?qualified applicants will receive consideration|"
+    r"reasonable accommodations? (will be|are|is|can be) (provided|available|made)|"
+    r"(need|require|request) (a )?reasonable accommodations? (during|for|in|throughout) the "
+    r"(application|interview|hiring|recruitment|selection) process|"
+    r"we (use|are using) cookies|this (web)?site uses cookies|by (continuing|clicking).{0,40}cookies|"
+    r"(read|see|review|view|consult|refer to|accept|agree to|in accordance with|described in|set out in|"
+    r"according to) (our|the|this) (job |applicant |candidate |recruitment )?(data protection|privacy) "
+    r"(notice|statement|policy)|"
+    r"we (will |may )?(collect,? (and |store and )?)?(process|store|use) your (personal )?data (in accordance|as described|for the purpose)|"
+    r"we (do not|don't|will not) accept (unsolicited )?(cvs|resumes|applications|candidates) from "
+    r"(third[- ]party |recruitment |staffing )?agencies",
+    re.IGNORECASE
+)
+
+# Headings of the paragraph listing the benefits of the job
+BENEFITS_HEADING = re.compile(
+    r"(our |your |the )?(benefits|perks)( (and|&) (benefits|perks))?|(what )?we offer( you)?|"
+    r"what you (get|can expect)|what's in it for you|why (join|work with) us",
+    re.IGNORECASE
+)
+
+# Short lines listing generic perks, dropped in the benefits paragraph only
+PERK = re.compile(
+    r"\b(free (snacks|fruit|drinks|coffee|lunch(es)?)|gym (membership|discount)|wellpass|urban sports|"
+    r"pension (scheme|plan)|401\(?k\)?|(dental|vision) (insurance|plan|cover)|(private|supplementary) health insurance|"
+    r"employee (discounts?|assistance)|team (events|lunches)|company (events|parties)|"
+    r"public transport (ticket|pass)|jobrad|bike leasing|table tennis|foosball)\b",
+    re.IGNORECASE
+)
+PERK_MAX_CHARS = 150
+
+# Repeated lines shorter than this are kept (headings, single skills)
+DUPLICATE_MIN_CHARS = 20
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+
+def _get_encoder():
+    """tiktoken encoding for GPT_MODEL, or False when tiktoken is unavailable."""
+    global _encoder
+    with _encoder_lock:
+        if _encoder is None:
+            try:
+                import tiktoken
+                try:
+                    _encoder = tiktoken.encoding_for_model(os.getenv('GPT_MODEL', 'gpt-4.1-mini'))
+                except KeyError:
+                    _encoder = tiktoken.get_encoding('o200k_base')
+            except Exception as e:
+                # Not installed, or the encoding could not be loaded (offline)
+                if not isinstance(e, ImportError):
+                    print(f"Error loading tiktoken encoding, estimating tokens from length: {str(e)}")
+                _encoder = False
+        return _encoder
+
+
+def estimate_tokens(text: str) -> int:
+    """Number of tokens in ``text``: exact with tiktoken, about chars / 4 without."""
+    encoder = _get_encoder()
+    if encoder:
+        return len(encoder.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    encoder = _get_encoder()
+    if encoder:
+        return encoder.decode(encoder.encode(text, disallowed_special=())[:max_tokens])
+    return text[:max_tokens * 4]
+
+
+def _normalize(line: str) -> str:
+    return re.sub(r'[^a-z0-9]+', ' ', line.lower()).strip()
+
+
+def _is_boilerplate(line: str, in_benefits: bool = False) -> bool:
+    bare = line.strip(' \t-*•·>|')
+    return bool(
+        CHROME_LINE.fullmatch(bare)
+        or STATEMENT.search(line)
+        or (in_benefits and len(line) <= PERK_MAX_CHARS and PERK.search(line))
+    )
+
+
+def _is_benefits_heading(line: str) -> bool:
+    return bool(BENEFITS_HEADING.fullmatch(line.strip(' \t#*:.!-')))
+
+
+@lru_cache(maxsize=128)
+def _compact(job_ad: str, max_tokens: int) -> Tuple[str, int, int, int, int, bool]:
+    original_tokens = estimate_tokens(job_ad)
+
+    text = job_ad.replace('\r\n', '\n').replace('\r', '\n')
+    text = re.sub(r'[\u200b\u200c\u200d\ufeff]', '', text)
+
+    paragraphs: List[List[str]] = [[]]
+    for raw_line in text.split('\n'):
+        line = re.sub(r'[ \t\xa0]+', ' ', raw_line).strip()
+        if line:
+            paragraphs[-1].append(line)
+        elif paragraphs[-1]:
+            paragraphs.append([])
+
+    kept_paragraphs: List[str] = []
+    seen = set()
+    seen_paragraphs = set()
+    removed = duplicates = 0
+    heading_only = False
+    for paragraph in paragraphs:
+        # The benefits paragraph starts with its heading, or follows it alone
+        starts_benefits = bool(paragraph) and _is_benefits_heading(paragraph[0])
+        in_benefits = heading_only or starts_benefits
+        heading_only = starts_benefits and len(paragraph) == 1
+        # A paragraph repeated as a whole goes, however short its lines
+        paragraph_key = _normalize('\n'.join(paragraph))
+        if paragraph_key in seen_paragraphs:
+            duplicates += len(paragraph)
+            continue
+        seen_paragraphs.add(paragraph_key)
+        lines = []
+        repeated = 0
+        for line in paragraph:
+            if _is_boilerplate(line, in_benefits):
+                removed += 1
+                continue
+            key = _normalize(line)
+            if len(key) >= DUPLICATE_MIN_CHARS:
+                if key in seen:
+                    repeated += 1
+                    continue
+                seen.add(key)
+            lines.append(line)
+        duplicates += repeated
+        # A repeated paragraph goes with its heading and other short lines
+        if repeated and all(len(_normalize(line)) < DUPLICATE_MIN_CHARS for line in lines):
+            duplicates += len(lines)
+            continue
+        if lines:
+            kept_paragraphs.append('\n'.join(lines))
+
+    text = '\n\n'.join(kept_paragraphs)
+    truncated = False
+    if max_tokens > 0 and estimate_tokens(text) > max_tokens:
+        truncated = True
+        kept: List[str] = []
+        used = 0
+        for line in text.split('\n'):
+            cost = estimate_tokens(line) + 1
+            if used + cost > max_tokens:
+                if not kept:
+                    # A single line over budget is cut inside the line
+                    kept.append(_truncate(line, max_tokens))
+                break
+            kept.append(line)
+            used += cost
+        text = '\n'.join(kept).strip()
+
+    return text, original_tokens, estimate_tokens(text), removed, duplicates, truncated
+
+
+def compact_job_ad(job_ad: str, max_tokens: Optional[int] = None, record: bool = True) -> Dict:
+    """Strip boilerplate and repeated lines from a job ad and fit it to a token budget.
+
+    ``max_tokens`` defaults to ``JOB_AD_MAX_TOKENS``; 0 means no budget.
+    Returns the compacted ``text`` with ``original_tokens``, ``tokens``,
+    ``saved_tokens``, the number of ``removed_lines`` (boilerplate) and
+    ``duplicate_lines``, and whether the ad was ``truncated`` to fit.
+    Results are cached, so calling it once per request is cheap. Pass
+    ``record=False`` when only reporting the savings, so the metrics count
+    prompts rather than page views.
+    """
+    if max_tokens is None:
+        max_tokens = int(os.getenv('JOB_AD_MAX_TOKENS', '2000'))
+    text, original_tokens, tokens, removed, duplicates, truncated = _compact(job_ad, max_tokens)
+    if record:
+        # Recorded per prompt, not inside the cache, so every request counts
+        metrics.increment('job_ad_tokens_saved_total', original_tokens - tokens)
+        metrics.observe('job_ad_tokens', tokens, buckets=TOKEN_BUCKETS)
+    return {
+        'text': text,
+        'original_tokens': original_tokens,
+        'tokens': tokens,
+        'saved_tokens': original_tokens - tokens,
+        'removed_lines': removed,
+        'duplicate_lines': duplicates,
+        'truncated': truncated,
+    }
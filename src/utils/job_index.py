@@ -0,0 +1,196 @@
+"""Near-duplicate detection for job ads with MinHash and LSH.
+
+The same position is often posted on several boards with small wording
+changes. Each processed ad is indexed by a MinHash signature of its word
+shingles; locality-sensitive hashing over bands of the signature finds
+candidates in constant time, and the share of matching signature values
+estimates their Jaccard similarity. Entries keep the generated results so
+a repost can reuse them instead of paying for a full generation cycle.
+
+The index lives in memory; with ``SAVE_INTERMEDIATE=true`` it is also
+written to ``OUTPUT_DIR/job_index.json`` and survives restarts.
+"""
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# Mersenne prime larger than any 61-bit shingle hash
+_PRIME = (1 << 61) - 1
+_WORD = re.compile(r"[a-z0-9][a-z0-9+#./-]*")
+
+
+def shingles(text: str, size: int = 3) -> set:
+    """Word ``size``-grams of the lower-cased text; short texts fall back to words."""
+    words = _WORD.findall(text.lower())
+    if len(words) < size:
+        return set(words)
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class MinHasher:
+    """MinHash signatures from ``num_perm`` universal hash functions."""
+
+    def __init__(self, num_perm: int = 128, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.params = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)]
+
+    def signature(self, items: set) -> List[int]:
+        if not items:
+            return [_PRIME] * self.num_perm
+        hashes = [
+            int.from_bytes(hashlib.blake2b(item.encode('utf-8'), digest_size=8).digest(), 'little') & _PRIME
+            for item in items
+        ]
+        return [min((a * h + b) % _PRIME for h in hashes) for a, b in self.params]
+
+
+def estimate_similarity(first: List[int], second: List[int]) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    if not first or len(first) != len(second):
+        return 0.0
+    return sum(a == b for a, b in zip(first, second)) / len(first)
+
+
+class JobIndex:
+    """Index of processed job ads and their results, queried by similarity.
+
+    ``bands`` splits each signature for LSH; with 128 values in 32 bands of
+    4, ads above roughly 0.5 similarity become candidates, and ``find``
+    keeps those at or above ``threshold``.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        threshold: float = 0.8,
+        num_perm: int = 128,
+        bands: int = 32,
+        max_entries: int = 500
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.path = path
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_entries = max_entries
+        self.hasher = MinHasher(num_perm)
+
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict] = {}
+        self._buckets: Dict[Tuple[int, int], set] = {}
+        if path:
+            self._load()
+
+    def signature(self, job_ad: str) -> List[int]:
+        return self.hasher.signature(shingles(job_ad))
+
+    def _band_keys(self, signature: List[int]) -> List[Tuple[int, int]]:
+        return [
+            (band, hash(tuple(signature[band * self.rows:(band + 1) * self.rows])))
+            for band in range(self.bands)
+        ]
+
+    def find(self, job_ad: str, signature: Optional[List[int]] = None) -> List[Tuple[float, Dict]]:
+        """Indexed ads similar to ``job_ad``, most similar first, as (similarity, entry)."""
+        signature = signature or self.signature(job_ad)
+        with self._lock:
+            candidates = set()
+            for key in self._band_keys(signature):
+                candidates |= self._buckets.get(key, set())
+            matches = [
+                (estimate_similarity(signature, self._entries[entry_id]['signature']), self._entries[entry_id])
+                for entry_id in candidates
+            ]
+        matches = [(similarity, entry) for similarity, entry in matches if similarity >= self.threshold]
+        return sorted(matches, key=lambda match: match[0], reverse=True)
+
+    def add(self, job_ad: str, results: Dict, signature: Optional[List[int]] = None) -> str:
+        """Index ``job_ad`` with its JSON-serialisable ``results``; returns the entry ID."""
+        signature = signature or self.signature(job_ad)
+        entry_id = hashlib.sha256(job_ad.strip().encode('utf-8')).hexdigest()[:16]
+        entry = {
+            'id': entry_id,
+            'title': next((line.strip() for line in job_ad.splitlines() if line.strip()), '')[:120],
+            'created': time.time(),
+            'signature': signature,
+            'results': results,
+        }
+        with self._lock:
+            self._remove(entry_id)
+            self._insert(entry)
+            while len(self._entries) > self.max_entries:
+                oldest = min(self._entries.values(), key=lambda e: e['created'])
+                self._remove(oldest['id'])
+            self._save()
+        return entry_id
+
+    def _insert(self, entry: Dict):
+        self._entries[entry['id']] = entry
+        for key in self._band_keys(entry['signature']):
+            self._buckets.setdefault(key, set()).add(entry['id'])
+
+    def _remove(self, entry_id: str):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for key in self._band_keys(entry['signature']):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Error loading job index, starting empty: {str(e)}")
+            return
+        for entry in entries:
+            if len(entry.get('signature', [])) == self.hasher.num_perm:
+                self._insert(entry)
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(list(self._entries.values()), f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Error writing job index: {str(e)}")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def create_job_index() -> Optional[JobIndex]:
+    """Build the job index from environment settings, or None when disabled.
+
+    It is only written to disk when ``SAVE_INTERMEDIATE=true``, since the
+    entries hold the generated CV and letters.
+    """
+    if os.getenv('JOB_INDEX_ENABLED', 'true').lower() != 'true':
+        return None
+
+    path = None
+    if os.getenv('SAVE_INTERMEDIATE', 'false').lower() == 'true':
+        path = os.path.join(os.getenv('OUTPUT_DIR', 'output'), 'job_index.json')
+
+    return JobIndex(
+        path=path,
+        threshold=float(os.getenv('JOB_DUPLICATE_THRESHOLD', '0.8')),
+        max_entries=int(os.getenv('JOB_INDEX_MAX_ENTRIES', '500'))
+    )
@@ -0,0 +1,150 @@
+"""In-process metrics: counters, latency histograms and timing spans.
+
+Only numbers and short labels (model, stage, status) are recorded; prompt
+and response text never reaches the metrics. ``snapshot()`` returns JSON
+for the debug panel and batch reports, ``to_prometheus()`` the Prometheus
+text exposition format.
+"""
+import time
+import threading
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+# Upper bounds in seconds, from cached calls and renders up to slow completions
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+# Upper bounds in tokens, for prompt parts such as the job ad
+TOKEN_BUCKETS = (100, 250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 12000, 16000, 32000)
+RECENT_SAMPLES = 1000
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: str = '') -> str:
+    parts = [f'{name}="{value}"' for name, value in key]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Histogram:
+    """Bucketed histogram that also keeps recent samples for percentiles."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def percentile(self, q: float) -> float:
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def summary(self) -> Dict:
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'p50': round(self.percentile(0.50), 6),
+            'p95': round(self.percentile(0.95), 6),
+            'p99': round(self.percentile(0.99), 6),
+        }
+
+
+class MetricsRegistry:
+    """Thread-safe registry of labelled counters and histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+
+    def increment(self, name: str, value: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets=DEFAULT_BUCKETS, **labels):
+        """Add ``value`` to a histogram; ``buckets`` apply when the series is created."""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram(buckets)
+            series[key].observe(value)
+
+    @contextmanager
+    def span(self, stage: str, **labels):
+        """Time a block into ``stage_duration_seconds{stage=...}``.
+
+        Failed blocks are recorded with ``status="error"``.
+        """
+        start = time.perf_counter()
+        status = 'ok'
+        try:
+            yield
+        except BaseException:
+            status = 'error'
+            raise
+        finally:
+            self.observe('stage_duration_seconds', time.perf_counter() - start,
+                         stage=stage, status=status, **labels)
+
+    def snapshot(self) -> Dict:
+        """All metrics as JSON-serialisable data."""
+        with self._lock:
+            counters = {
+                name: [{'labels': dict(key), 'value': value} for key, value in series.items()]
+                for name, series in self._counters.items()
+            }
+            histograms = {
+                name: [{'labels': dict(key), **histogram.summary()} for key, histogram in series.items()]
+                for name, series in self._histograms.items()
+            }
+        return {'counters': counters, 'histograms': histograms}
+
+    def to_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        bucket_labels = _format_labels(key, f'le="{bound}"')
+                        lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                    bucket_labels = _format_labels(key, 'le="+Inf"')
+                    lines.append(f"{name}_bucket{bucket_labels} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+# Process-wide registry
+metrics = MetricsRegistry()
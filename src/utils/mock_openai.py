@@ -0,0 +1,286 @@
+"""Offline stand-in for the OpenAI chat completions API.
+
+Replays canned skills lists, tailored CV JSON (whole, repaired fields or a
+single rewritten section) and cover letters with a configurable latency
+distribution, so benchmarks and local development run without an API key
+or credits. Two ways to use it:
+
+    # In-process, via an httpx mock transport
+    mock = MockOpenAI(latency='lognormal:1.5:0.4')
+    client = SecureOpenAIClient(transport=mock.transport())
+
+    # As a local server; then set OPENAI_BASE_URL=http://127.0.0.1:8099/v1
+    python -m src.utils.mock_openai --port 8099 --latency fixed:0.5
+
+Responses are derived from a hash of the prompt, so different job ads give
+different documents (and don't hit the render cache), while the same
+prompt always gives the same text.
+"""
+import re
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import threading
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+SKILLS_RESPONSE = "Python, SQL, PySpark, Databricks, Azure, Docker, CI/CD, Communication, Teamwork"
+
+# Tailored CV in the field order of TAILORED_CV_SCHEMA
+CV_SECTIONS = [
+    ('Professional Summary',
+     'Data engineer with {years} years of experience building ETL pipelines on Azure and Databricks.'),
+    ('Experience',
+     'Senior Data Engineer, Example Corp ({ref})\n'
+     'Built PySpark pipelines processing 2 TB per day and cut job runtimes by 40%.\n'
+     'Introduced CI/CD for data jobs and mentored three junior engineers.\n\n'
+     'Data Analyst, Sample GmbH\n'
+     'Automated reporting with Python and SQL, saving 10 hours per week.'),
+    ('Skills', 'Python, SQL, PySpark, Databricks, Azure, Docker, Git, Linux'),
+]
+
+
+def cv_response(values: Dict) -> str:
+    return json.dumps({
+        'job_keywords': ['Python', 'SQL', 'PySpark', 'Azure', 'data pipelines'],
+        'gaps_and_risks': ['No production Kubernetes experience listed'],
+        'sections': [{'title': title, 'content': content.format(**values)} for title, content in CV_SECTIONS],
+        'notes_for_user': ['Mention the pipeline migration in the interview'],
+        'qa_checks': ['All facts match the original CV', 'Two pages or less'],
+    })
+
+LETTER_FOCUS = ('technical depth', 'business impact', 'motivation and culture fit')
+
+LETTER_RESPONSE = """Dear Hiring Team,
+
+I am writing to apply for the position advertised (reference {ref}). Over the
+past {years} years I have designed and run data pipelines in Python and
+PySpark on Azure, and I enjoy turning messy sources into reliable datasets.
+
+In my current role I migrated our batch jobs to Databricks, introduced CI/CD
+for data workflows and cut processing time by 40%. I would bring the same
+focus on reliability and clear communication to your team.
+
+Thank you for considering my application. I would welcome the chance to
+discuss how I can contribute.
+
+Kind regards,
+Jane Doe"""
+
+
+class LatencyModel:
+    """Latency distribution parsed from a spec string.
+
+    ``fixed:S``, ``uniform:LOW:HIGH`` or ``lognormal:MEDIAN:SIGMA``, in
+    seconds.
+    """
+
+    def __init__(self, spec: str = 'fixed:0', seed: Optional[int] = None):
+        kind, *params = spec.split(':')
+        self.kind = kind
+        self.params = [float(p) for p in params]
+        self.random = random.Random(seed)
+        expected = {'fixed': 1, 'uniform': 2, 'lognormal': 2}
+        if kind not in expected or len(self.params) != expected[kind]:
+            raise ValueError(f"Invalid latency spec {spec!r}; use fixed:S, uniform:LOW:HIGH or lognormal:MEDIAN:SIGMA")
+
+    def sample(self) -> float:
+        if self.kind == 'fixed':
+            return self.params[0]
+        if self.kind == 'uniform':
+            return self.random.uniform(*self.params)
+        median, sigma = self.params
+        return self.random.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+
+
+class MockOpenAI:
+    """Canned chat completions with simulated latency, streaming and prompt caching.
+
+    ``latency`` is the time to the first token; each output token then
+    takes ``token_latency`` seconds (choices of an ``n`` request are
+    generated in parallel). Streamed responses arrive in ``chunks`` pieces
+    per choice. ``error_rate`` answers that share of requests with a 429 and
+    a short Retry-After, to exercise the retry path.
+    """
+
+    def __init__(
+        self,
+        latency: str = 'fixed:0',
+        token_latency: float = 0.0,
+        chunks: int = 20,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None
+    ):
+        self.latency = LatencyModel(latency, seed)
+        self.token_latency = token_latency
+        self.chunks = max(1, chunks)
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self._seen_prefixes = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _contents_for(messages: List[Dict], n: int) -> List[str]:
+        system = next((m['content'] for m in messages if m['role'] == 'system'), '')
+        prompt = messages[-1]['content']
+
+        def values(i: int) -> Dict:
+            digest = hashlib.sha256(f"{prompt}\n{i}".encode('utf-8')).hexdigest()
+            return {'ref': digest[:8], 'years': 3 + int(digest[8], 16) % 8}
+
+        if 'Tailoring Guide' in system:
+            section = re.search(r'Rewrite only the "([^"]+)" section', prompt)
+            if section:
+                title = section.group(1)
+                content = dict(CV_SECTIONS).get(title, 'Rewritten for the job ad (revision {ref}).')
+                return [
+                    json.dumps({'section': {'title': title, 'content': content.format(**values(i))}})
+                    for i in range(n)
+                ]
+            repair = re.search(r'invalid values for these fields: ([\w, ]+)\.', prompt)
+            if repair:
+                fields = [field.strip() for field in repair.group(1).split(',')]
+                full = json.loads(cv_response(values(0)))
+                return [json.dumps({field: full[field] for field in fields if field in full})] * n
+            return [cv_response(values(i)) for i in range(n)]
+        if 'required skills' in system or 'required skills' in prompt:
+            return [SKILLS_RESPONSE] * n
+        if '"letters"' in prompt and 'write only letter' not in prompt:
+            count = int(next(iter(re.findall(r'exactly (\d+) letters', prompt)), 3))
+            letters = [
+                {'focus': LETTER_FOCUS[j % len(LETTER_FOCUS)], 'content': LETTER_RESPONSE.format(**values(j))}
+                for j in range(count)
+            ]
+            return [json.dumps({'letters': letters})] * n
+        return [LETTER_RESPONSE.format(**values(i)) for i in range(n)]
+
+    def _usage(self, messages: List[Dict], contents: List[str]) -> Dict:
+        prompt_tokens = sum(len(m['content']) for m in messages) // 4
+        completion_tokens = sum(len(content) for content in contents) // 4
+        system = next((m['content'] for m in messages if m['role'] == 'system'), '')
+        # Like the API, a repeated prefix of 1024+ tokens is cached in 128-token steps
+        cached = 0
+        with self._lock:
+            if system in self._seen_prefixes and len(system) // 4 >= 1024:
+                cached = (len(system) // 4) // 128 * 128
+            self._seen_prefixes.add(system)
+        return {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+            'prompt_tokens_details': {'cached_tokens': cached},
+        }
+
+    async def respond(self, body: Dict) -> Tuple[int, Dict, AsyncIterator[bytes]]:
+        """Build (status, headers, body chunks) for a chat completions request."""
+        with self._lock:
+            self.requests += 1
+            rate_limited = self.random.random() < self.error_rate
+
+        if rate_limited:
+            payload = json.dumps({'error': {'message': 'Rate limit reached (mock)', 'type': 'requests'}})
+            return 429, {'content-type': 'application/json', 'retry-after-ms': '100'}, _once(payload.encode())
+
+        messages = body['messages']
+        contents = self._contents_for(messages, int(body.get('n') or 1))
+        usage = self._usage(messages, contents)
+        created = int(time.time())
+        model = body.get('model', 'mock')
+
+        if not body.get('stream'):
+            longest = max(len(content) for content in contents) // 4
+            await asyncio.sleep(self.latency.sample() + longest * self.token_latency)
+            payload = {
+                'id': 'chatcmpl-mock', 'object': 'chat.completion', 'created': created, 'model': model,
+                'choices': [
+                    {'index': i, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}
+                    for i, content in enumerate(contents)
+                ],
+                'usage': usage,
+            }
+            return 200, {'content-type': 'application/json'}, _once(json.dumps(payload).encode())
+
+        include_usage = bool((body.get('stream_options') or {}).get('include_usage'))
+        return 200, {'content-type': 'text/event-stream'}, self._stream(contents, usage, model, created, include_usage)
+
+    async def _stream(self, contents: List[str], usage: Dict, model: str, created: int,
+                      include_usage: bool) -> AsyncIterator[bytes]:
+        await asyncio.sleep(self.latency.sample())
+        base = {'id': 'chatcmpl-mock', 'object': 'chat.completion.chunk', 'created': created, 'model': model}
+        sizes = [max(1, math.ceil(len(content) / self.chunks)) for content in contents]
+        for step in range(self.chunks):
+            choices = [
+                {'index': i, 'delta': {'content': content[step * size:(step + 1) * size]}, 'finish_reason': None}
+                for i, (content, size) in enumerate(zip(contents, sizes))
+                if content[step * size:(step + 1) * size]
+            ]
+            if not choices:
+                break
+            # One chunk per choice, as the API sends them
+            for choice in choices:
+                yield f"data: {json.dumps({**base, 'choices': [choice]})}\n\n".encode()
+            if self.token_latency:
+                await asyncio.sleep(max(sizes) / 4 * self.token_latency)
+        final = {**base, 'choices': [{'index': i, 'delta': {}, 'finish_reason': 'stop'} for i in range(len(contents))]}
+        yield f"data: {json.dumps(final)}\n\n".encode()
+        if include_usage:
+            yield f"data: {json.dumps({**base, 'choices': [], 'usage': usage})}\n\n".encode()
+        yield b"data: [DONE]\n\n"
+
+    def transport(self) -> "httpx.AsyncBaseTransport":
+        """An httpx transport that answers requests in-process."""
+        import httpx
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            if not request.url.path.endswith('/chat/completions'):
+                return httpx.Response(404, json={'error': {'message': 'Not found (mock)'}})
+            status, headers, chunks = await self.respond(json.loads(request.content))
+            return httpx.Response(status, headers=headers, content=chunks)
+
+        return httpx.MockTransport(handler)
+
+
+async def _once(data: bytes) -> AsyncIterator[bytes]:
+    yield data
+
+
+def create_mock_server(mock: MockOpenAI) -> "aiohttp.web.Application":
+    """An aiohttp application serving the mock at /v1/chat/completions."""
+    from aiohttp import web
+
+    async def chat_completions(request: web.Request) -> web.StreamResponse:
+        status, headers, chunks = await mock.respond(await request.json())
+        response = web.StreamResponse(status=status, headers=headers)
+        await response.prepare(request)
+        async for chunk in chunks:
+            await response.write(chunk)
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_post('/v1/chat/completions', chat_completions)
+    return app
+
+
+def main(argv=None):
+    from aiohttp import web
+
+    parser = argparse.ArgumentParser(description="Serve a mock OpenAI chat completions API.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', default='lognormal:1.0:0.4', help="fixed:S, uniform:LOW:HIGH or lognormal:MEDIAN:SIGMA")
+    parser.add_argument('--token-latency', type=float, default=0.01, help="Seconds per generated output token")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests answered with a 429")
+    args = parser.parse_args(argv)
+
+    mock = MockOpenAI(latency=args.latency, token_latency=args.token_latency, error_rate=args.error_rate)
+    print(f"Mock OpenAI API on http://{args.host}:{args.port}/v1 (set OPENAI_BASE_URL to this)")
+    web.run_app(create_mock_server(mock), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
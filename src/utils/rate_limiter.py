@@ -0,0 +1,304 @@
+"""Client-side rate limiting, prioritisation, fairness and retries for API calls.
+
+The scheduler is shared by every event loop in the process (Streamlit runs
+each interaction in a fresh ``asyncio.run``), so it uses a thread lock and
+short sleeps instead of loop-bound primitives. Calls are tagged with a
+priority and, when several users share one deployment, a session, so one
+busy session cannot starve the others.
+"""
+import time
+import random
+import asyncio
+import itertools
+import threading
+import contextvars
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+from src.utils.metrics import metrics
+
+# Lower values are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+RETRYABLE_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+POLL_INTERVAL = 0.02
+
+_request_priority = contextvars.ContextVar('request_priority', default=PRIORITY_INTERACTIVE)
+_request_session = contextvars.ContextVar('request_session', default=None)
+
+
+@contextmanager
+def request_priority(priority: int):
+    """Run the API calls made inside the block (and tasks they spawn) at ``priority``."""
+    token = _request_priority.set(priority)
+    try:
+        yield
+    finally:
+        _request_priority.reset(token)
+
+
+def current_priority() -> int:
+    return _request_priority.get()
+
+
+@contextmanager
+def request_session(session: Optional[str]):
+    """Attribute the API calls made inside the block to ``session`` for fair sharing."""
+    token = _request_session.set(session)
+    try:
+        yield
+    finally:
+        _request_session.reset(token)
+
+
+def current_session() -> Optional[str]:
+    return _request_session.get()
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at ``capacity`` per minute."""
+
+    def __init__(self, capacity: float):
+        self.capacity = capacity
+        self.rate = capacity / 60.0
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until ``amount`` tokens are available (0 when they are now)."""
+        self._refill(now)
+        # Requests larger than the bucket would never fit; let them drain it
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether an API error is transient (rate limit, timeout, connection, 5xx)."""
+    import openai
+
+    if isinstance(error, (openai.APIConnectionError, asyncio.TimeoutError)):
+        # APITimeoutError is a subclass of APIConnectionError
+        return True
+    status_code = getattr(error, 'status_code', None)
+    return status_code in RETRYABLE_STATUS_CODES
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Delay requested by the server via Retry-After(-ms) headers, in seconds."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+
+    value = headers.get('retry-after-ms')
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestScheduler:
+    """Grant API calls in priority order within RPM, TPM and concurrency limits.
+
+    Each call waits until it is the next waiter, a concurrency slot is free
+    and both buckets can cover it. The next waiter is the one with the
+    highest priority; among equal priorities, the one whose session has
+    the fewest calls in flight, then the oldest. ``session_max_concurrency``
+    additionally caps the slots a single session may hold (0 for no cap).
+    Transient failures are retried with full-jitter exponential backoff; a
+    Retry-After header pauses all calls for the requested time, since the
+    limit is shared.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        max_concurrency: int = 4,
+        max_retries: int = 4,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+        session_max_concurrency: int = 0
+    ):
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.session_max_concurrency = session_max_concurrency
+
+        self._lock = threading.Lock()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._session_in_flight: Dict[Optional[str], int] = {}
+        self._paused_until = 0.0
+        self.stats = {'retries': 0, 'rate_limited': 0, 'wait_seconds': 0.0}
+
+    def _next_waiter(self):
+        """The waiter to serve next: by priority, then least-served session, then age."""
+        best, best_key = None, None
+        for entry in self._waiters:
+            priority, sequence, session = entry
+            in_flight = self._session_in_flight.get(session, 0)
+            if session is not None and 0 < self.session_max_concurrency <= in_flight:
+                continue
+            key = (priority, in_flight, sequence)
+            if best_key is None or key < best_key:
+                best, best_key = entry, key
+        return best
+
+    def _try_grant(self, entry, tokens: float) -> float:
+        """Grant the slot to ``entry`` if possible; otherwise return how long to wait."""
+        now = time.monotonic()
+        if self._in_flight >= self.max_concurrency or self._next_waiter() is not entry:
+            return POLL_INTERVAL
+        wait = self._paused_until - now
+        for bucket, amount in ((self.request_bucket, 1), (self.token_bucket, tokens)):
+            if bucket is not None:
+                wait = max(wait, bucket.wait_time(amount, now))
+        if wait > 0:
+            return wait
+
+        self._waiters.remove(entry)
+        for bucket, amount in ((self.request_bucket, 1), (self.token_bucket, tokens)):
+            if bucket is not None:
+                bucket.consume(amount)
+        self._in_flight += 1
+        session = entry[2]
+        self._session_in_flight[session] = self._session_in_flight.get(session, 0) + 1
+        return 0.0
+
+    async def acquire(self, tokens: float = 0, priority: Optional[int] = None):
+        """Wait for a slot for the current session; pair with ``release``."""
+        priority = current_priority() if priority is None else priority
+        entry = [priority, next(self._sequence), current_session()]
+        start = time.monotonic()
+        with self._lock:
+            self._waiters.append(entry)
+        try:
+            while True:
+                with self._lock:
+                    wait = self._try_grant(entry, tokens)
+                if wait == 0:
+                    break
+                await asyncio.sleep(min(wait, 1.0))
+        except BaseException:
+            with self._lock:
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+            raise
+        waited = time.monotonic() - start
+        with self._lock:
+            self.stats['wait_seconds'] += waited
+        metrics.observe('scheduler_wait_seconds', waited, priority=entry[0])
+
+    def release(self, session: Optional[str] = None):
+        """Free a slot acquired by ``session`` (default: the current session)."""
+        session = current_session() if session is None else session
+        with self._lock:
+            self._in_flight -= 1
+            remaining = self._session_in_flight.get(session, 0) - 1
+            if remaining > 0:
+                self._session_in_flight[session] = remaining
+            else:
+                self._session_in_flight.pop(session, None)
+
+    @asynccontextmanager
+    async def slot(self, tokens: float = 0, priority: Optional[int] = None):
+        """Hold a slot for the duration of the block (e.g. a whole stream)."""
+        await self.acquire(tokens, priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def pause(self, seconds: float):
+        """Hold back every call for ``seconds``, e.g. after a 429 with Retry-After."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def call_with_retries(
+        self,
+        make_call: Callable[[], Awaitable[Any]],
+        tokens: float = 0,
+        priority: Optional[int] = None,
+        hold: bool = False
+    ) -> Any:
+        """Run ``make_call`` under the limits, retrying transient errors.
+
+        The slot is released when the call returns unless ``hold`` is set,
+        in which case the caller must ``release`` it (used for streams, whose
+        connection stays open after the call returns).
+        """
+        attempt = 0
+        while True:
+            await self.acquire(tokens, priority)
+            try:
+                result = await make_call()
+            except asyncio.CancelledError:
+                # The caller gave up (e.g. a cancelled job); free the slot
+                self.release()
+                raise
+            except Exception as e:
+                self.release()
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+
+                delay = retry_after(e)
+                if getattr(e, 'status_code', None) == 429:
+                    with self._lock:
+                        self.stats['rate_limited'] += 1
+                metrics.increment('scheduler_retries_total', error=type(e).__name__)
+                if delay is not None:
+                    self.pause(delay)
+                else:
+                    delay = self.backoff(attempt)
+                with self._lock:
+                    self.stats['retries'] += 1
+                print(f"Transient API error ({type(e).__name__}); retrying in {delay:.1f}s")
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+
+            if not hold:
+                self.release()
+            return result
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return {
+                'retries': self.stats['retries'],
+                'rate_limited': self.stats['rate_limited'],
+                'wait_seconds': round(self.stats['wait_seconds'], 3),
+                'in_flight': self._in_flight,
+                'queued': len(self._waiters),
+                'sessions': len({entry[2] for entry in self._waiters} | set(self._session_in_flight)),
+            }
@@ -1,101 +1,579 @@
 import os
-from typing import List, Dict, Optional
-from openai import OpenAI
-import httpx
-from httpx import Timeout, Limits
+import json
+import time
+import asyncio
+import weakref
+import threading
+from collections import deque
+from typing import List, Dict, Optional, AsyncIterator, Tuple
+from src.utils.completion_cache import create_completion_cache, make_cache_key
+from src.utils.rate_limiter import RequestScheduler, current_session
+from src.utils.metrics import metrics
+
+PRIVACY_HEADERS = {
+    "HTTP-Referer": "private",
+    "X-Session-Type": "private",
+    "OpenAI-Internal-Request": "false",
+    "X-Data-Use-Consent": "false",
+}
 
 class SecureOpenAIClient:
-    def __init__(self):
+    def __init__(self, transport: Optional["httpx.AsyncBaseTransport"] = None):
         self.api_key = os.getenv('OPENAI_API_KEY')
+        # A different endpoint, e.g. the local mock server in src/utils/mock_openai.py
+        self.base_url = os.getenv('OPENAI_BASE_URL') or None
+        # Custom httpx transport for the async client (benchmarks use the mock's)
+        self.transport = transport
         self.model = os.getenv('GPT_MODEL', 'gpt-4.1-mini')
         self.max_tokens = int(os.getenv('MAX_TOKENS', '2000'))
         self.temperature = float(os.getenv('TEMPERATURE', '0.7'))
         self.top_p = float(os.getenv('TOP_P', '0.9'))
+
+        # Concurrency settings
+        self.async_mode = os.getenv('OPENAI_ASYNC', 'true').lower() == 'true'
+        self.max_concurrency = int(os.getenv('MAX_CONCURRENT_REQUESTS', '4'))
         
-        # Create a custom client with privacy headers
-        self.http_client = self._create_secure_client()
-        
-        # Initialize OpenAI client with custom configuration
-        self.client = OpenAI(
-            api_key=self.api_key,
-            default_headers={
-                "HTTP-Referer": "private",
-                "X-Session-Type": "private",
-                "OpenAI-Internal-Request": "false",
-                "X-Data-Use-Consent": "false",
-            },
-            http_client=self.http_client
+        # Rate limits, priorities and retries for every call made through
+        # this client, across event loops
+        self.scheduler = RequestScheduler(
+            requests_per_minute=int(os.getenv('RATE_LIMIT_RPM', '500')),
+            tokens_per_minute=int(os.getenv('RATE_LIMIT_TPM', '200000')),
+            max_concurrency=self.max_concurrency,
+            max_retries=int(os.getenv('MAX_RETRIES', '4')),
+            base_delay=float(os.getenv('RETRY_BASE_DELAY', '1.0')),
+            max_delay=float(os.getenv('RETRY_MAX_DELAY', '30')),
+            session_max_concurrency=int(os.getenv('SESSION_MAX_CONCURRENT', '0'))
         )
 
-    def _create_secure_client(self) -> httpx.Client:
-        """Create an HTTP client with retry logic and privacy headers"""
+        # Completion cache (None when CACHE_ENABLED=false)
+        self.cache = create_completion_cache()
+
+        # Token accounting, including input tokens served from the prompt cache
+        self._usage_lock = threading.Lock()
+        self.recent_usage = deque(maxlen=100)
+        self.token_usage = {
+            'requests': 0,
+            'prompt_tokens': 0,
+            'cached_tokens': 0,
+            'uncached_tokens': 0,
+            'completion_tokens': 0,
+        }
+
+        # The blocking client is only needed when OPENAI_ASYNC=false, so it is
+        # created on first use; this also defers importing openai and httpx
+        self.http_client = None
+        self._client = None
+
+        # The async client is bound to an event loop, so one is created lazily
+        # per loop: the background job loop keeps its connection pool while
+        # short asyncio.run() calls get their own, closed when that loop
+        # shuts down
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def _create_secure_client(self) -> "httpx.Client":
+        """Create an HTTP client with privacy headers (retries are done by the scheduler)"""
+        import httpx
+        from httpx import Timeout, Limits
+
         timeout = Timeout(30.0, read=30.0)
         limits = Limits(max_keepalive_connections=5, max_connections=10)
-        
+
         # Create client with custom settings
         client = httpx.Client(
             timeout=timeout,
             limits=limits,
-            headers={
-                "HTTP-Referer": "private",
-                "X-Session-Type": "private",
-                "OpenAI-Internal-Request": "false",
-                "X-Data-Use-Consent": "false",
-            }
+            headers=PRIVACY_HEADERS
         )
-        
+
         return client
 
+    def _create_secure_async_client(self) -> "httpx.AsyncClient":
+        """Create an async HTTP client with the same limits and privacy headers"""
+        import httpx
+        from httpx import Timeout, Limits
+
+        timeout = Timeout(30.0, read=30.0)
+        # One pool serves every session, so keep enough connections alive for
+        # all concurrent calls; HTTP_MAX_CONNECTIONS overrides the default
+        max_connections = int(os.getenv('HTTP_MAX_CONNECTIONS', '0')) or max(self.max_concurrency, 10)
+        limits = Limits(
+            max_keepalive_connections=min(self.max_concurrency, max_connections),
+            max_connections=max_connections
+        )
+
+        return httpx.AsyncClient(
+            timeout=timeout,
+            limits=limits,
+            headers=PRIVACY_HEADERS,
+            transport=self.transport
+        )
+
+    @property
+    def client(self) -> "OpenAI":
+        """The blocking OpenAI client, created on first use"""
+        if self._client is None:
+            from openai import OpenAI
+
+            # Create a custom client with privacy headers
+            self.http_client = self._create_secure_client()
+
+            # Initialize OpenAI client with custom configuration
+            self._client = OpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                default_headers=PRIVACY_HEADERS,
+                http_client=self.http_client,
+                max_retries=0  # Retried by the scheduler, which honours priorities
+            )
+        return self._client
+
+    def _get_async_client(self) -> "AsyncOpenAI":
+        """Return the async OpenAI client bound to the running event loop"""
+        from openai import AsyncOpenAI
+
+        loop = asyncio.get_running_loop()
+        entry = self._async_clients.get(loop)
+        if entry is None:
+            # Connections cannot be shared between loops
+            http_client = self._create_secure_async_client()
+            # Parked until the loop shuts down its async generators, as
+            # asyncio.run() does before closing the loop
+            closer = self._close_on_shutdown()
+            loop.create_task(closer.__anext__())
+            entry = (http_client, AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                default_headers=PRIVACY_HEADERS,
+                http_client=http_client,
+                max_retries=0
+            ), closer)
+            self._async_clients[loop] = entry
+        return entry[1]
+
+    async def _close_on_shutdown(self):
+        """Close the running loop's HTTP client when the loop finalizes this generator"""
+        try:
+            yield
+        finally:
+            entry = self._async_clients.pop(asyncio.get_running_loop(), None)
+            if entry is not None:
+                await entry[0].aclose()
+
+    def _record_usage(self, usage) -> Optional[Dict]:
+        """Record cached vs. uncached input tokens from an API usage object"""
+        if usage is None:
+            return None
+
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached_tokens = (getattr(details, 'cached_tokens', None) or 0) if details else 0
+        record = {
+            'prompt_tokens': usage.prompt_tokens,
+            'cached_tokens': cached_tokens,
+            'uncached_tokens': usage.prompt_tokens - cached_tokens,
+            'completion_tokens': usage.completion_tokens,
+        }
+
+        with self._usage_lock:
+            self.recent_usage.append(record)
+            for name, value in record.items():
+                self.token_usage[name] += value
+            self.token_usage['requests'] += 1
+
+        for kind in ('cached', 'uncached', 'completion'):
+            metrics.increment('openai_tokens_total', record[f'{kind}_tokens'], model=self.model, kind=kind)
+        return record
+
+    def _observe_call(self, start: float, status: str, stream: bool):
+        """Record latency and outcome of one API call (never its content)"""
+        labels = dict(model=self.model, stream=str(stream).lower(), status=status)
+        metrics.increment('openai_requests_total', **labels)
+        metrics.observe('openai_request_seconds', time.perf_counter() - start, **labels)
+
+    def usage_summary(self) -> Dict:
+        """Token totals since start-up, with the share of input served from the prompt cache"""
+        with self._usage_lock:
+            summary = dict(self.token_usage)
+        prompt_tokens = summary['prompt_tokens']
+        summary['cached_ratio'] = summary['cached_tokens'] / prompt_tokens if prompt_tokens else 0.0
+        summary['scheduler'] = self.scheduler.summary()
+        return summary
+
+    def _build_request(
+        self,
+        prompt: str,
+        max_tokens: Optional[int],
+        temperature: Optional[float],
+        top_p: Optional[float],
+        system: Optional[str] = None,
+        n: int = 1,
+        response_format: Optional[Dict] = None
+    ) -> Dict:
+        """Build chat completion arguments with privacy-preserving settings
+
+        The stable ``system`` block goes first so that repeated calls share
+        a prompt prefix the API can cache; ``prompt`` carries the per-call part.
+        """
+        messages = []
+        if system:
+            messages.append({"role": "system", "content": system})
+        messages.append({"role": "user", "content": prompt})
+        request = dict(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens or self.max_tokens,
+            temperature=temperature or self.temperature,
+            top_p=top_p or self.top_p,
+            user="anonymous"  # Don't associate requests with a user
+        )
+        if n > 1:
+            request['n'] = n
+        if response_format is not None:
+            request['response_format'] = response_format
+        return request
+
+    @staticmethod
+    def _estimate_tokens(request: Dict) -> int:
+        """Rough token cost of a request, counted against the TPM limit like the API does"""
+        prompt_chars = sum(len(message['content']) for message in request['messages'])
+        return prompt_chars // 4 + request['max_tokens'] * request.get('n', 1)
+
+    def _cache_key(self, request: Dict) -> Optional[str]:
+        """Return the completion cache key for a request, or None without a cache"""
+        if self.cache is None:
+            return None
+        return make_cache_key(
+            model=request['model'],
+            messages=request['messages'],
+            max_tokens=request['max_tokens'],
+            temperature=request['temperature'],
+            top_p=request['top_p'],
+            n=request.get('n', 1),
+            response_format=request.get('response_format')
+        )
+
     async def generate_completion(
         self,
         prompt: str,
         max_tokens: Optional[int] = None,
         temperature: Optional[float] = None,
-        top_p: Optional[float] = None
+        top_p: Optional[float] = None,
+        use_cache: bool = True,
+        system: Optional[str] = None,
+        response_format: Optional[Dict] = None
     ) -> str:
         """
-        Generate a completion with privacy-preserving settings
+        Generate a completion with privacy-preserving settings.
+
+        Identical requests are served from the completion cache. Pass
+        ``use_cache=False`` to force a new variant; the fresh result still
+        replaces the cached one.
         """
+        request = self._build_request(
+            prompt, max_tokens, temperature, top_p, system, response_format=response_format
+        )
+
+        cache_key = self._cache_key(request)
+        if cache_key is not None and use_cache:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                metrics.increment('openai_cache_hits_total', model=self.model, stream='false')
+                return cached
+
+        start = time.perf_counter()
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=max_tokens or self.max_tokens,
-                temperature=temperature or self.temperature,
-                top_p=top_p or self.top_p,
-                user="anonymous"  # Don't associate requests with a user
+            if self.async_mode:
+                async_client = self._get_async_client()
+                make_call = lambda: async_client.chat.completions.create(**request)
+            else:
+                # Keep the blocking client off the event loop
+                make_call = lambda: asyncio.to_thread(
+                    self.client.chat.completions.create, **request
+                )
+            response = await self.scheduler.call_with_retries(
+                make_call, self._estimate_tokens(request)
             )
-            
-            return response.choices[0].message.content
+
+            self._observe_call(start, 'ok', stream=False)
+            self._record_usage(response.usage)
+            content = response.choices[0].message.content
+            if cache_key is not None and content is not None:
+                self.cache.set(cache_key, content)
+            return content
 
         except Exception as e:
+            self._observe_call(start, type(e).__name__, stream=False)
             print(f"Error in generate_completion: {str(e)}")
             raise
 
+    async def stream_completion(
+        self,
+        prompt: str,
+        max_tokens: Optional[int] = None,
+        temperature: Optional[float] = None,
+        top_p: Optional[float] = None,
+        use_cache: bool = True,
+        system: Optional[str] = None,
+        response_format: Optional[Dict] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream a completion as text deltas with privacy-preserving settings.
+
+        Streaming always uses the async client. A cached completion is
+        yielded as a single delta; a fully streamed completion is cached.
+        """
+        request = self._build_request(
+            prompt, max_tokens, temperature, top_p, system, response_format=response_format
+        )
+
+        cache_key = self._cache_key(request)
+        if cache_key is not None and use_cache:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                metrics.increment('openai_cache_hits_total', model=self.model, stream='true')
+                yield cached
+                return
+
+        parts = []
+        start = time.perf_counter()
+        status = 'ok'
+        try:
+            async_client = self._get_async_client()
+            # Only opening the stream is retried; the slot is held until the
+            # stream is closed
+            # Released in the finally below, which may run in another context
+            session = current_session()
+            stream = await self.scheduler.call_with_retries(
+                lambda: async_client.chat.completions.create(
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **request
+                ),
+                self._estimate_tokens(request),
+                hold=True
+            )
+            try:
+                async for chunk in stream:
+                    if chunk.usage is not None:
+                        self._record_usage(chunk.usage)
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        if not parts:
+                            metrics.observe('openai_first_token_seconds', time.perf_counter() - start,
+                                            model=self.model)
+                        parts.append(delta)
+                        yield delta
+            finally:
+                # Release the connection if the consumer stops early
+                try:
+                    await stream.response.aclose()
+                finally:
+                    self.scheduler.release(session)
+
+        except Exception as e:
+            status = type(e).__name__
+            print(f"Error in stream_completion: {str(e)}")
+            raise
+        finally:
+            self._observe_call(start, status, stream=True)
+
+        if cache_key is not None and parts:
+            self.cache.set(cache_key, "".join(parts))
+
+    async def generate_choices(
+        self,
+        prompt: str,
+        n: int,
+        max_tokens: Optional[int] = None,
+        temperature: Optional[float] = None,
+        top_p: Optional[float] = None,
+        use_cache: bool = True,
+        system: Optional[str] = None
+    ) -> List[str]:
+        """
+        Generate ``n`` completions of one prompt in a single request.
+
+        The prompt is sent (and billed) once; only the output is paid ``n``
+        times. ``max_tokens`` applies to each choice.
+        """
+        request = self._build_request(prompt, max_tokens, temperature, top_p, system, n=n)
+
+        cache_key = self._cache_key(request)
+        if cache_key is not None and use_cache:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                metrics.increment('openai_cache_hits_total', model=self.model, stream='false')
+                return json.loads(cached)
+
+        start = time.perf_counter()
+        try:
+            async_client = self._get_async_client()
+            response = await self.scheduler.call_with_retries(
+                lambda: async_client.chat.completions.create(**request),
+                self._estimate_tokens(request)
+            )
+            self._observe_call(start, 'ok', stream=False)
+            self._record_usage(response.usage)
+
+            choices = sorted(response.choices, key=lambda choice: choice.index)
+            contents = [choice.message.content or "" for choice in choices]
+            if cache_key is not None:
+                self.cache.set(cache_key, json.dumps(contents))
+            return contents
+
+        except Exception as e:
+            self._observe_call(start, type(e).__name__, stream=False)
+            print(f"Error in generate_choices: {str(e)}")
+            raise
+
+    async def stream_choices(
+        self,
+        prompt: str,
+        n: int,
+        max_tokens: Optional[int] = None,
+        temperature: Optional[float] = None,
+        top_p: Optional[float] = None,
+        use_cache: bool = True,
+        system: Optional[str] = None
+    ) -> AsyncIterator[Tuple[int, str]]:
+        """
+        Stream ``n`` completions of one prompt from a single request.
+
+        Yields ``(choice index, delta)`` pairs as text arrives for any choice.
+        """
+        request = self._build_request(prompt, max_tokens, temperature, top_p, system, n=n)
+
+        cache_key = self._cache_key(request)
+        if cache_key is not None and use_cache:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                metrics.increment('openai_cache_hits_total', model=self.model, stream='true')
+                for index, content in enumerate(json.loads(cached)):
+                    yield index, content
+                return
+
+        parts = [[] for _ in range(n)]
+        start = time.perf_counter()
+        status = 'ok'
+        try:
+            async_client = self._get_async_client()
+            # Released in the finally below, which may run in another context
+            session = current_session()
+            stream = await self.scheduler.call_with_retries(
+                lambda: async_client.chat.completions.create(
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **request
+                ),
+                self._estimate_tokens(request),
+                hold=True
+            )
+            try:
+                async for chunk in stream:
+                    if chunk.usage is not None:
+                        self._record_usage(chunk.usage)
+                    for choice in chunk.choices:
+                        delta = choice.delta.content
+                        if delta:
+                            parts[choice.index].append(delta)
+                            yield choice.index, delta
+            finally:
+                try:
+                    await stream.response.aclose()
+                finally:
+                    self.scheduler.release(session)
+
+        except Exception as e:
+            status = type(e).__name__
+            print(f"Error in stream_choices: {str(e)}")
+            raise
+        finally:
+            self._observe_call(start, status, stream=True)
+
+        if cache_key is not None and all(parts):
+            self.cache.set(cache_key, json.dumps(["".join(p) for p in parts]))
+
     async def generate_multiple_completions(
         self,
         prompts: List[str],
         max_tokens: Optional[int] = None,
         temperature: Optional[float] = None,
-        top_p: Optional[float] = None
-    ) -> List[str]:
+        top_p: Optional[float] = None,
+        first_k: Optional[int] = None,
+        timeout: Optional[float] = None,
+        use_cache: bool = True,
+        system: Optional[str] = None
+    ) -> List[Optional[str]]:
         """
-        Generate multiple completions with privacy-preserving settings
+        Generate multiple completions concurrently with privacy-preserving settings.
+
+        Results keep the order of ``prompts``. Concurrency is bounded by the
+        client's scheduler. With ``timeout``, a prompt that takes longer than
+        ``timeout`` seconds yields ``None`` instead of holding up the batch.
+        With ``first_k``, the call returns as soon as ``first_k`` prompts have
+        completed; the remaining requests are cancelled and failed prompts are
+        skipped, both yielding ``None``. A shared ``system`` block lets all
+        prompts hit the same cached prompt prefix.
         """
-        results = []
-        for prompt in prompts:
-            result = await self.generate_completion(
-                prompt,
-                max_tokens,
-                temperature,
-                top_p
+        async def run(prompt: str) -> Optional[str]:
+            coro = self.generate_completion(
+                prompt, max_tokens, temperature, top_p, use_cache=use_cache, system=system
             )
-            results.append(result)
+            if timeout is None:
+                return await coro
+            try:
+                return await asyncio.wait_for(coro, timeout)
+            except asyncio.TimeoutError:
+                print(f"Completion timed out after {timeout}s")
+                return None
+
+        tasks = [asyncio.ensure_future(run(prompt)) for prompt in prompts]
+
+        if first_k is None or first_k >= len(tasks):
+            try:
+                return list(await asyncio.gather(*tasks))
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                raise
+
+        results: List[Optional[str]] = [None] * len(tasks)
+        index = {task: i for i, task in enumerate(tasks)}
+        pending = set(tasks)
+        completed = 0
+        try:
+            while pending and completed < first_k:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is not None:
+                        # Other variants can still make up the first K
+                        print(f"Error in generate_multiple_completions: {task.exception()}")
+                        continue
+                    result = task.result()
+                    if result is not None:
+                        results[index[task]] = result
+                        completed += 1
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
         return results
 
+    async def aclose(self):
+        """
+        Close the async HTTP client if it was created on this event loop
+        """
+        entry = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            await entry[0].aclose()
+
     def cleanup(self):
         """
         Clean up resources and ensure client closure
         """
         if self.http_client:
-            self.http_client.close()
\ No newline at end of file
+            self.http_client.close()
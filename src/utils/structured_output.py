@@ -0,0 +1,167 @@
+"""Helpers for structured (JSON) model output.
+
+``JsonFieldStream`` parses a streamed JSON object incrementally and reports
+each top-level field, and each element of a top-level array, as soon as it
+is complete, so callers can act on early fields while the rest is still
+being generated. ``validate`` checks data against the subset of JSON
+Schema used for ``response_format`` schemas.
+"""
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+# (kind, field, value): kind is 'item' for an element of a top-level array,
+# 'field' for a complete top-level field
+FieldEvent = Tuple[str, str, Any]
+
+
+class JsonFieldStream:
+    """Incremental parser for a streamed top-level JSON object.
+
+    Feed text as it arrives; ``feed`` returns the events completed by that
+    text. Anything before the opening brace (e.g. a code fence) is skipped.
+    Values nested deeper than top-level arrays are only parsed as part of
+    their field.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.fields: Dict[str, Any] = {}
+        self.done = False
+        self._pos = 0
+        self._stack: List[Dict] = []
+        self._in_string = False
+        self._escape = False
+        self._scalar = False
+
+    def feed(self, text: str) -> List[FieldEvent]:
+        self.buffer += text
+        events: List[FieldEvent] = []
+        buffer = self.buffer
+
+        while self._pos < len(buffer) and not self.done:
+            i = self._pos
+            c = buffer[i]
+            self._pos += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._end_value(i + 1, events)
+                continue
+
+            if self._scalar and (c in ',}]' or c.isspace()):
+                self._end_value(i, events)
+            if c.isspace():
+                continue
+
+            if not self._stack:
+                if c == '{':
+                    self._stack.append(self._frame('{'))
+                continue
+
+            top = self._stack[-1]
+            if c == '"':
+                self._in_string = True
+                self._begin_value(i)
+            elif c in '{[':
+                self._begin_value(i)
+                self._stack.append(self._frame(c))
+            elif c in '}]':
+                self._stack.pop()
+                if not self._stack:
+                    self.done = True
+                else:
+                    self._end_value(i + 1, events)
+            elif c == ':':
+                top['expect_key'] = False
+            elif c == ',':
+                top['expect_key'] = top['type'] == '{'
+            elif not self._scalar:
+                # Start of a number, true, false or null
+                self._scalar = True
+                self._begin_value(i)
+
+        return events
+
+    @staticmethod
+    def _frame(kind: str) -> Dict:
+        return {'type': kind, 'expect_key': kind == '{', 'key': None, 'start': None, 'index': -1}
+
+    def _begin_value(self, i: int):
+        top = self._stack[-1]
+        top['start'] = i
+        if top['type'] == '[':
+            top['index'] += 1
+
+    def _end_value(self, end: int, events: List[FieldEvent]):
+        self._scalar = False
+        top = self._stack[-1]
+        start, top['start'] = top['start'], None
+        if start is None:
+            return
+
+        depth = len(self._stack)
+        if top['type'] == '{' and top['expect_key']:
+            if depth == 1:
+                top['key'] = json.loads(self.buffer[start:end])
+            return
+
+        if depth == 1:
+            value = json.loads(self.buffer[start:end])
+            self.fields[top['key']] = value
+            events.append(('field', top['key'], value))
+        elif depth == 2 and top['type'] == '[':
+            events.append(('item', self._stack[0]['key'], json.loads(self.buffer[start:end])))
+
+
+def validate(schema: Dict, data: Any, path: str = '$') -> List[str]:
+    """Check ``data`` against a JSON Schema (object/array/string/number/boolean subset).
+
+    Returns a list of error messages, empty when the data is valid.
+    """
+    expected = schema.get('type')
+    type_checks = {
+        'object': lambda v: isinstance(v, dict),
+        'array': lambda v: isinstance(v, list),
+        'string': lambda v: isinstance(v, str),
+        'number': lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+        'integer': lambda v: isinstance(v, int) and not isinstance(v, bool),
+        'boolean': lambda v: isinstance(v, bool),
+    }
+    if expected in type_checks and not type_checks[expected](data):
+        return [f"{path}: expected {expected}, got {type(data).__name__}"]
+
+    errors = []
+    if expected == 'object':
+        for key in schema.get('required', []):
+            if key not in data:
+                errors.append(f"{path}.{key}: missing")
+        for key, sub_schema in schema.get('properties', {}).items():
+            if key in data:
+                errors.extend(validate(sub_schema, data[key], f"{path}.{key}"))
+    elif expected == 'array' and 'items' in schema:
+        for i, item in enumerate(data):
+            errors.extend(validate(schema['items'], item, f"{path}[{i}]"))
+    return errors
+
+
+def invalid_fields(schema: Dict, data: Optional[Dict]) -> List[str]:
+    """Top-level properties of an object schema that are missing or invalid in ``data``."""
+    data = data or {}
+    return [
+        key for key, sub_schema in schema.get('properties', {}).items()
+        if key not in data or validate(sub_schema, data[key])
+    ]
+
+
+def sub_schema(schema: Dict, fields: List[str]) -> Dict:
+    """An object schema restricted to ``fields``, for asking only for those."""
+    return {
+        **schema,
+        'properties': {key: schema['properties'][key] for key in fields},
+        'required': [key for key in schema.get('required', []) if key in fields],
+    }
@@ -0,0 +1,59 @@
+"""Compaction keeps real requirements and drops only boilerplate."""
+import pytest
+
+from src.utils.job_ad import compact_job_ad
+
+DPO_AD = """Data Protection Officer
+
+Responsibilities:
+- Maintain the company's privacy policy and data protection notices
+- Advise teams on GDPR and handle reasonable accommodations requests
+- Administer 401(k) enrollment and pension plan questions
+- Process your personal data responsibly when building GDPR-compliant pipelines
+- Review vendor contracts; we do not accept vendors without a data processing agreement
+"""
+
+BOILERPLATE = """Apply now
+
+We are an equal opportunity employer. All qualified applicants will receive consideration.
+Reasonable accommodations are available for candidates with disabilities.
+If you need a reasonable accommodation during the application process, contact us.
+Please read our applicant privacy notice before applying.
+We process your personal data in accordance with the GDPR.
+We do not accept unsolicited CVs from recruitment agencies.
+
+Benefits:
+- Gym membership and free snacks
+- 401(k) with company match
+- Dental insurance
+"""
+
+REQUIREMENTS = [line[2:] for line in DPO_AD.splitlines() if line.startswith('- ')]
+
+
+@pytest.mark.parametrize('requirement', REQUIREMENTS)
+def test_requirements_survive(requirement):
+    assert requirement in compact_job_ad(DPO_AD, 0)['text']
+
+
+@pytest.mark.parametrize('requirement', REQUIREMENTS)
+def test_requirements_survive_next_to_boilerplate(requirement):
+    assert requirement in compact_job_ad(DPO_AD + '\n' + BOILERPLATE, 0)['text']
+
+
+def test_boilerplate_is_removed():
+    result = compact_job_ad(DPO_AD + '\n' + BOILERPLATE, 0)
+    assert result['text'] == DPO_AD.strip() + '\n\nBenefits:'
+    assert result['removed_lines'] == 10
+
+
+def test_perks_after_standalone_benefits_heading():
+    ad = "Engineer\n\n- Python and SQL\n\nWhat we offer\n\n- Pension scheme\n- Private health insurance\n"
+    assert compact_job_ad(ad, 0)['text'] == "Engineer\n\n- Python and SQL\n\nWhat we offer"
+
+
+def test_repeated_paragraph_of_short_lines():
+    ad = "Data Engineer\n\nRequirements\n- Python\n- SQL\n\nAbout us\n\nRequirements\n- Python\n- SQL\n"
+    result = compact_job_ad(ad, 0)
+    assert result['text'] == "Data Engineer\n\nRequirements\n- Python\n- SQL\n\nAbout us"
+    assert result['duplicate_lines'] == 3